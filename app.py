@@ -1,9 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from text_to_sql import TextToSQLConverter
-from schema_kb import SchemaKnowledgeBase
+from schema_kb import (
+    DEFAULT_EMBEDDING_MODEL, SchemaKnowledgeBase, context_block, prune_context, schema_context, select_relevant
+)
+from reembed_job import ReembedJob
+from kb_namespaces import DEFAULT_NAMESPACE, KnowledgeBaseRegistry, validate_namespace
+from catalog_sync import CatalogSync, with_join_neighbours
 from db_assistant import DatabaseAssistant
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from response_cache import ResponseCache
+from model_router import ModelRouter
+from sql_sandbox import SQLiteSandbox, dry_run_options
+from query_log import QueryLog
+from sql_analysis import referenced_tables
+from sql_dialects import CANONICAL_DIALECT, normalize_dialect, transpile
+from traffic_capture import TrafficCapture
+from request_profiler import RequestProfiler
+from usage_ledger import BudgetExceeded, UsageLedger, caller_id
+from genai_client import shared_client
+from warmup import WarmUp
+import metrics
+import tracing
+import index_advisor
+import query_explainer
+import schema_parser
+import atexit
+import hmac
+import json
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,94 +39,825 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Record every request (endpoint, payload, status, timing) for replaying
+# with traffic_replay.py; off unless CAPTURE_PATH is set
+capture_path = os.getenv("CAPTURE_PATH")
+if capture_path:
+    TrafficCapture(capture_path, float(os.getenv("CAPTURE_SAMPLE_RATE", "1.0"))).init_app(app)
+
 # Initialize the converter and knowledge base
 # Expecting GOOGLE_API_KEY or GEMINI_API_KEY in environment variables
 api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
 converter = None
-knowledge_base = None
+kb_registry = None
 db_assistant = None
+
+# Shared by all model clients: trips when Gemini is failing or slow, so
+# endpoints answer from the response cache or local engines instead.
+model_breaker = CircuitBreaker()
+response_cache = ResponseCache()
+sql_sandbox = SQLiteSandbox()
+
+# Generated SQL per schema; the workload behind index recommendations
+query_log = QueryLog(os.getenv("QUERY_LOG_PATH", "query_log.jsonl"))
+
+# Schemas with at least this many tables are pruned to the tables a
+# question needs (plus the bridge tables joining them)
+prune_min_tables = int(os.getenv("SCHEMA_PRUNE_MIN_TABLES", "25"))
+
+# Adaptive RAG context: up to RAG_TOP_K schemas, dropping those scoring
+# below RAG_MIN_SCORE or more than RAG_MAX_GAP below the best match
+rag_top_k = int(os.getenv("RAG_TOP_K", "3"))
+rag_min_score = float(os.getenv("RAG_MIN_SCORE", "0.0"))
+rag_max_gap = float(os.getenv("RAG_MAX_GAP", "0.1"))
+# "hybrid" answers clear table/column-name matches from the BM25 index
+# without an embedding call; "lexical" and "vector" use one signal only
+rag_mode = os.getenv("RAG_MODE", "hybrid")
+# Storage of schema embeddings: float32, float16, int8 or binary, the
+# embedding model, and an optional reduced dimensionality requested from it
+embedding_options = {
+    "embedding_format": os.getenv("EMBEDDING_FORMAT", "float32"),
+    "embedding_dimensions": int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None,
+    "embedding_model": os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL),
+}
+# How often a knowledge base checks whether another worker process changed
+# its storage file, and reloads it if so (0 = never)
+kb_reload_seconds = float(os.getenv("KB_RELOAD_SECONDS", "2"))
+# Background re-embedding job per namespace
+reembed_jobs = {}
+# Live database whose tables are kept in the knowledge base: a SQLite path
+# or SQLAlchemy URL, re-read every CATALOG_SYNC_SECONDS (0 = only on
+# startup and POST /catalog/sync)
+catalog_url = os.getenv("CATALOG_URL")
+catalog_sync = None
+
+# /convert/batch: questions per request, and SQL generations in flight
+batch_max_questions = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Per-stage durations of each request in a Server-Timing response header
+timing_headers = os.getenv("TIMING_HEADERS", "false").lower() == "true"
+request_seconds = metrics.REGISTRY.histogram(
+    "http_request_duration_seconds", "Request latency per endpoint.", ("method", "endpoint")
+)
+requests_total = metrics.REGISTRY.counter(
+    "http_requests_total", "Requests per endpoint and status.", ("method", "endpoint", "status")
+)
+
+# Traces of a TRACE_SAMPLE_RATE share of requests, and of every request
+# sent with `X-Trace: 1`; the latest TRACE_BUFFER_SIZE are kept
+trace_sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+trace_buffer = tracing.TraceBuffer(int(os.getenv("TRACE_BUFFER_SIZE", "200")))
+# cProfile runs started through /debug/profile, dumped to PROFILE_DIR
+request_profiler = RequestProfiler(os.getenv("PROFILE_DIR", "profiles"))
+# Required in X-Admin-Token by the /debug endpoints when set
+admin_token = os.getenv("ADMIN_TOKEN")
+# Requests, tokens and latency per API key and endpoint, with the daily
+# budgets of USAGE_BUDGETS enforced on the endpoints that call the model
+usage_ledger = UsageLedger.from_env()
+atexit.register(usage_ledger.save)
+
+# Sends simple questions to a lite model and hard ones to a larger one
+model_router = ModelRouter(cascade=os.getenv("MODEL_CASCADE", "true").lower() != "false")
+assistant_model = os.getenv("ASSISTANT_MODEL", "gemini-2.0-flash-exp")
+
+
+def resume_reembedding(namespace, knowledge_base):
+    """Resume moving a newly loaded knowledge base to the configured embedding model."""
+    if knowledge_base.reembed_target:
+        reembed_jobs[namespace] = ReembedJob(knowledge_base, **knowledge_base.reembed_target).start()
+
+
+def create_kb_registry(key):
+    """Knowledge bases per namespace: schema_kb.json for the default, KB_NAMESPACE_DIR for the rest."""
+    return KnowledgeBaseRegistry(
+        lambda path: SchemaKnowledgeBase(
+            api_key=key, breaker=model_breaker, storage_path=path, reload_seconds=kb_reload_seconds,
+            **embedding_options
+        ),
+        directory=os.getenv("KB_NAMESPACE_DIR", "kb_namespaces"),
+        on_load=resume_reembedding,
+    )
+
+
+def seed_knowledge_base():
+    """Add the sample schemas to an empty default knowledge base."""
+    from seed_data import initialize_knowledge_base
+    default_kb = kb_registry.get(DEFAULT_NAMESPACE)
+    if len(default_kb.schemas) == 0:
+        initialize_knowledge_base(default_kb)
+
+
+def start_catalog_sync():
+    """
+    Sync the catalog once, so the worker is only ready with its tables
+    loaded and a failed sync fails warm-up, then keep syncing in the background.
+    """
+    global catalog_sync
+    catalog_sync = CatalogSync(
+        kb_registry.get(os.getenv("CATALOG_NAMESPACE", DEFAULT_NAMESPACE)),
+        catalog_url,
+        database=os.getenv("CATALOG_NAME"),
+        interval_seconds=float(os.getenv("CATALOG_SYNC_SECONDS", "0")) or None,
+    )
+    try:
+        catalog_sync.run_once()
+    finally:
+        # Periodic syncs start even after a failure, to pick the catalog up once it is reachable
+        if catalog_sync.interval_seconds:
+            catalog_sync.start(sync_first=False)
+
+
+# Loading the knowledge base, seeding it and creating the model client run
+# in the background, so the worker accepts requests (and /healthz answers)
+# right away; /readyz reports when they are done
+warm_up = WarmUp()
 if api_key:
-    converter = TextToSQLConverter(api_key=api_key)
-    knowledge_base = SchemaKnowledgeBase(api_key=api_key)
-    db_assistant = DatabaseAssistant(api_key=api_key)
+    converter = TextToSQLConverter(api_key=api_key, breaker=model_breaker, router=model_router)
+    kb_registry = create_kb_registry(api_key)
+    db_assistant = DatabaseAssistant(api_key=api_key, breaker=model_breaker, model_name=assistant_model)
+    warm_up.add("load_knowledge_base", lambda: kb_registry.get(DEFAULT_NAMESPACE))
+    if catalog_url:
+        warm_up.add("catalog_sync", start_catalog_sync)
+    else:
+        warm_up.add("seed_knowledge_base", seed_knowledge_base, required=False)
+    warm_up.add("model_client", shared_client(api_key).get, required=False)
+warm_up.start()
+started_at = time.time()
+
+
+def request_endpoint():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def request_caller():
+    """The usage ledger's id for the API key in `X-API-Key` or the JSON body's `api_key`."""
+    key = request.headers.get('X-API-Key')
+    if not key and request.is_json:
+        body = request.get_json(silent=True)
+        key = body.get('api_key') if isinstance(body, dict) else None
+    return caller_id(key)
+
+
+# /db/ endpoints answered locally unless the request asks for `narrate`
+NARRATED_ENDPOINTS = ('/db/explain-query', '/db/recommend-indexes')
+
+
+def spends_tokens(endpoint):
+    """Whether the request calls the model, and so is checked against the caller's budget."""
+    if endpoint in NARRATED_ENDPOINTS:
+        body = request.get_json(silent=True) if request.is_json else None
+        return isinstance(body, dict) and bool(body.get('narrate'))
+    return endpoint.startswith(('/convert', '/db/'))
+
+
+@app.before_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    g.request_stats = metrics.begin_request()
+    endpoint = request_endpoint()
+    if endpoint.startswith(('/debug/', '/metrics', '/healthz', '/readyz')):
+        return
+    caller = request_caller()
+    if spends_tokens(endpoint):
+        try:
+            g.budget_state = usage_ledger.check(caller, endpoint)['state']
+        except BudgetExceeded as e:
+            # Counted by the ledger as throttled or rejected, not as a request
+            response = jsonify({"error": str(e), "budget": e.state})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(max(1, int(e.retry_after)))
+            return response
+    g.caller = caller
+    if request.headers.get('X-Trace') == '1' or (trace_sample_rate and random.random() < trace_sample_rate):
+        tracing.begin(f"{request.method} {endpoint}", method=request.method, endpoint=endpoint, path=request.path)
+    g.profile = request_profiler.start(endpoint)
+
+
+@app.after_request
+def record_request_timing(response):
+    started = g.pop('request_started', None)
+    stats = metrics.end_request()
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request_endpoint()
+    request_seconds.observe(elapsed, method=request.method, endpoint=endpoint)
+    requests_total.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    if timing_headers:
+        response.headers['Server-Timing'] = metrics.server_timing(stats.timings if stats else {}, elapsed)
+    caller = g.get('caller')
+    if caller is not None:
+        usage_ledger.record(caller, endpoint, response.status_code, elapsed, stats.take_tokens() if stats else None)
+    if g.get('budget_state') == 'soft':
+        response.headers['X-Usage-Warning'] = "Daily usage budget nearly exhausted; requests are rate limited"
+    trace = tracing.end()
+    if trace is not None:
+        trace.finish(status=response.status_code)
+        trace_buffer.add(trace)
+        response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+
+@app.teardown_request
+def stop_request_profile(error=None):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        request_profiler.stop(profile)
+    trace = tracing.end()  # left open when the request raised
+    if trace is not None:
+        trace.finish(error=str(error) if error else None)
+        trace_buffer.add(trace)
+
+
+def loaded_knowledge_bases():
+    return kb_registry.loaded() if kb_registry else {}
+
+
+def cache_hit_ratio():
+    lookups = response_cache.hits + response_cache.misses
+    return response_cache.hits / lookups if lookups else None
+
+
+metrics.REGISTRY.gauge(
+    "kb_schemas", "Schemas in each loaded knowledge base.",
+    lambda: {(ns,): len(kb.schemas) for ns, kb in loaded_knowledge_bases().items()}, ("namespace",)
+)
+metrics.REGISTRY.gauge(
+    "kb_vector_index_bytes", "Memory held by each knowledge base's vector index.",
+    lambda: {(ns,): kb.snapshot().vector_index_bytes for ns, kb in loaded_knowledge_bases().items()}, ("namespace",)
+)
+metrics.REGISTRY.gauge(
+    "kb_retrievals_total", "Retrievals per knowledge base and the mode that answered them.",
+    lambda: {
+        (ns, mode): count
+        for ns, kb in loaded_knowledge_bases().items() for mode, count in kb.retrieval_counts.items()
+    },
+    ("namespace", "mode"), kind="counter"
+)
+metrics.REGISTRY.gauge(
+    "response_cache_hits_total", "Response cache lookups that found an entry.",
+    lambda: response_cache.hits, kind="counter"
+)
+metrics.REGISTRY.gauge(
+    "response_cache_misses_total", "Response cache lookups that found nothing.",
+    lambda: response_cache.misses, kind="counter"
+)
+metrics.REGISTRY.gauge("response_cache_hit_ratio", "Share of response cache lookups that hit.", cache_hit_ratio)
+metrics.REGISTRY.gauge("response_cache_entries", "Entries in the response cache.", lambda: len(response_cache))
+metrics.REGISTRY.gauge(
+    "circuit_open", "1 while the model circuit breaker refuses calls.", lambda: int(model_breaker.is_open)
+)
+
+
+def request_namespace(data=None):
+    """
+    The namespace a request addresses: `namespace` in the JSON body or query
+    string, or the X-Namespace header. Raises ValueError if invalid.
+    """
+    return validate_namespace(
+        (data or {}).get('namespace') or request.args.get('namespace') or request.headers.get('X-Namespace')
+    )
+
+
+def degraded_payload(cache_key, fallback=None):
+    """
+    Answer without the model while the circuit breaker is open: from the
+    response cache if possible, otherwise from a local engine.
+    """
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return {**cached, "degraded": True}, 200
+    if fallback is not None:
+        return {**fallback(), "degraded": True}, 200
+    return {
+        "error": "Model temporarily unavailable",
+        "degraded": True,
+        "retry_after": round(model_breaker.retry_after(), 1)
+    }, 503
+
+
+def degraded_response(cache_key, fallback=None):
+    payload, status = degraded_payload(cache_key, fallback)
+    return jsonify(payload), status
+
+
+def model_response(cache_key, call, fallback=None, extra=None):
+    """
+    Run a model-backed call, caching its result for degraded mode. `extra`
+    fields are computed locally and added to the response without caching.
+    """
+    if model_breaker.is_open:
+        payload, status = degraded_payload(cache_key, fallback)
+    else:
+        try:
+            payload, status = call(), 200
+            if "error" not in payload:
+                response_cache.set(cache_key, payload)
+        except CircuitOpenError:
+            payload, status = degraded_payload(cache_key, fallback)
+    if extra:
+        payload = {**payload, **extra}
+    return jsonify(payload), status
+
+
+def run_dry_run(sql_query, schema, options):
+    """Dry-run SQL in the sandbox, if the request asked for it."""
+    if not options:
+        return None
+    if not schema:
+        return {"executed": False, "error": "No schema available for a dry run"}
+    return sql_sandbox.dry_run(sql_query, schema, **options)
+
+
+def query_log_key(namespace, name):
+    """Knowledge-base schemas are logged by name, qualified outside the default namespace."""
+    return name if namespace == DEFAULT_NAMESPACE else f"{namespace}/{name}"
+
+
+def log_generated_sql(sql_query, manual_schema, retrieved_schemas, namespace=DEFAULT_NAMESPACE):
+    """
+    Record valid generated SQL under the schema it ran against: the inline
+    schema's hash, or each knowledge-base schema whose tables it references.
+    """
+    if manual_schema:
+        query_log.record(QueryLog.key_for_schema(manual_schema), sql_query)
+        return
+    try:
+        tables = {t.lower() for t in referenced_tables(sql_query)}
+    except Exception:
+        return
+    for s in retrieved_schemas:
+        names = {n.lower() for n in schema_parser.parse_schema(s['schema'])}
+        if len(retrieved_schemas) == 1 or names & tables:
+            query_log.record(query_log_key(namespace, s['name']), sql_query)
+
+
+def requested_dialects(value):
+    """The dialects a /convert request asked for, as a list of canonical names."""
+    if not value:
+        return []
+    names = value if isinstance(value, list) else [value]
+    return list(dict.fromkeys(normalize_dialect(name) for name in names))
+
+
+def with_dialects(cache_key, result, dialects):
+    """
+    Transpile a /convert result's canonical SQL to the requested dialects.
+    Variants are cached with the result, so each question is generated
+    once and each dialect is transpiled once.
+    """
+    variants = dict(result.get('dialects') or {})
+    missing = [d for d in dialects if d not in variants]
+    for dialect in missing:
+        variants[dialect] = transpile(result['sql_query'], dialect)
+    if missing:
+        stored = {k: v for k, v in result.items() if k != 'degraded'}
+        response_cache.set(cache_key, {**stored, 'dialects': variants})
+    return {
+        **result,
+        'canonical_sql': result['sql_query'],
+        'canonical_dialect': CANONICAL_DIALECT,
+        'sql_query': variants[dialects[0]]['sql'],
+        'dialect': dialects[0],
+        'dialects': {d: variants[d] for d in dialects},
+    }
+
+
+def retrieval_options(data):
+    """Per-request `top_k`, `min_score`, `max_gap` and `retrieval_mode`, falling back to the RAG_* settings."""
+    def number(key, default, cast):
+        try:
+            return cast(data[key]) if data.get(key) is not None else default
+        except (TypeError, ValueError):
+            return default
+
+    mode = data.get('retrieval_mode')
+    return {
+        "top_k": max(1, number('top_k', rag_top_k, int)),
+        "min_score": number('min_score', rag_min_score, float),
+        "max_gap": number('max_gap', rag_max_gap, float),
+        "mode": mode if mode in ("hybrid", "lexical", "vector") else rag_mode,
+    }
+
+
+def convert_response(cache_key, result, dialects, schema, dry_run):
+    """Add dialect variants and the sandbox dry run to a /convert result."""
+    if dialects and result.get('sql_query'):
+        with metrics.stage("transpile"):
+            result = with_dialects(cache_key, result, dialects)
+    if dry_run:
+        # The sandbox is SQLite; run the canonical SQL's SQLite translation
+        sql_query = result.get('canonical_sql', result['sql_query'])
+        with metrics.stage("dry_run"):
+            result = {**result, "dry_run": run_dry_run(transpile(sql_query, 'sqlite')['sql'], schema, dry_run)}
+    return result
+
+
+def convert_options(data):
+    """The /convert parameters, also applied to every question of /convert/batch. Raises ValueError."""
+    return {
+        "schema": data.get('schema'),
+        "with_explanation": data.get('with_explanation', False),
+        "use_rag": data.get('use_rag', True),  # Enable RAG by default
+        "selected_schema": data.get('selected_schema'),  # Specific schema name
+        "cascade": data.get('cascade'),  # Escalate to a larger model if validation fails
+        "repair": data.get('repair', True),  # One repair call if SQL fails validation
+        "dry_run": dry_run_options(data.get('dry_run')),  # Execute in a SQLite sandbox
+        "prune": data.get('prune'),  # Keep only the tables needed; None = large schemas only
+        "retrieval": retrieval_options(data),  # Adaptive top_k: top_k, min_score, max_gap
+        # Generated once in the canonical dialect, transpiled locally
+        "dialects": requested_dialects(data.get('dialect')),
+        "namespace": request_namespace(data),  # The caller's partition of the knowledge base
+    }
+
+
+def convert_cache_key(nl_query, options):
+    return response_cache.make_key(
+        'convert', nl_query, options['schema'], options['use_rag'], options['selected_schema'],
+        options['with_explanation'], options['repair'], options['prune'], options['retrieval'],
+        options['namespace']
+    )
+
+
+def cached_conversion(nl_query, options, cache_key):
+    """
+    A /convert answer that needs no model call: degraded while the breaker
+    is open, or another dialect of a cached generation. Returns
+    (payload, status) or None.
+    """
+    if model_breaker.is_open:
+        payload, status = degraded_payload(cache_key)
+        if status == 200 and options['dialects']:
+            payload = with_dialects(cache_key, payload, options['dialects'])
+        return payload, status
+    if options['dialects']:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            schema = options['schema'] or schema_context(cached['retrieved_schemas'], options['selected_schema'])
+            return convert_response(cache_key, cached, options['dialects'], schema, options['dry_run']), 200
+    return None
+
+
+def rag_context(nl_query, options, knowledge_base, ranked=None):
+    """
+    The knowledge-base schemas for a question: the selected one, or the
+    retrieved ones scoring close to the best match. `ranked` is a result of
+    `retrieve` computed beforehand. Returns the schemas and a retrieval report.
+    """
+    if not (options['use_rag'] and knowledge_base and not options['schema']):
+        return [], None
+    if options['selected_schema']:
+        # Use specific schema by name
+        schema_obj = knowledge_base.get_schema_by_name(options['selected_schema'])
+        return ([schema_obj] if schema_obj else []), None
     
-    # Initialize with sample schemas if knowledge base is empty
-    from seed_data import initialize_knowledge_base
-    if len(knowledge_base.schemas) == 0:
-        initialize_knowledge_base(knowledge_base)
+    # Retrieve relevant schemas using RAG, keeping only those
+    # scoring close to the best match
+    retrieval = options['retrieval']
+    if ranked is None:
+        with metrics.stage("retrieval"):
+            ranked = knowledge_base.retrieve(nl_query, retrieval['top_k'], retrieval['mode'])
+    retrieved_schemas, dropped = select_relevant(
+        ranked['results'], retrieval['min_score'], retrieval['max_gap']
+    )
+    # Catalog tables are one entry each: bring in the ones they join to
+    retrieved_schemas, neighbours = with_join_neighbours(retrieved_schemas, knowledge_base)
+    return retrieved_schemas, {
+        **retrieval,
+        "namespace": options['namespace'],
+        "mode": ranked['mode'],
+        "embedding_skipped": ranked['embedding_skipped'],
+        "kept": [s['name'] for s in retrieved_schemas if s['name'] not in neighbours],
+        "join_neighbours": neighbours,
+        "dropped": [
+            {"name": s['name'], "relevance_score": s['relevance_score'], "reason": s['reason']}
+            for s in dropped
+        ],
+        "tokens_saved": sum(len(context_block(s)) // 4 for s in dropped),
+    }
+
+
+def generate_sql(nl_query, options, cache_key, knowledge_base, context=None):
+    """
+    Generate SQL for a question, caching the result and logging valid SQL.
+    `context` is a precomputed `rag_context` result.
+    """
+    manual_schema = options['schema']
+    retrieved_schemas, retrieval_report = context or rag_context(nl_query, options, knowledge_base)
+
+    # Drop the tables of large schemas that the question does not need
+    with metrics.stage("pruning"):
+        context_schemas, schema, pruning = prune_context(
+            nl_query, retrieved_schemas, manual_schema, options['prune'], knowledge_base, prune_min_tables
+        )
+    if context_schemas:
+        # Combine top schemas into context
+        schema = schema_context(context_schemas, options['selected_schema'])
+
+    result = converter.convert(
+        nl_query, schema, options['with_explanation'], cascade=options['cascade'], repair=options['repair']
+    )
+    result['retrieved_schemas'] = retrieved_schemas
+    if retrieval_report:
+        result['retrieval'] = retrieval_report
+    if pruning:
+        result['schema_pruning'] = pruning
+    if result['sql_query']:
+        response_cache.set(cache_key, result)
+        if result['validation']['valid']:
+            log_generated_sql(result['sql_query'], manual_schema, retrieved_schemas, options['namespace'])
+    return convert_response(cache_key, result, options['dialects'], schema, options['dry_run'])
+
+
+def ensure_converter(data):
+    """Create the converter from a request's `api_key` if none is configured. Returns False if impossible."""
+    global converter, kb_registry
+    if converter:
+        return True
+    # Try to get key from request if not in env
+    req_api_key = data.get('api_key')
+    if not req_api_key:
+        return False
+    converter = TextToSQLConverter(
+        api_key=req_api_key, breaker=model_breaker, router=model_router
+    )
+    kb_registry = create_kb_registry(req_api_key)
+    return True
+
 
 @app.route('/convert', methods=['POST'])
 def convert():
-    global converter, knowledge_base
     data = request.json
-    
-    if not converter:
-        # Try to get key from request if not in env
-        req_api_key = data.get('api_key')
-        if req_api_key:
-            converter = TextToSQLConverter(api_key=req_api_key)
-            knowledge_base = SchemaKnowledgeBase(api_key=req_api_key)
-        else:
-            return jsonify({"error": "API Key not configured"}), 500
+    if not ensure_converter(data):
+        return jsonify({"error": "API Key not configured"}), 500
 
     nl_query = data.get('query')
-    manual_schema = data.get('schema')
-    with_explanation = data.get('with_explanation', False)
-    use_rag = data.get('use_rag', True)  # Enable RAG by default
-    selected_schema = data.get('selected_schema')  # Specific schema name
-
     if not nl_query:
         return jsonify({"error": "Query is required"}), 400
+    try:
+        options = convert_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    knowledge_base = kb_registry.get(options['namespace'], create=False) if kb_registry else None
 
-    # Determine which schema to use
-    schema = manual_schema
-    retrieved_schemas = []
-    
-    if use_rag and knowledge_base and not manual_schema:
-        if selected_schema:
-            # Use specific schema by name
-            schema_obj = knowledge_base.get_schema_by_name(selected_schema)
-            if schema_obj:
-                schema = schema_obj['schema']
-                retrieved_schemas = [schema_obj]
-        else:
-            # Retrieve relevant schemas using RAG
-            retrieved_schemas = knowledge_base.retrieve_relevant_schemas(nl_query, top_k=3)
-            if retrieved_schemas:
-                # Combine top schemas into context
-                schema = "\n\n".join([
-                    f"-- {s['name']}: {s['description']}\n{s['schema']}"
-                    for s in retrieved_schemas
-                ])
-
+    cache_key = convert_cache_key(nl_query, options)
     try:
-        if with_explanation:
-            result = converter.convert_with_explanation(nl_query, schema)
-            result['retrieved_schemas'] = retrieved_schemas
-            return jsonify(result)
-        else:
-            sql = converter.convert_to_sql(nl_query, schema)
-            return jsonify({
-                "sql_query": sql,
-                "retrieved_schemas": retrieved_schemas
-            })
+        answered = cached_conversion(nl_query, options, cache_key)
+        if answered:
+            payload, status = answered
+            return jsonify(payload), status
+        return jsonify(generate_sql(nl_query, options, cache_key, knowledge_base))
+    except CircuitOpenError:
+        return degraded_response(cache_key)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+@app.route('/convert/batch', methods=['POST'])
+def convert_batch():
+    """
+    Convert many questions in one request. Retrieval embeds the questions
+    in batched calls and scores them against the knowledge base in one
+    matrix product; questions sharing the same schema context are
+    generated together, at most `concurrency` at a time. Results come back
+    in order, or as NDJSON lines as they finish with `"stream": true`.
+    """
+    data = request.json or {}
+    if not ensure_converter(data):
+        return jsonify({"error": "API Key not configured"}), 500
+
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q for q in questions):
+        return jsonify({"error": "'questions' must be a non-empty list of strings"}), 400
+    if len(questions) > batch_max_questions:
+        return jsonify({"error": f"At most {batch_max_questions} questions per batch"}), 400
+    try:
+        options = convert_options(data)
+        concurrency = max(1, min(int(data.get('concurrency', batch_concurrency)), batch_concurrency))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    knowledge_base = kb_registry.get(options['namespace'], create=False) if kb_registry else None
+
+    cache_keys = [convert_cache_key(q, options) for q in questions]
+    answers = {}
+    pending = []
+    for i, (question, cache_key) in enumerate(zip(questions, cache_keys)):
+        answered = cached_conversion(question, options, cache_key)
+        if answered:
+            answers[i] = answered
+        else:
+            pending.append(i)
+
+    # Retrieval for every question still to generate, in batched calls
+    contexts = {}
+    try:
+        ranked = [None] * len(pending)
+        if pending and options['use_rag'] and knowledge_base and not options['schema'] and not options['selected_schema']:
+            retrieval = options['retrieval']
+            with metrics.stage("retrieval"):
+                ranked = knowledge_base.retrieve_many(
+                    [questions[i] for i in pending], retrieval['top_k'], retrieval['mode']
+                )
+        for i, result in zip(pending, ranked):
+            contexts[i] = rag_context(questions[i], options, knowledge_base, result)
+    except CircuitOpenError:
+        for i in pending:
+            answers[i] = degraded_payload(cache_keys[i])
+        pending = []
+
+    # Questions retrieving the same schemas get them in the same order, so
+    # their prompts share a prefix; submitting them together lets the model
+    # reuse it
+    groups = {}
+    for i in pending:
+        schemas, report = contexts[i]
+        members = groups.setdefault(frozenset(s['name'] for s in schemas), [])
+        if members:
+            leader = [s['name'] for s in contexts[members[0]][0]]
+            contexts[i] = sorted(schemas, key=lambda s: leader.index(s['name'])), report
+        members.append(i)
+    group_report = [
+        {"schemas": [s['name'] for s in contexts[members[0]][0]], "questions": members}
+        for members in groups.values()
+    ]
+
+    trace = tracing.current()
+    stats = metrics.current_request()
+    caller = g.get('caller')
+
+    def convert_one(i):
+        # The budget was checked once for the request; tokens are charged as
+        # each question finishes, so a batch stops at a hard budget
+        if caller is not None:
+            try:
+                usage_ledger.check_spend(caller, '/convert/batch')
+            except BudgetExceeded as e:
+                return i, ({"error": str(e), "budget": e.state}, 429)
+        try:
+            with tracing.attach(trace), metrics.attach_request(stats), tracing.span("question", index=i):
+                return i, (generate_sql(questions[i], options, cache_keys[i], knowledge_base, contexts[i]), 200)
+        except CircuitOpenError:
+            return i, degraded_payload(cache_keys[i])
+        except Exception as e:
+            return i, ({"error": str(e)}, 500)
+        finally:
+            if caller is not None and stats is not None:
+                usage_ledger.add_tokens(caller, '/convert/batch', stats.take_tokens())
+
+    def line(i, answer):
+        payload, status = answer
+        return {"index": i, "query": questions[i], **payload, "status": status}
+
+    order = [i for members in groups.values() for i in members]
+    summary = {"questions": len(questions), "cached": len(questions) - len(pending), "groups": group_report}
+
+    if data.get('stream'):
+        def stream():
+            for i, answer in sorted(answers.items()):
+                yield json.dumps(line(i, answer), default=str) + "\n"
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for future in as_completed([pool.submit(convert_one, i) for i in order]):
+                    yield json.dumps(line(*future.result()), default=str) + "\n"
+            yield json.dumps({"done": True, **summary}) + "\n"
+        return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        answers.update(pool.map(convert_one, order))
+    return jsonify({"results": [line(i, answers[i]) for i in range(len(questions))], **summary})
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the worker is up and answering."""
+    return jsonify({"status": "ok", "uptime_seconds": round(time.time() - started_at, 1)})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 once warm-up is done, 503 while it runs or if a required step failed."""
+    status = warm_up.status()
+    body = {**status, "model_configured": converter is not None, "circuit": model_breaker.state}
+    return jsonify(body), 200 if status["ready"] else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, stage, token, cache and knowledge-base metrics in the Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def admin_denied():
+    """A 403 response unless the request carries ADMIN_TOKEN (when one is configured)."""
+    if admin_token and not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return jsonify({"error": "Admin token required"}), 403
+    return None
+
+
+@app.route('/debug/traces', methods=['GET'])
+def list_traces():
+    """Summaries of recent traces, newest first; `min_ms` keeps only slower ones."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        limit = int(request.args.get('limit', 50))
+        min_ms = float(request.args.get('min_ms', 0))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"sample_rate": trace_sample_rate, "traces": trace_buffer.recent(limit, min_ms)})
+
+
+@app.route('/debug/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """A trace's spans; `?format=chrome` for the Chrome trace event format."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    trace = trace_buffer.get(trace_id)
+    if trace is None:
+        return jsonify({"error": "Trace not found"}), 404
+    return jsonify(trace.to_chrome() if request.args.get('format') == 'chrome' else trace.to_dict())
+
+
+@app.route('/debug/profile', methods=['POST'])
+def start_profile():
+    """Profile the next `requests` requests or the next `seconds`, optionally of one `endpoint`."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    data = request.json or {}
+    try:
+        return jsonify(request_profiler.arm(data.get('requests'), data.get('seconds'), data.get('endpoint')))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/debug/profile', methods=['GET'])
+def profile_status():
+    denied = admin_denied()
+    if denied:
+        return denied
+    return jsonify(request_profiler.status())
+
+
+@app.route('/debug/profile', methods=['DELETE'])
+def stop_profile():
+    """End the profiling run now, writing what it collected."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    return jsonify(request_profiler.stop_run())
+
+
+@app.route('/usage', methods=['GET'])
+def usage():
+    """The caller's usage per endpoint and day, and its budget; `?key=all` (admin) for every caller."""
+    if request.args.get('key') == 'all':
+        denied = admin_denied()
+        if denied:
+            return denied
+        return jsonify({"callers": usage_ledger.report()})
+    caller = request_caller()
+    return jsonify({"caller": caller, **usage_ledger.report(caller)[caller]})
+
+
+@app.route('/routing/stats', methods=['GET'])
+def routing_stats():
+    """Per-route call counts, latency, token usage and estimated cost."""
+    return jsonify({"routes": model_router.stats()})
+
 # Schema Management Endpoints
+# Every endpoint addresses one namespace (see request_namespace); the
+# default namespace is the original single knowledge base.
+@app.route('/namespaces', methods=['GET'])
+def list_namespaces():
+    """List namespaces and their schema counts."""
+    if not kb_registry:
+        return jsonify({"error": "Knowledge base not initialized"}), 500
+    
+    return jsonify({"namespaces": [
+        {"namespace": ns, "schemas": len(kb_registry.get(ns).schemas)} for ns in kb_registry.namespaces()
+    ]})
+
 @app.route('/schemas', methods=['GET'])
 def list_schemas():
     """List all schemas in the knowledge base."""
-    if not knowledge_base:
+    if not kb_registry:
         return jsonify({"error": "Knowledge base not initialized"}), 500
+    try:
+        namespace = request_namespace()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    schemas = knowledge_base.list_schemas()
-    return jsonify({"schemas": schemas})
+    knowledge_base = kb_registry.get(namespace, create=False)
+    schemas = knowledge_base.list_schemas() if knowledge_base else []
+    return jsonify({"schemas": schemas, "namespace": namespace})
 
 @app.route('/schemas', methods=['POST'])
 def add_schema():
     """Add a new schema to the knowledge base."""
-    if not knowledge_base:
+    if not kb_registry:
         return jsonify({"error": "Knowledge base not initialized"}), 500
     
     data = request.json
@@ -108,21 +867,57 @@ def add_schema():
     
     if not name or not schema:
         return jsonify({"error": "Name and schema are required"}), 400
+    try:
+        namespace = request_namespace(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
-        knowledge_base.add_schema(name, schema, description)
-        return jsonify({"message": "Schema added successfully", "name": name})
+        status = kb_registry.get(namespace).add_schema(name, schema, description)
+        message = "Schema unchanged" if status == "skipped" else f"Schema {status} successfully"
+        return jsonify({"message": message, "name": name, "status": status, "namespace": namespace})
+    except CircuitOpenError as e:
+        return jsonify({"error": str(e), "degraded": True, "retry_after": round(e.retry_after, 1)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/schemas/bulk', methods=['POST'])
+def add_schemas():
+    """Add or update many schemas, re-embedding only the changed ones."""
+    if not kb_registry:
+        return jsonify({"error": "Knowledge base not initialized"}), 500
+    
+    data = request.json or {}
+    schemas = data.get('schemas')
+    if not isinstance(schemas, list) or not all(
+        isinstance(s, dict) and s.get('name') and s.get('schema') for s in schemas
+    ):
+        return jsonify({"error": "'schemas' must be a list of objects with name and schema"}), 400
+    try:
+        namespace = request_namespace(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        return jsonify({**kb_registry.get(namespace).add_schemas(schemas), "namespace": namespace})
+    except CircuitOpenError as e:
+        return jsonify({"error": str(e), "degraded": True, "retry_after": round(e.retry_after, 1)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/schemas/<name>', methods=['DELETE'])
 def delete_schema(name):
     """Delete a schema from the knowledge base."""
-    if not knowledge_base:
+    if not kb_registry:
         return jsonify({"error": "Knowledge base not initialized"}), 500
+    try:
+        namespace = request_namespace()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
-        success = knowledge_base.delete_schema(name)
+        knowledge_base = kb_registry.get(namespace, create=False)
+        success = knowledge_base is not None and knowledge_base.delete_schema(name)
         if success:
             return jsonify({"message": f"Schema '{name}' deleted successfully"})
         else:
@@ -133,15 +928,95 @@ def delete_schema(name):
 @app.route('/schemas/<name>', methods=['GET'])
 def get_schema(name):
     """Get a specific schema by name."""
-    if not knowledge_base:
+    if not kb_registry:
         return jsonify({"error": "Knowledge base not initialized"}), 500
+    try:
+        namespace = request_namespace()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    schema = knowledge_base.get_schema_by_name(name)
+    knowledge_base = kb_registry.get(namespace, create=False)
+    schema = knowledge_base.get_schema_by_name(name) if knowledge_base else None
     if schema:
         return jsonify(schema)
     else:
         return jsonify({"error": f"Schema '{name}' not found"}), 404
 
+@app.route('/kb/reembed', methods=['POST'])
+def start_reembed():
+    """Re-embed the knowledge base with another model in the background."""
+    if not kb_registry:
+        return jsonify({"error": "Knowledge base not initialized"}), 500
+    data = request.json or {}
+    try:
+        namespace = request_namespace(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job = reembed_jobs.get(namespace)
+    if job and job.is_running():
+        return jsonify({"error": "A re-embedding job is already running", **job.status()}), 409
+    
+    knowledge_base = kb_registry.get(namespace)
+    target = knowledge_base.reembed_target or {
+        "model": knowledge_base.embedding_model, "dimensions": knowledge_base.embedding_dimensions
+    }
+    try:
+        model = data.get('model') or target['model']
+        dimensions = int(data['dimensions']) if data.get('dimensions') else target['dimensions']
+        # Saved with the knowledge base, so a restart resumes this switch
+        # rather than moving back to EMBEDDING_MODEL
+        knowledge_base.choose_embedding(model, dimensions)
+        job = reembed_jobs[namespace] = ReembedJob(
+            knowledge_base, model=model, dimensions=dimensions,
+            batch_size=max(1, int(data.get('batch_size', 16))),
+        ).start()
+        return jsonify({**job.status(), "namespace": namespace}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/kb/reembed', methods=['GET'])
+def reembed_status():
+    """Progress of the current or last re-embedding job."""
+    if not kb_registry:
+        return jsonify({"error": "Knowledge base not initialized"}), 500
+    try:
+        namespace = request_namespace()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # A read never creates a namespace
+    knowledge_base = kb_registry.get(namespace, create=False)
+    if knowledge_base is None:
+        return jsonify({"error": f"Namespace '{namespace}' not found"}), 404
+    job = reembed_jobs.get(namespace)
+    status = job.status() if job else {"state": "idle"}
+    return jsonify({
+        **status,
+        "namespace": namespace,
+        "serving_model": knowledge_base.embedding_model,
+        "serving_dimensions": knowledge_base.embedding_dimensions,
+    })
+
+@app.route('/catalog/sync', methods=['POST'])
+def sync_catalog():
+    """Sync the knowledge base with the configured database now."""
+    if not catalog_sync:
+        return jsonify({"error": "No catalog configured (set CATALOG_URL)"}), 404
+    try:
+        # run_once records the outcome, so GET /catalog/sync shows a failed manual sync too
+        return jsonify(catalog_sync.run_once())
+    except CircuitOpenError as e:
+        return jsonify({"error": str(e), "degraded": True, "retry_after": round(e.retry_after, 1)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/catalog/sync', methods=['GET'])
+def catalog_sync_status():
+    """Schedule and outcome of the last catalog sync."""
+    if not catalog_sync:
+        return jsonify({"error": "No catalog configured (set CATALOG_URL)"}), 404
+    return jsonify(catalog_sync.status())
+
 # Database Assistant Endpoints
 @app.route('/db/analyze', methods=['POST'])
 def analyze_schema():
@@ -157,8 +1032,11 @@ def analyze_schema():
         return jsonify({"error": "Schema is required"}), 400
     
     try:
-        analysis = db_assistant.analyze_schema(schema, schema_name)
-        return jsonify(analysis)
+        return model_response(
+            response_cache.make_key('analyze', schema, schema_name),
+            lambda: db_assistant.analyze_schema(schema, schema_name),
+            fallback=lambda: schema_parser.analyze_schema(schema, schema_name)
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -175,8 +1053,11 @@ def describe_table(table_name):
         return jsonify({"error": "Schema is required"}), 400
     
     try:
-        description = db_assistant.describe_table(schema, table_name)
-        return jsonify(description)
+        return model_response(
+            response_cache.make_key('describe_table', schema, table_name),
+            lambda: db_assistant.describe_table(schema, table_name),
+            fallback=lambda: schema_parser.describe_table(schema, table_name)
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -193,8 +1074,11 @@ def explain_relationships():
         return jsonify({"error": "Schema is required"}), 400
     
     try:
-        relationships = db_assistant.explain_relationships(schema)
-        return jsonify(relationships)
+        return model_response(
+            response_cache.make_key('relationships', schema),
+            lambda: db_assistant.explain_relationships(schema),
+            fallback=lambda: schema_parser.explain_relationships(schema)
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -213,8 +1097,10 @@ def suggest_queries():
         return jsonify({"error": "Schema is required"}), 400
     
     try:
-        suggestions = db_assistant.suggest_queries(schema, schema_name, intent)
-        return jsonify(suggestions)
+        return model_response(
+            response_cache.make_key('suggest_queries', schema, schema_name, intent),
+            lambda: db_assistant.suggest_queries(schema, schema_name, intent)
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -232,27 +1118,52 @@ def get_sample_data(table_name):
         return jsonify({"error": "Schema is required"}), 400
     
     try:
-        sample = db_assistant.get_sample_data(schema, table_name, num_rows)
-        return jsonify(sample)
+        return model_response(
+            response_cache.make_key('sample_data', schema, table_name, num_rows),
+            lambda: db_assistant.get_sample_data(schema, table_name, num_rows)
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/db/recommend-indexes', methods=['POST'])
 def recommend_indexes():
-    """Recommend indexes for the schema."""
-    if not db_assistant:
-        return jsonify({"error": "Database assistant not initialized"}), 500
-    
+    """
+    Recommend indexes from a query workload: the `queries` in the request, or
+    else the SQL /convert has generated for this schema.
+    """
     data = request.json
     schema = data.get('schema')
     schema_name = data.get('schema_name', 'database')
+    queries = data.get('queries')
+    narrate = data.get('narrate', False)  # Model-written rationale per index
     
     if not schema:
         return jsonify({"error": "Schema is required"}), 400
+    if narrate and not db_assistant:
+        return jsonify({"error": "Database assistant not initialized"}), 500
+    
+    source = "request"
+    if queries is None:
+        try:
+            namespace = request_namespace(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        queries = query_log.queries(query_log_key(namespace, schema_name), QueryLog.key_for_schema(schema))
+        source = "query_log"
+    
+    def recommendations(narrated=False):
+        if narrated:
+            return db_assistant.recommend_indexes(schema, schema_name, queries, narrate=True, source=source)
+        return index_advisor.recommend_indexes(schema, queries, schema_name, source=source)
     
     try:
-        indexes = db_assistant.recommend_indexes(schema, schema_name)
-        return jsonify(indexes)
+        if not narrate:
+            return jsonify(recommendations())
+        return model_response(
+            response_cache.make_key('recommend_indexes', schema, schema_name, queries),
+            lambda: recommendations(narrated=True),
+            fallback=recommendations
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -271,27 +1182,40 @@ def chat_about_schema():
         return jsonify({"error": "Schema and question are required"}), 400
     
     try:
-        answer = db_assistant.chat_about_schema(schema, schema_name, question)
-        return jsonify({"answer": answer})
+        return model_response(
+            response_cache.make_key('chat', schema, schema_name, question),
+            lambda: {"answer": db_assistant.chat_about_schema(schema, schema_name, question)}
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/db/explain-query', methods=['POST'])
 def explain_query():
-    """Explain a SQL query in plain English."""
-    if not db_assistant:
-        return jsonify({"error": "Database assistant not initialized"}), 500
-    
+    """
+    Explain a SQL query: structure and performance notes are computed
+    locally, prose from the model only with `narrate`.
+    """
     data = request.json
     sql_query = data.get('query')
     schema = data.get('schema', '')
+    narrate = data.get('narrate', False)
+    dry_run = dry_run_options(data.get('dry_run'))
     
     if not sql_query:
         return jsonify({"error": "Query is required"}), 400
+    if narrate and not db_assistant:
+        return jsonify({"error": "Database assistant not initialized"}), 500
     
     try:
-        explanation = db_assistant.explain_query(sql_query, schema)
-        return jsonify(explanation)
+        extra = {"dry_run": run_dry_run(sql_query, schema, dry_run)} if dry_run else None
+        if not narrate:
+            return jsonify({**query_explainer.explain_query(sql_query, schema), **(extra or {})})
+        return model_response(
+            response_cache.make_key('explain_query', sql_query, schema),
+            lambda: db_assistant.explain_query(sql_query, schema, narrate=True),
+            fallback=lambda: query_explainer.explain_query(sql_query, schema),
+            extra=extra
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -308,8 +1232,10 @@ def generate_dummy_commands(table_name):
         return jsonify({"error": "Schema is required"}), 400
     
     try:
-        commands = db_assistant.generate_dummy_commands(schema, table_name)
-        return jsonify(commands)
+        return model_response(
+            response_cache.make_key('dummy_commands', schema, table_name),
+            lambda: db_assistant.generate_dummy_commands(schema, table_name)
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,534 @@
+"""
+Benchmarks of everything around the model calls, against a local fake
+Gemini backend, so changes can be compared without the live API.
+
+    python benchmark.py                                  # all suites
+    python benchmark.py --suite retrieval --sizes 1,1000,100000
+    python benchmark.py --suite endpoints --concurrency 8 --generate-latency-ms 200
+    python benchmark.py --suite client --requests 500
+    python benchmark.py --suite startup --startup-sizes 100,10000
+    python benchmark.py --json results.json --compare baseline.json
+
+`retrieval` builds knowledge bases of synthetic schemas and times adding,
+saving and loading them, building the vector index, and retrieval latency
+per mode. `endpoints` serves app.py on a local port and measures
+throughput and p50/p99 latency per endpoint under concurrent clients.
+`client` times SDK imports and model calls over HTTP through the shared
+pooled client against a new connection per call. `startup` times a new
+worker process until it serves requests and until its warm-up is done.
+The fake backend answers deterministically after a configurable latency.
+`--json` writes the results for regression tracking; `--compare` prints the
+change of each timing against an earlier results file.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from retrieval_benchmark import QUESTIONS, _hash_embedding
+
+RETRIEVAL_MODES = ("hybrid", "lexical", "vector")
+
+# Words synthetic schemas are made of, so BM25 postings overlap like real ones
+_VOCABULARY = (
+    "account address amount audit balance batch branch budget campaign card carrier category "
+    "claim client comment contract cost country coupon course customer delivery department "
+    "device discount doctor employee enrollment event expense feedback flight grade group "
+    "hotel inventory invoice item journal ledger lesson license loan location member message "
+    "order partner patient payment payroll permit plan policy price product project promotion "
+    "purchase rating receipt refund region rental report request reservation review room route "
+    "salary schedule session shipment shift site skill stock store student subscription supplier "
+    "task tax teacher ticket trip unit user vehicle vendor visit warehouse"
+).split()
+
+
+class _Models:
+    def __init__(self, backend: "FakeGemini"):
+        self.backend = backend
+
+    def generate_content(self, model, contents, config=None):
+        return self.backend.respond(contents if isinstance(contents, str) else str(contents))
+
+    def embed_content(self, model, contents, config=None):
+        time.sleep(self.backend.embed_latency)
+        self.backend.calls["embed"] += 1
+        texts = contents if isinstance(contents, list) else [contents]
+        dim = getattr(config, "output_dimensionality", None) or 768
+        return types.SimpleNamespace(embeddings=[types.SimpleNamespace(values=_hash_embedding(t, dim)) for t in texts])
+
+
+def default_response(prompt: str) -> str:
+    """SQL over the first table of the prompt's schema, or JSON when JSON is asked for."""
+    if "json" in prompt.lower():
+        return json.dumps({"summary": "benchmark response", "tables": [], "queries": []})
+    table = re.search(r"^\s*(?:CREATE TABLE\s+)?(\w+)\s*\(", prompt, re.MULTILINE | re.IGNORECASE)
+    sql = f"SELECT * FROM {table.group(1) if table else 'users'} LIMIT 10;"
+    if "SQL Query:" in prompt:
+        return f"SQL Query: {sql}\nExplanation: Lists rows of the table."
+    return sql
+
+
+class FakeGemini:
+    """
+    A deterministic stand-in for the Gemini API: `client()` replaces a
+    google-genai client.
+    Generation waits `generate_latency` seconds and answers with
+    `responder(prompt)`; embeddings are word hashes after `embed_latency`.
+    """
+
+    def __init__(self, generate_latency: float = 0.0, embed_latency: float = 0.0,
+                 responder: Callable[[str], str] = default_response):
+        self.generate_latency = generate_latency
+        self.embed_latency = embed_latency
+        self.responder = responder
+        self.calls = {"generate": 0, "embed": 0}
+        self.models = _Models(self)
+
+    def respond(self, prompt: str):
+        time.sleep(self.generate_latency)
+        self.calls["generate"] += 1
+        text = self.responder(prompt)
+        return types.SimpleNamespace(
+            text=text,
+            usage_metadata=types.SimpleNamespace(prompt_token_count=len(prompt) // 4,
+                                                 candidates_token_count=len(text) // 4),
+        )
+
+    def client(self) -> types.SimpleNamespace:
+        return types.SimpleNamespace(models=self.models)
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """Nearest-rank percentile of `samples`."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def _timings(samples: List[float]) -> Dict:
+    return {
+        "p50_ms": round(1000 * percentile(samples, 50), 3),
+        "p99_ms": round(1000 * percentile(samples, 99), 3),
+        "mean_ms": round(1000 * sum(samples) / len(samples), 3),
+    }
+
+
+def synthetic_schemas(count: int, seed: int = 0) -> List[Dict]:
+    """`count` small schemas of two or three tables named from a shared vocabulary."""
+    rng = random.Random(seed)
+    schemas = []
+    for i in range(count):
+        words = rng.sample(_VOCABULARY, 3)
+        tables = []
+        for table in words[:rng.randint(2, 3)]:
+            columns = [f"    {table}_id INT PRIMARY KEY"]
+            columns += [f"    {c}_{rng.choice(('id', 'name', 'date', 'amount'))} VARCHAR(50)"
+                        for c in rng.sample(_VOCABULARY, 4)]
+            tables.append(f"{table}_{i}(\n" + ",\n".join(columns) + "\n)")
+        schemas.append({
+            "name": f"{words[0]}_{words[1]}_{i}",
+            "schema": "\n\n".join(tables),
+            "description": f"Tracks {words[0]}s, {words[1]}s and {words[2]}s",
+        })
+    return schemas
+
+
+def _knowledge_base(path: str, backend: FakeGemini, **options):
+    from schema_kb import SchemaKnowledgeBase
+
+    return SchemaKnowledgeBase(api_key="benchmark", storage_path=path, client=backend.client(), **options)
+
+
+def bench_retrieval(sizes: List[int], backend: FakeGemini, embedding_format: str = "int8",
+                    queries: int = 50) -> Dict:
+    """Add/save/load time, index build time and retrieval latency per mode at each knowledge-base size."""
+    rng = random.Random(1)
+    questions = [" ".join(rng.sample(_VOCABULARY, 3)) for _ in range(queries)]
+    retrieval, storage = [], []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "kb.json")
+            kb = _knowledge_base(path, backend, embedding_format=embedding_format)
+            schemas = synthetic_schemas(size)
+            start = time.perf_counter()
+            kb.add_schemas(schemas, batch_size=100)
+            added = time.perf_counter() - start
+
+            start = time.perf_counter()
+            kb.save_schemas()
+            saved = time.perf_counter() - start
+            start = time.perf_counter()
+            kb = _knowledge_base(path, backend, embedding_format=embedding_format)
+            loaded = time.perf_counter() - start
+            storage.append({
+                "schemas": size,
+                "format": embedding_format,
+                "file_mb": round(os.path.getsize(path) / 2 ** 20, 2),
+                "add_ms": round(1000 * added, 1),
+                "save_ms": round(1000 * saved, 1),
+                "load_ms": round(1000 * loaded, 1),
+            })
+
+            start = time.perf_counter()
+            kb.retrieve(questions[0], 3, "vector")  # builds the vector index
+            row = {"schemas": size, "format": embedding_format,
+                   "index_build_ms": round(1000 * (time.perf_counter() - start), 1)}
+            for mode in RETRIEVAL_MODES:
+                samples = []
+                for question in questions:
+                    start = time.perf_counter()
+                    kb.retrieve(question, 3, mode)
+                    samples.append(time.perf_counter() - start)
+                row[mode] = _timings(samples)
+            start = time.perf_counter()
+            kb.retrieve_many(questions, 3, "vector")
+            row["vector_batch_ms_per_query"] = round(1000 * (time.perf_counter() - start) / queries, 3)
+            retrieval.append(row)
+            print(f"{size:>7} schemas: add {storage[-1]['add_ms']:.0f} ms, save {storage[-1]['save_ms']:.0f} ms, "
+                  f"load {storage[-1]['load_ms']:.0f} ms, " + ", ".join(
+                      f"{mode} p50 {row[mode]['p50_ms']:.2f} ms" for mode in RETRIEVAL_MODES))
+    return {"retrieval": retrieval, "storage": storage}
+
+
+def endpoint_requests(schema: str) -> Dict[str, Callable[[int], tuple]]:
+    """Endpoint name -> function of the request number giving (method, path, JSON body)."""
+    questions = [q for q, _ in QUESTIONS]
+    return {
+        "convert": lambda i: ("POST", "/convert", {"query": questions[i % len(questions)]}),
+        "convert_batch": lambda i: ("POST", "/convert/batch",
+                                    {"questions": [questions[(i + k) % len(questions)] for k in range(8)]}),
+        "list_schemas": lambda i: ("GET", "/schemas", None),
+        "analyze": lambda i: ("POST", "/db/analyze", {"schema": schema, "schema_name": "hospital_db"}),
+        "explain_query": lambda i: ("POST", "/db/explain-query",
+                                    {"query": "SELECT * FROM patients p JOIN appointments a "
+                                              "ON a.patient_id = p.patient_id", "schema": schema}),
+        "recommend_indexes": lambda i: ("POST", "/db/recommend-indexes",
+                                        {"schema": schema, "queries": ["SELECT * FROM patients WHERE last_name = 'x'"]}),
+    }
+
+
+def serve_app(backend: FakeGemini, directory: str):
+    """app.py wired to the fake backend, served on a local port. Returns (server, base URL)."""
+    for name in ("GEMINI_API_KEY", "GOOGLE_API_KEY", "CATALOG_URL", "CAPTURE_PATH"):
+        os.environ[name] = ""  # also keeps load_dotenv from supplying real keys
+    os.environ["QUERY_LOG_PATH"] = os.path.join(directory, "query_log.jsonl")
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    import app as service
+    from db_assistant import DatabaseAssistant
+    from kb_namespaces import DEFAULT_NAMESPACE, KnowledgeBaseRegistry
+    from query_log import QueryLog
+    from seed_data import initialize_knowledge_base
+    from text_to_sql import TextToSQLConverter
+
+    service.query_log = QueryLog(os.environ["QUERY_LOG_PATH"])
+    service.converter = TextToSQLConverter(
+        "benchmark", breaker=service.model_breaker, router=service.model_router, client=backend.client()
+    )
+    service.db_assistant = DatabaseAssistant("benchmark", breaker=service.model_breaker, client=backend.client())
+    service.kb_registry = KnowledgeBaseRegistry(
+        lambda path: _knowledge_base(path, backend, breaker=service.model_breaker, **service.embedding_options),
+        directory=os.path.join(directory, "namespaces"),
+        default_path=os.path.join(directory, "schema_kb.json"),
+    )
+    initialize_knowledge_base(service.kb_registry.get(DEFAULT_NAMESPACE))
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, service.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def load_test(base_url: str, build: Callable[[int], tuple], requests: int, concurrency: int) -> Dict:
+    """Issue `requests` requests from `concurrency` clients; throughput, error rate and latency."""
+    def issue(i):
+        method, path, body = build(i)
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(base_url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 0
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(issue, range(requests)))
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for _, status in outcomes if not 200 <= status < 300)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "throughput_rps": round(requests / elapsed, 1),
+        "error_rate": round(errors / requests, 4),
+        **_timings([latency for latency, _ in outcomes]),
+    }
+
+
+def bench_endpoints(backend: FakeGemini, requests: int, concurrency: int,
+                    endpoints: Optional[List[str]] = None) -> Dict:
+    from seed_data import SAMPLE_SCHEMAS
+
+    with tempfile.TemporaryDirectory() as directory:
+        server, base_url = serve_app(backend, directory)
+        try:
+            schema = next(s["schema"] for s in SAMPLE_SCHEMAS if s["name"] == "hospital_db")
+            results = []
+            for name, build in endpoint_requests(schema).items():
+                if endpoints and name not in endpoints:
+                    continue
+                load_test(base_url, build, min(requests, 2 * concurrency), concurrency)  # warm up
+                row = {"endpoint": name, **load_test(base_url, build, requests, concurrency)}
+                results.append(row)
+                print(f"{name:<18} {row['throughput_rps']:>8.1f} req/s  p50 {row['p50_ms']:>8.2f} ms  "
+                      f"p99 {row['p99_ms']:>8.2f} ms  errors {row['error_rate']:.1%}")
+        finally:
+            server.shutdown()
+    return {"endpoints": results}
+
+
+# A generateContent response, as the local server of the client suite returns it
+GENERATE_RESPONSE = {
+    "candidates": [{"content": {"role": "model", "parts": [{"text": "SELECT 1;"}]}, "finishReason": "STOP"}],
+    "usageMetadata": {"promptTokenCount": 4, "candidatesTokenCount": 2, "totalTokenCount": 6},
+}
+
+
+def import_seconds(module: str) -> Optional[float]:
+    """Seconds a fresh interpreter takes to import `module`, or None if it is not installed."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    return float(result.stdout) if result.returncode == 0 else None
+
+
+def bench_client(calls: int) -> Dict:
+    """
+    SDK import time, client creation time, and model calls to a local HTTP
+    server through the shared pooled client versus a new connection per call.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from google import genai
+
+    from genai_client import create_client
+
+    body = json.dumps(GENERATE_RESPONSE).encode("utf-8")
+    connections = [0]
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keeps connections open
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def setup(self):
+            with lock:
+                connections[0] += 1
+            super().setup()
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/"
+
+    imports = {"google.genai_ms": import_seconds("google.genai"),
+               "google.genai+google.generativeai_ms": import_seconds("google.genai, google.generativeai")}
+    imports = {name: round(1000 * seconds, 1) if seconds is not None else None for name, seconds in imports.items()}
+    print("import " + "  ".join(f"{name} {ms} ms" for name, ms in imports.items()))
+
+    samples = []
+    for _ in range(20):
+        start = time.perf_counter()
+        genai.Client(api_key="benchmark")
+        samples.append(time.perf_counter() - start)
+    created = _timings(samples)
+    print(f"genai.Client()          p50 {created['p50_ms']:>8.2f} ms  (paid once per key by the shared client)")
+
+    rows = []
+    try:
+        for variant, keepalive in (("new_connection_per_call", 0.0), ("pooled", None)):
+            client = create_client("benchmark", keepalive_seconds=keepalive, base_url=base_url)
+            client.models.generate_content(model="gemini-2.5-flash", contents="warm up")
+            connections[0] = 0
+            samples = []
+            for i in range(calls):
+                start = time.perf_counter()
+                client.models.generate_content(model="gemini-2.5-flash", contents=f"question {i}")
+                samples.append(time.perf_counter() - start)
+            rows.append({"variant": variant, "calls": calls, "new_connections": connections[0], **_timings(samples)})
+            print(f"{variant:<23} p50 {rows[-1]['p50_ms']:>8.2f} ms  p99 {rows[-1]['p99_ms']:>8.2f} ms  "
+                  f"{connections[0]} new connections for {calls} calls")
+    finally:
+        server.shutdown()
+    return {"client": rows, "client_setup": {"imports": imports, "create": created}}
+
+
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+healthy = client.get("/healthz").status_code == 200
+app.warm_up.wait(300)
+print(json.dumps({"import_ms": 1000 * (imported - start), "ready_ms": 1000 * (time.perf_counter() - start),
+                  "healthy": healthy, "warm_up": app.warm_up.status()}))
+"""
+
+
+def bench_startup(sizes: List[int], backend: FakeGemini) -> Dict:
+    """
+    Time from starting a worker process to it answering /healthz (importing
+    app.py) and to /readyz reporting ready, with a knowledge base of each size.
+    """
+    rows = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            kb = _knowledge_base(os.path.join(directory, "schema_kb.json"), backend)
+            kb.add_schemas(synthetic_schemas(size), batch_size=100)
+            kb.save_schemas()
+            # A key, so app.py loads the knowledge base; nothing here calls the model
+            env = {**os.environ, "GEMINI_API_KEY": "benchmark", "GOOGLE_API_KEY": "", "CATALOG_URL": "",
+                   "CAPTURE_PATH": ""}
+            result = subprocess.run(
+                [sys.executable, "-c", _STARTUP_SCRIPT, os.path.dirname(os.path.abspath(__file__))],
+                cwd=directory, env=env, capture_output=True, text=True,
+            )
+            if result.returncode:
+                raise RuntimeError(f"Worker failed to start: {result.stderr[-2000:]}")
+            started = json.loads(result.stdout.strip().splitlines()[-1])
+            steps = {step["name"]: step["duration_ms"] for step in started["warm_up"]["steps"]}
+            row = {"schemas": size, "import_ms": round(started["import_ms"], 1),
+                   "ready_ms": round(started["ready_ms"], 1), "state": started["warm_up"]["state"],
+                   **{f"{name}_ms": ms for name, ms in steps.items()}}
+            rows.append(row)
+            print(f"{size:>7} schemas: serving after {row['import_ms']:.0f} ms, ready after {row['ready_ms']:.0f} ms "
+                  f"({', '.join(f'{name} {ms:.0f} ms' for name, ms in steps.items())})")
+    return {"startup": rows}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _flatten(results: Dict) -> Dict[str, float]:
+    """Timing metrics of a results file keyed by section, row and metric."""
+    flat = {}
+    for section, key in (("retrieval", "schemas"), ("storage", "schemas"), ("endpoints", "endpoint"),
+                         ("client", "variant"), ("startup", "schemas")):
+        for row in results.get(section, []):
+            for metric, value in row.items():
+                values = value.items() if isinstance(value, dict) else [(None, value)]
+                for sub, number in values:
+                    name = metric if sub is None else f"{metric}.{sub}"
+                    if isinstance(number, (int, float)) and name.endswith(("_ms", "_rps", "_ms_per_query")):
+                        flat[f"{section}[{row[key]}].{name}"] = number
+    return flat
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = 0.1):
+    """Print each metric that changed by more than `threshold` against `baseline`."""
+    before, after = _flatten(baseline), _flatten(results)
+    changed = 0
+    for name in sorted(set(before) & set(after)):
+        if not before[name]:
+            continue
+        change = after[name] / before[name] - 1
+        if abs(change) >= threshold:
+            worse = change < 0 if name.endswith("_rps") else change > 0
+            print(f"{'slower' if worse else 'faster':<7} {name:<55} {before[name]:>10} -> {after[name]:>10} "
+                  f"({change:+.0%})")
+            changed += 1
+    print(f"{changed} of {len(set(before) & set(after))} metrics changed by {threshold:.0%} or more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SqlSimplify against a fake Gemini backend.")
+    parser.add_argument("--suite", choices=("all", "retrieval", "endpoints", "client", "startup"), default="all")
+    parser.add_argument("--sizes", default="1,10,100,1000,10000,100000", help="Knowledge-base sizes")
+    parser.add_argument("--startup-sizes", default="100,10000", help="Knowledge-base sizes of the startup suite")
+    parser.add_argument("--format", default="int8", help="Embedding format of the retrieval suite")
+    parser.add_argument("--queries", type=int, default=50, help="Retrievals timed per mode and size")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint, or model calls")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--endpoints", help="Comma-separated endpoints to load (default: all)")
+    parser.add_argument("--generate-latency-ms", type=float, default=0.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--json", help="Write the results to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="Results file to compare against")
+    args = parser.parse_args()
+
+    backend = FakeGemini(args.generate_latency_ms / 1000, args.embed_latency_ms / 1000)
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "generate_latency_ms": args.generate_latency_ms,
+            "embed_latency_ms": args.embed_latency_ms,
+        }
+    }
+    if args.suite in ("all", "retrieval"):
+        print("Retrieval and storage")
+        results.update(bench_retrieval([int(s) for s in args.sizes.split(",")], backend, args.format, args.queries))
+    if args.suite in ("all", "endpoints"):
+        print(f"\nEndpoints, {args.concurrency} concurrent clients")
+        endpoints = args.endpoints.split(",") if args.endpoints else None
+        results.update(bench_endpoints(backend, args.requests, args.concurrency, endpoints))
+    if args.suite in ("all", "client"):
+        print("\nModel client, local HTTP server")
+        results.update(bench_client(args.requests))
+    if args.suite in ("all", "startup"):
+        print("\nWorker startup")
+        results.update(bench_startup([int(s) for s in args.startup_sizes.split(",")], backend))
+
+    if args.json == "-":
+        print(json.dumps(results, indent=2))
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print()
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Offline conversion of saved questions, JSONL in and JSONL out.
+
+    python bulk_convert.py questions.jsonl results.jsonl --concurrency 8 --rate 5
+
+Each input line is a JSON object holding an id and a question (`--id-field`,
+`--query-field`; lines without an id are numbered). A line may carry its own
+`schema`; otherwise schemas are retrieved from the knowledge base, a chunk
+of questions at a time with batched embedding calls. Large schemas are
+pruned to the tables a question needs, as /convert does. Conversions run
+on a thread pool, starting at most `--rate` per second, and each result is
+appended to the output as soon as it is done. While the model's circuit
+breaker is open, conversions wait for it without using up a retry. Re-running the same command
+after a crash resumes: ids already converted are skipped, failed ones are
+retried.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Dict, Iterator, Optional, Set
+
+from catalog_sync import with_join_neighbours
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from kb_namespaces import DEFAULT_NAMESPACE, KnowledgeBaseRegistry
+from model_router import ModelRouter
+from schema_kb import DEFAULT_EMBEDDING_MODEL, SchemaKnowledgeBase, prune_context, schema_context, select_relevant
+from text_to_sql import TextToSQLConverter
+
+
+class RateLimiter:
+    """Spaces calls to at most `rate` per second across threads; None for no limit."""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def read_questions(path: str, id_field: str = "id", query_field: str = "query") -> Iterator[Dict]:
+    """Questions of a JSONL file, read lazily. Unreadable lines come back with an `error`."""
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                query = record.get(query_field)
+            except (ValueError, AttributeError):
+                yield {"id": f"line-{number}", "error": "Line is not a JSON object"}
+                continue
+            item = {"id": str(record.get(id_field) or f"line-{number}"), "query": query, "record": record}
+            if not isinstance(query, str) or not query.strip():
+                item["error"] = f"No '{query_field}' in line {number}"
+            yield item
+
+
+def completed_ids(path: str) -> Set[str]:
+    """
+    Ids converted successfully in an earlier run. A line cut short by a
+    crash is truncated away so new results start on a line of their own.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    done = set()
+    for line in data.decode("utf-8", errors="replace").splitlines():
+        try:
+            result = json.loads(line)
+        except ValueError:
+            continue
+        if result.get("status") == "ok":
+            done.add(result["id"])
+    return done
+
+
+class BulkConverter:
+    """Converts a JSONL file of questions, writing results as they finish."""
+
+    def __init__(
+        self,
+        converter: TextToSQLConverter,
+        knowledge_base: Optional[SchemaKnowledgeBase] = None,
+        concurrency: int = 8,
+        rate: Optional[float] = None,
+        chunk_size: int = 100,
+        top_k: int = 3,
+        min_score: float = 0.0,
+        max_gap: Optional[float] = 0.1,
+        mode: str = "hybrid",
+        with_explanation: bool = False,
+        max_retries: int = 3,
+        retry_seconds: float = 2.0,
+        progress_every: int = 100,
+        prune: Optional[bool] = None,
+        prune_min_tables: int = 25,
+    ):
+        self.converter = converter
+        self.knowledge_base = knowledge_base
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.chunk_size = chunk_size
+        self.top_k = top_k
+        self.min_score = min_score
+        self.max_gap = max_gap
+        self.mode = mode
+        self.with_explanation = with_explanation
+        self.max_retries = max_retries
+        self.retry_seconds = retry_seconds
+        self.progress_every = progress_every
+        self.prune = prune
+        self.prune_min_tables = prune_min_tables
+
+    def _retrieve(self, queries):
+        """Retrieval for a chunk, waiting out an open circuit breaker."""
+        while True:
+            try:
+                return self.knowledge_base.retrieve_many(queries, self.top_k, self.mode)
+            except CircuitOpenError as e:
+                time.sleep(e.retry_after)
+
+    def _convert(self, item: Dict, schemas) -> Dict:
+        context, schema, pruning = prune_context(
+            item["query"], schemas, item["record"].get("schema"), self.prune, self.knowledge_base,
+            self.prune_min_tables,
+        )
+        if context:
+            schema = schema_context(context)
+        error, attempt = None, 0
+        while attempt <= self.max_retries:
+            self.limiter.wait()
+            try:
+                result = self.converter.convert(item["query"], schema, self.with_explanation)
+            except CircuitOpenError as e:
+                # Waiting out an open breaker does not use up an attempt
+                error = str(e)
+                time.sleep(e.retry_after)
+                continue
+            except Exception as e:
+                error = str(e)
+            else:
+                if result["sql_query"]:
+                    extra = {"schema_pruning": pruning} if pruning else {}
+                    return {
+                        "id": item["id"], "query": item["query"], "status": "ok", "attempts": attempt + 1,
+                        "schemas": [s["name"] for s in schemas], **result, **extra,
+                    }
+                error = "Model returned no SQL"
+            attempt += 1
+            if attempt <= self.max_retries:
+                time.sleep(self.retry_seconds * 2 ** (attempt - 1))
+        return {"id": item["id"], "query": item["query"], "status": "error", "attempts": attempt, "error": error}
+
+    def run(self, input_path: str, output_path: str, id_field: str = "id", query_field: str = "query") -> Dict:
+        """Convert every question of `input_path` not yet in `output_path`."""
+        done = completed_ids(output_path)
+        stats = {"converted": 0, "failed": 0, "skipped": 0, "resumed_from": len(done)}
+        start = time.perf_counter()
+        seen = set()
+        questions = read_questions(input_path, id_field, query_field)
+        write_lock = threading.Lock()
+
+        def write(out, result):
+            with write_lock:
+                out.write(json.dumps(result, default=str) + "\n")
+                out.flush()
+                stats["converted" if result["status"] == "ok" else "failed"] += 1
+                finished = stats["converted"] + stats["failed"]
+                if self.progress_every and finished % self.progress_every == 0:
+                    rate = finished / (time.perf_counter() - start)
+                    print(f"{stats['converted']} converted, {stats['failed']} failed, "
+                          f"{stats['skipped']} skipped ({rate:.1f}/s)")
+
+        def written(out, item):
+            """Write a conversion's result from the worker that finished it, even while retrieval blocks."""
+            def callback(future: Future):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"id": item["id"], "query": item["query"], "status": "error", "attempts": 0,
+                              "error": str(e)}
+                write(out, result)
+            return callback
+
+        # The pool shuts down first, so every result is written before the file closes
+        with open(output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            in_flight = set()
+            while True:
+                chunk = list(islice(questions, self.chunk_size))
+                if not chunk:
+                    break
+                todo = []
+                for item in chunk:
+                    if item["id"] in done or item["id"] in seen:
+                        stats["skipped"] += 1
+                    elif "error" in item:
+                        write(out, {"id": item["id"], "query": item.get("query"), "status": "error",
+                                    "attempts": 0, "error": item["error"]})
+                    else:
+                        todo.append(item)
+                    seen.add(item["id"])
+
+                retrieve = [item for item in todo if not item["record"].get("schema")]
+                ranked = {}
+                if retrieve and self.knowledge_base is not None and self.knowledge_base.schemas:
+                    found = self._retrieve([item["query"] for item in retrieve])
+                    ranked = {item["id"]: r["results"] for item, r in zip(retrieve, found)}
+                for item in todo:
+                    schemas, _ = select_relevant(ranked.get(item["id"], []), self.min_score, self.max_gap)
+                    schemas, _ = with_join_neighbours(schemas, self.knowledge_base)
+                    future = pool.submit(self._convert, item, schemas)
+                    future.add_done_callback(written(out, item))
+                    in_flight.add(future)
+
+                # Keep a bounded number of questions in memory
+                while len(in_flight) >= 2 * self.concurrency:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+        stats["elapsed_seconds"] = round(time.perf_counter() - start, 1)
+        return stats
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Convert a JSONL file of questions to SQL.")
+    parser.add_argument("input", help="JSONL file of questions")
+    parser.add_argument("output", help="JSONL file results are appended to; resumed if it exists")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--query-field", default="query")
+    parser.add_argument("--namespace", default=DEFAULT_NAMESPACE, help="Knowledge-base namespace to retrieve from")
+    parser.add_argument("--no-rag", action="store_true", help="Only use schemas given in the input lines")
+    parser.add_argument("--concurrency", type=int, default=8, help="Conversions in flight")
+    parser.add_argument("--rate", type=float, default=None, help="Conversions started per second")
+    parser.add_argument("--chunk-size", type=int, default=100, help="Questions retrieved per batch")
+    parser.add_argument("--top-k", type=int, default=int(os.getenv("RAG_TOP_K", "3")))
+    parser.add_argument("--mode", choices=("hybrid", "lexical", "vector"), default=os.getenv("RAG_MODE", "hybrid"))
+    parser.add_argument("--explain", action="store_true", help="Also generate explanations")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--prune", choices=("auto", "always", "never"), default="auto",
+                        help="Prune schemas to the tables a question needs (auto: SCHEMA_PRUNE_MIN_TABLES or more)")
+    args = parser.parse_args()
+
+    api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        parser.error("GOOGLE_API_KEY or GEMINI_API_KEY must be set")
+    breaker = CircuitBreaker()
+    converter = TextToSQLConverter(
+        api_key=api_key, breaker=breaker,
+        router=ModelRouter(cascade=os.getenv("MODEL_CASCADE", "true").lower() != "false"),
+    )
+    knowledge_base = None
+    if not args.no_rag:
+        registry = KnowledgeBaseRegistry(
+            lambda path: SchemaKnowledgeBase(
+                api_key=api_key, breaker=breaker, storage_path=path,
+                embedding_format=os.getenv("EMBEDDING_FORMAT", "float32"),
+                embedding_dimensions=int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None,
+                embedding_model=os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL),
+            ),
+            directory=os.getenv("KB_NAMESPACE_DIR", "kb_namespaces"),
+        )
+        knowledge_base = registry.get(args.namespace, create=False)
+        if knowledge_base is None:
+            parser.error(f"Namespace '{args.namespace}' has no knowledge base")
+
+    stats = BulkConverter(
+        converter, knowledge_base,
+        concurrency=args.concurrency, rate=args.rate, chunk_size=args.chunk_size, top_k=args.top_k,
+        min_score=float(os.getenv("RAG_MIN_SCORE", "0.0")), max_gap=float(os.getenv("RAG_MAX_GAP", "0.1")),
+        mode=args.mode, with_explanation=args.explain, max_retries=args.max_retries,
+        prune={"auto": None, "always": True, "never": False}[args.prune],
+        prune_min_tables=int(os.getenv("SCHEMA_PRUNE_MIN_TABLES", "25")),
+    ).run(args.input, args.output, args.id_field, args.query_field)
+    print(f"Done: {stats['converted']} converted, {stats['failed']} failed, "
+          f"{stats['skipped']} already done, in {stats['elapsed_seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Live catalog introspection and incremental sync into the knowledge base.
+
+Tables, columns and foreign keys are read in bulk from a database (SQLite
+files directly; anything else through a SQLAlchemy URL) and stored as one
+knowledge-base entry per table, named `<database>.<table>`. Each sync
+compares the catalog fingerprint with the last one, and the knowledge base
+skips tables whose content hash has not changed, so only new or altered
+tables are embedded. Tables dropped from the database are removed.
+
+Retrieval returns only a few entries, so `with_join_neighbours` adds the
+tables a retrieved one joins to, such as a junction table between two
+retrieved tables.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from schema_parser import render_table
+
+
+def _table(name: str, columns: List[Dict], primary_key: List[str], foreign_keys: List[Dict],
+           unique: Optional[set] = None) -> Dict:
+    """A table in the shape `parse_schema` returns, so it renders like a parsed one."""
+    unique = unique or set()
+    references = {}
+    for fk in foreign_keys:
+        references.setdefault(fk["column"].lower(), fk)
+    parsed = []
+    for column in columns:
+        key = column["name"].lower()
+        single_pk = primary_key == [column["name"]]
+        constraints = []
+        if single_pk:
+            constraints.append("PRIMARY KEY")
+        elif not column["nullable"]:
+            constraints.append("NOT NULL")
+        if key in unique and not single_pk:
+            constraints.append("UNIQUE")
+        fk = references.get(key)
+        if fk:
+            target = fk["references_table"] + (f"({fk['references_column']})" if fk["references_column"] else "")
+            constraints.append(f"REFERENCES {target}")
+        parsed.append({
+            "name": column["name"],
+            "type": column["type"],
+            "constraints": constraints,
+            "primary_key": column["name"] in primary_key,
+            "nullable": column["nullable"] and column["name"] not in primary_key,
+            "unique": single_pk or key in unique,
+            "references": {"table": fk["references_table"], "column": fk["references_column"]} if fk else None,
+        })
+    return {"name": name, "columns": parsed, "primary_key": primary_key, "foreign_keys": foreign_keys}
+
+
+def _sqlite_path(source: str) -> Optional[str]:
+    if source.startswith("sqlite:///"):
+        return source[len("sqlite:///"):]
+    if "://" not in source:
+        return source
+    return None
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def introspect_sqlite(path: str) -> Dict[str, Dict]:
+    """Tables of a SQLite file, opened read-only."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"SQLite database not found: {path}")
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        names = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )]
+        tables = {}
+        for name in names:
+            quoted = _quote(name)
+            info = conn.execute(f"PRAGMA table_info({quoted})").fetchall()
+            columns = [{"name": c[1], "type": c[2] or "", "nullable": not c[3]} for c in info]
+            primary_key = [c[1] for c in sorted(info, key=lambda c: c[5]) if c[5]]
+            foreign_keys = [
+                {"column": fk[3], "references_table": fk[2], "references_column": fk[4]}
+                for fk in conn.execute(f"PRAGMA foreign_key_list({quoted})")
+            ]
+            unique = set()
+            for index in conn.execute(f"PRAGMA index_list({quoted})"):
+                if index[2] and index[3] == "u":
+                    indexed = conn.execute(f"PRAGMA index_info({_quote(index[1])})").fetchall()
+                    if len(indexed) == 1:
+                        unique.add(indexed[0][2].lower())
+            tables[name] = _table(name, columns, primary_key, foreign_keys, unique)
+        return tables
+    finally:
+        conn.close()
+
+
+def introspect_sqlalchemy(url: str) -> Dict[str, Dict]:
+    """Tables of any database SQLAlchemy can reach, read in bulk where supported."""
+    try:
+        import sqlalchemy
+    except ImportError:
+        raise ImportError("Introspecting non-SQLite databases requires SQLAlchemy: pip install sqlalchemy")
+
+    engine = sqlalchemy.create_engine(url)
+    try:
+        inspector = sqlalchemy.inspect(engine)
+        if hasattr(inspector, "get_multi_columns"):
+            # SQLAlchemy 2.0: one catalog query per kind for all tables
+            def by_table(found):
+                return {table: value for (_, table), value in found.items()}
+            columns = by_table(inspector.get_multi_columns())
+            primary_keys = by_table(inspector.get_multi_pk_constraint())
+            foreign_keys = by_table(inspector.get_multi_foreign_keys())
+            uniques = by_table(inspector.get_multi_unique_constraints())
+        else:
+            names = inspector.get_table_names()
+            columns = {t: inspector.get_columns(t) for t in names}
+            primary_keys = {t: inspector.get_pk_constraint(t) for t in names}
+            foreign_keys = {t: inspector.get_foreign_keys(t) for t in names}
+            uniques = {t: inspector.get_unique_constraints(t) for t in names}
+    finally:
+        engine.dispose()
+
+    tables = {}
+    for name in sorted(columns):
+        fks = []
+        for fk in foreign_keys.get(name, []):
+            referred = fk.get("referred_columns") or [None] * len(fk["constrained_columns"])
+            for column, ref in zip(fk["constrained_columns"], referred):
+                fks.append({"column": column, "references_table": fk["referred_table"], "references_column": ref})
+        tables[name] = _table(
+            name,
+            [{"name": c["name"], "type": str(c["type"]), "nullable": c.get("nullable", True)} for c in columns[name]],
+            (primary_keys.get(name) or {}).get("constrained_columns") or [],
+            fks,
+            {u["column_names"][0].lower() for u in uniques.get(name, []) if len(u["column_names"]) == 1},
+        )
+    return tables
+
+
+def introspect(source: str) -> Dict[str, Dict]:
+    """Tables of a SQLite path / `sqlite:///` URL, or of any SQLAlchemy URL."""
+    path = _sqlite_path(source)
+    return introspect_sqlite(path) if path is not None else introspect_sqlalchemy(source)
+
+
+def database_name(source: str) -> str:
+    """A name for the database behind `source`: the file stem or the URL's database."""
+    path = _sqlite_path(source)
+    target = path if path is not None else source.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
+    return os.path.splitext(os.path.basename(target))[0] or "database"
+
+
+def table_entries(database: str, tables: Dict[str, Dict]) -> List[Dict]:
+    """One knowledge-base entry per table, describing what it joins to."""
+    referenced_by: Dict[str, List[str]] = {}
+    for table in tables.values():
+        for fk in table["foreign_keys"]:
+            referenced_by.setdefault(fk["references_table"].lower(), []).append(table["name"])
+    entries = []
+    for table in tables.values():
+        joins = [fk["references_table"] for fk in table["foreign_keys"]]
+        joins += referenced_by.get(table["name"].lower(), [])
+        description = f"Table {table['name']} of the {database} database."
+        if joins:
+            description += " Joins " + ", ".join(dict.fromkeys(joins)) + "."
+        entries.append({
+            "name": f"{database}.{table['name']}",
+            "schema": render_table(table),
+            "description": description,
+            "source": database,
+        })
+    return entries
+
+
+_JOINS_RE = re.compile(r"\bJoins (.+)\.$")
+
+
+def join_neighbours(name: str, description: str, database: str) -> List[str]:
+    """Entry names of the tables a catalog entry joins to, as its description lists them."""
+    match = _JOINS_RE.search(description or "")
+    if not match or not name.startswith(f"{database}."):
+        return []
+    return [f"{database}.{table}" for table in match.group(1).split(", ")]
+
+
+def with_join_neighbours(schemas: List[Dict], knowledge_base, limit: int = 8) -> Tuple[List[Dict], List[str]]:
+    """
+    Add to retrieved `schemas` the catalog entries of the same database they
+    join to, so a join through a table that was not retrieved still has it
+    in the prompt. Tables joining more of the retrieved ones come first; at
+    most `limit` are added. Returns the schemas and the names added.
+    """
+    if not schemas or knowledge_base is None:
+        return schemas, []
+    by_name = knowledge_base.snapshot().by_name
+    names = {s["name"] for s in schemas}
+    joined_from: Dict[str, List[str]] = {}
+    for s in schemas:
+        database = (by_name.get(s["name"]) or {}).get("source")
+        if not database:
+            continue
+        for neighbour in join_neighbours(s["name"], s.get("description", ""), database):
+            entry = by_name.get(neighbour)
+            if neighbour not in names and entry and entry.get("source") == database:
+                joined_from.setdefault(neighbour, []).append(s["name"])
+    if not joined_from:
+        return schemas, []
+
+    votes = Counter({name: len(sources) for name, sources in joined_from.items()})
+    added = []
+    for neighbour, _ in votes.most_common(limit):
+        entry = by_name[neighbour]
+        added.append({
+            "name": entry["name"],
+            "description": entry["description"],
+            "schema": entry["schema"],
+            "relevance_score": 0.0,
+            "joined_from": joined_from[neighbour],
+        })
+    return schemas + added, [e["name"] for e in added]
+
+
+def catalog_fingerprint(entries: List[Dict]) -> str:
+    digest = hashlib.sha256()
+    for entry in sorted(entries, key=lambda e: e["name"]):
+        digest.update(f"{entry['name']}\n{entry['description']}\n{entry['schema']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CatalogSync:
+    """
+    Keeps a knowledge base in sync with a live database. `sync` runs one
+    pass; `start` runs one now (unless `sync_first` is False) and then
+    every `interval_seconds` on a daemon thread.
+    """
+
+    def __init__(self, knowledge_base, source: str, database: Optional[str] = None,
+                 interval_seconds: Optional[float] = None):
+        self.knowledge_base = knowledge_base
+        self.source = source
+        self.database = database or database_name(source)
+        self.interval_seconds = interval_seconds
+        self.fingerprint: Optional[str] = None
+        self.last_report: Optional[Dict] = None
+        self.runs = 0
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sync(self) -> Dict:
+        """Introspect the catalog and apply what changed since the last sync."""
+        with self._lock:
+            start = time.perf_counter()
+            entries = table_entries(self.database, introspect(self.source))
+            fingerprint = catalog_fingerprint(entries)
+            introspected = time.perf_counter()
+            report = {
+                "database": self.database,
+                "tables": len(entries),
+                "fingerprint": fingerprint,
+                "changed": fingerprint != self.fingerprint,
+                "added": 0, "updated": 0, "skipped": len(entries), "removed": 0, "failed": 0,
+                "names": {"added": [], "updated": [], "removed": [], "failed": []},
+            }
+            if report["changed"]:
+                kb = self.knowledge_base
+                result = kb.add_schemas(entries)
+                # Tables whose embedding call failed are stored without a
+                # vector; they count as failed and are embedded again next sync
+                stored = kb.snapshot().by_name
+                failed = [e["name"] for e in entries if not (stored.get(e["name"]) or {}).get("embedding")]
+                names = {status: [n for n in result["names"][status] if n not in failed]
+                         for status in ("added", "updated")}
+                current = {e["name"] for e in entries}
+                removed = [s["name"] for s in list(kb.schemas)
+                           if s.get("source") == self.database and s["name"] not in current]
+                if removed:
+                    kb.delete_schemas(removed)
+                report.update({
+                    "added": len(names["added"]), "updated": len(names["updated"]), "skipped": result["skipped"],
+                    "removed": len(removed), "failed": len(failed),
+                    "names": {**names, "removed": removed, "failed": failed},
+                })
+                if not failed:
+                    self.fingerprint = fingerprint
+            report["introspect_ms"] = round(1000 * (introspected - start), 1)
+            report["total_ms"] = round(1000 * (time.perf_counter() - start), 1)
+            report["synced_at"] = time.time()
+            self.runs += 1
+            self.last_report = report
+            return report
+
+    def run_once(self) -> Dict:
+        """`sync`, recording and logging the outcome."""
+        try:
+            report = self.sync()
+        except Exception as e:
+            self.error = str(e)
+            print(f"Catalog sync of {self.database} failed: {e}")
+            raise
+        self.error = None
+        if report["changed"]:
+            print(f"Catalog {self.database}: {report['added']} added, {report['updated']} updated, "
+                  f"{report['removed']} removed, {report['skipped']} unchanged, {report['failed']} failed")
+        return report
+
+    def _loop(self, sync_first: bool):
+        if not sync_first:
+            self._stop.wait(self.interval_seconds)
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                pass  # recorded in self.error; retried next interval
+            if not self.interval_seconds:
+                return
+            self._stop.wait(self.interval_seconds)
+
+    def start(self, sync_first: bool = True) -> "CatalogSync":
+        self._thread = threading.Thread(
+            target=self._loop, args=(sync_first,), name=f"catalog-sync-{self.database}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> Dict:
+        return {
+            "database": self.database,
+            "interval_seconds": self.interval_seconds,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "runs": self.runs,
+            "error": self.error,
+            "last_sync": self.last_report,
+        }
@@ -0,0 +1,149 @@
+"""
+Circuit breaker around model calls, so a slow or failing Gemini API makes the
+service degrade quickly instead of queueing calls that are doomed to fail.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+
+class CircuitOpenError(Exception):
+    """Raised when a model call is refused because the circuit is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Model temporarily unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of recent model calls and trips open when the share of
+    failed or slow calls in the rolling window reaches `failure_threshold`.
+
+    While open, calls are refused immediately with `CircuitOpenError`. After
+    `cooldown_seconds` the breaker goes half-open and lets a single trial call
+    through; its outcome closes the circuit again or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        window_size: int = 20,
+        min_calls: int = 5,
+        slow_call_seconds: float = 20.0,
+        cooldown_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._outcomes = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _refresh_state(self):
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.cooldown_seconds:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+
+    def _trip(self):
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._trial_in_flight = False
+        self._outcomes.clear()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True when a call made now would be refused."""
+        with self._lock:
+            self._refresh_state()
+            return self._state == self.OPEN or (
+                self._state == self.HALF_OPEN and self._trial_in_flight
+            )
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will let a trial call through."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.cooldown_seconds - (self._clock() - self._opened_at))
+
+    def _acquire(self):
+        with self._lock:
+            self._refresh_state()
+            if self._state == self.OPEN:
+                raise CircuitOpenError(self.cooldown_seconds - (self._clock() - self._opened_at))
+            if self._state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    raise CircuitOpenError(self.cooldown_seconds)
+                self._trial_in_flight = True
+
+    def _record(self, failed: bool):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                if failed:
+                    self._trip()
+                else:
+                    self._state = self.CLOSED
+                    self._trial_in_flight = False
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= self.min_calls:
+                failure_rate = sum(self._outcomes) / len(self._outcomes)
+                if failure_rate >= self.failure_threshold:
+                    self._trip()
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """
+        Run `fn` through the breaker. Exceptions count as failures and are
+        re-raised; calls slower than `slow_call_seconds` succeed but count
+        as failures towards tripping the circuit.
+        """
+        self._acquire()
+        start = self._clock()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._record(failed=True)
+            raise
+        self._record(failed=self._clock() - start >= self.slow_call_seconds)
+        return result
+
+    def status(self) -> dict:
+        """Current breaker state for diagnostics."""
+        with self._lock:
+            self._refresh_state()
+            window = list(self._outcomes)
+            return {
+                "state": self._state,
+                "recent_calls": len(window),
+                "recent_failures": sum(window),
+                "retry_after": (
+                    max(0.0, self.cooldown_seconds - (self._clock() - self._opened_at))
+                    if self._state == self.OPEN else 0.0
+                ),
+            }
+
+
+def call_model(breaker: Optional[CircuitBreaker], fn: Callable, *args, **kwargs):
+    """Call `fn` through `breaker` when one is configured, directly otherwise."""
+    if breaker is None:
+        return fn(*args, **kwargs)
+    return breaker.call(fn, *args, **kwargs)
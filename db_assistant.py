@@ -1,8 +1,14 @@
 """
 Database Assistant - Intelligent schema exploration and conversation
 """
-import google.generativeai as genai
+import json
 import re
+from typing import List, Optional
+from circuit_breaker import CircuitBreaker, CircuitOpenError, call_model
+from genai_client import shared_client
+from metrics import record_tokens, stage
+import index_advisor
+import query_explainer
 
 
 class DatabaseAssistant:
@@ -11,9 +17,30 @@ class DatabaseAssistant:
     analysis, and recommendations without executing actual queries.
     """
     
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    def __init__(
+        self,
+        api_key: str,
+        breaker: Optional[CircuitBreaker] = None,
+        model_name: str = 'gemini-2.0-flash-exp',
+        client=None,
+    ):
+        self.client = client or shared_client(api_key)
+        self.model_name = model_name
+        self.breaker = breaker
+    
+    def _generate(self, prompt: str):
+        """Call the model through the circuit breaker, if one is configured."""
+        with stage("generation"):
+            response = call_model(
+                self.breaker, self.client.models.generate_content, model=self.model_name, contents=prompt
+            )
+        usage = getattr(response, "usage_metadata", None)
+        record_tokens(
+            self.model_name,
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+        )
+        return response
     
     def analyze_schema(self, schema: str, schema_name: str = "database") -> dict:
         """
@@ -37,15 +64,16 @@ Format as valid JSON.
 """
         
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt)
             # Parse JSON from response
-            import json
             text = response.text.strip()
             # Remove markdown code blocks if present
             text = re.sub(r'^```json\s*', '', text)
             text = re.sub(r'\s*```$', '', text)
             analysis = json.loads(text)
             return analysis
+        except CircuitOpenError:
+            raise
         except Exception as e:
             return {
                 "error": str(e),
@@ -79,13 +107,14 @@ Format as valid JSON.
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            import json
+            response = self._generate(prompt)
             text = response.text.strip()
             text = re.sub(r'^```json\s*', '', text)
             text = re.sub(r'\s*```$', '', text)
             description = json.loads(text)
             return description
+        except CircuitOpenError:
+            raise
         except Exception as e:
             return {
                 "error": str(e),
@@ -113,13 +142,14 @@ Format as valid JSON.
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            import json
+            response = self._generate(prompt)
             text = response.text.strip()
             text = re.sub(r'^```json\s*', '', text)
             text = re.sub(r'\s*```$', '', text)
             relationships = json.loads(text)
             return relationships
+        except CircuitOpenError:
+            raise
         except Exception as e:
             return {
                 "error": str(e),
@@ -146,13 +176,14 @@ Format as JSON with a 'queries' array.
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            import json
+            response = self._generate(prompt)
             text = response.text.strip()
             text = re.sub(r'^```json\s*', '', text)
             text = re.sub(r'\s*```$', '', text)
             suggestions = json.loads(text)
             return suggestions
+        except CircuitOpenError:
+            raise
         except Exception as e:
             return {
                 "error": str(e),
@@ -179,13 +210,14 @@ Format as valid JSON with realistic, varied sample data.
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            import json
+            response = self._generate(prompt)
             text = response.text.strip()
             text = re.sub(r'^```json\s*', '', text)
             text = re.sub(r'\s*```$', '', text)
             sample = json.loads(text)
             return sample
+        except CircuitOpenError:
+            raise
         except Exception as e:
             return {
                 "error": str(e),
@@ -193,38 +225,53 @@ Format as valid JSON with realistic, varied sample data.
                 "sample_data": []
             }
     
-    def recommend_indexes(self, schema: str, schema_name: str = "database") -> dict:
+    def recommend_indexes(
+        self,
+        schema: str,
+        schema_name: str = "database",
+        queries: Optional[List[str]] = None,
+        narrate: bool = False,
+        source: str = "query_log",
+    ) -> dict:
         """
-        Recommend indexes based on schema analysis.
+        Recommend indexes from the query workload and foreign keys of a schema.
+        The ranking is computed locally; with `narrate`, the model only
+        rewrites the reasons as prose.
         """
-        prompt = f"""
-You are a database performance expert. Analyze this {schema_name} schema and recommend indexes:
+        with stage("index_advisor"):
+            result = index_advisor.recommend_indexes(schema, queries, schema_name, source=source)
+        if not narrate or not result["recommendations"]:
+            return result
 
-Schema:
-{schema}
+        evidence = [
+            {"index": i, "ddl": r["ddl"], "reason": r["reason"]}
+            for i, r in enumerate(result["recommendations"])
+        ]
+        prompt = f"""
+You are a database performance expert. These indexes were recommended for the {schema_name} schema
+from its query workload. Rewrite each reason as one or two clear sentences for a developer.
+Do not add, remove or change recommendations.
 
-Provide a JSON response with:
-1. recommendations: Array of objects with {{table, column(s), index_type, reason}}
-2. priority: high/medium/low for each recommendation
-3. estimated_impact: Expected performance improvement
+Recommendations:
+{json.dumps(evidence, indent=2)}
 
-Focus on commonly queried columns, foreign keys, and frequent WHERE/JOIN conditions.
-Format as valid JSON.
+Respond with a JSON array of objects with {{index, rationale}}.
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            import json
+            response = self._generate(prompt)
             text = response.text.strip()
             text = re.sub(r'^```json\s*', '', text)
             text = re.sub(r'\s*```$', '', text)
-            indexes = json.loads(text)
-            return indexes
+            for item in json.loads(text):
+                index = item.get("index")
+                if isinstance(index, int) and 0 <= index < len(result["recommendations"]):
+                    result["recommendations"][index]["rationale"] = item.get("rationale", "")
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            return {
-                "error": str(e),
-                "recommendations": []
-            }
+            result["narration_error"] = str(e)
+        return result
     
     def chat_about_schema(self, schema: str, schema_name: str, question: str) -> str:
         """
@@ -243,46 +290,54 @@ Be conversational and educational. If asked about relationships, explain them cl
 If asked about data, provide example structures or sample queries.
 """
         
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            return f"I'm sorry, I encountered an error: {str(e)}"
+        # Model errors propagate, so the route answers 500 and caches nothing
+        response = self._generate(prompt)
+        return response.text.strip()
     
-    def explain_query(self, sql_query: str, schema: str = "") -> dict:
+    def explain_query(self, sql_query: str, schema: str = "", narrate: bool = False) -> dict:
         """
-        Explain what a SQL query does in plain English.
+        Explain what a SQL query does. The breakdown, returned columns and
+        performance notes come from parsing the query locally; with
+        `narrate`, the model rewrites the summary and breakdown as prose.
         """
+        with stage("query_explainer"):
+            explanation = query_explainer.explain_query(sql_query, schema)
+        if not narrate:
+            return explanation
+
+        schema_context = f"Schema Context:\n{schema}" if schema else ""
         prompt = f"""
-You are a database expert. Explain this SQL query in simple terms:
+You are a database expert. Explain this SQL query in simple terms for a developer.
 
 Query:
 {sql_query}
 
-{f"Schema Context:\n{schema}" if schema else ""}
+{schema_context}
+
+A parser has already determined its structure:
+{json.dumps({k: explanation[k] for k in ("steps", "returns", "performance_notes")}, indent=2)}
 
 Provide a JSON response with:
 1. plain_english: What the query does in 1-2 sentences
-2. breakdown: Step by step explanation of each part
-3. returns: What kind of data this query returns
-4. performance_notes: Any performance considerations
+2. breakdown: Step by step explanation of each part, as one paragraph
 
-Format as valid JSON.
+Stay consistent with the parsed structure. Format as valid JSON.
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            import json
+            response = self._generate(prompt)
             text = response.text.strip()
             text = re.sub(r'^```json\s*', '', text)
             text = re.sub(r'\s*```$', '', text)
-            explanation = json.loads(text)
-            return explanation
+            prose = json.loads(text)
+            for key in ("plain_english", "breakdown"):
+                if isinstance(prose.get(key), str) and prose[key].strip():
+                    explanation[key] = prose[key].strip()
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            return {
-                "error": str(e),
-                "plain_english": "Failed to explain query"
-            }
+            explanation["narration_error"] = str(e)
+        return explanation
     
     def generate_dummy_commands(self, schema: str, table_name: str) -> dict:
         """
@@ -305,13 +360,14 @@ Format as valid JSON with properly formatted SQL.
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            import json
+            response = self._generate(prompt)
             text = response.text.strip()
             text = re.sub(r'^```json\s*', '', text)
             text = re.sub(r'\s*```$', '', text)
             commands = json.loads(text)
             return commands
+        except CircuitOpenError:
+            raise
         except Exception as e:
             return {
                 "error": str(e),
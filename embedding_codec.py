@@ -0,0 +1,231 @@
+"""
+Compact storage and scanning of schema embeddings.
+
+A 768-dim embedding kept as a JSON list of floats costs ~15 KB on disk and
+~25 KB as Python objects. Embeddings can instead be stored normalized as
+float16, int8 with a per-vector scale, or sign bits, and are scanned as one
+numpy matrix per dimension. Binary codes are ranked by Hamming distance and
+the best candidates rescored from int8 codes kept alongside them in storage
+(decoded only for the candidates, so they cost no index memory).
+
+    python embedding_codec.py    # memory, scan time and recall per format
+"""
+import base64
+import json
+import math
+import sys
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+FORMATS = ("float32", "float16", "int8", "binary")
+
+# Bits set in each byte value, for Hamming distances over packed codes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+# Rows widened to float32 at a time when scanning float16/int8 matrices
+_SCAN_CHUNK = 4096
+
+
+def normalize(vector) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+def encode(vector: List[float], fmt: str = "float32") -> Union[List[float], Dict]:
+    """
+    Storage form of an embedding. float32 keeps the plain JSON list; the
+    other formats store the normalized vector base64-encoded, binary with
+    int8 codes for rescoring.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown embedding format '{fmt}'")
+    if fmt == "float32" or not len(vector):
+        return [float(x) for x in vector]
+    unit = normalize(vector)
+    stored = {"format": fmt, "dim": len(unit)}
+    if fmt == "float16":
+        data = unit.astype(np.float16).tobytes()
+    else:
+        scale = float(np.abs(unit).max()) / 127 or 1.0
+        stored["scale"] = scale
+        data = np.round(unit / scale).astype(np.int8).tobytes()
+    if fmt == "binary":
+        stored["rerank"] = base64.b64encode(data).decode("ascii")
+        data = np.packbits(unit > 0).tobytes()
+    stored["data"] = base64.b64encode(data).decode("ascii")
+    return stored
+
+
+def stored_format(stored) -> str:
+    return stored["format"] if isinstance(stored, dict) else "float32"
+
+
+def stored_dim(stored) -> int:
+    return stored["dim"] if isinstance(stored, dict) else len(stored or [])
+
+
+def decode(stored) -> np.ndarray:
+    """The normalized float32 vector an embedding approximates."""
+    if not isinstance(stored, dict):
+        return normalize(stored or [])
+    fmt = stored["format"]
+    if fmt == "binary":
+        if "rerank" not in stored:
+            bits = np.unpackbits(np.frombuffer(base64.b64decode(stored["data"]), dtype=np.uint8))
+            return (bits[:stored["dim"]].astype(np.float32) * 2 - 1) / math.sqrt(stored["dim"])
+        data = base64.b64decode(stored["rerank"])
+    else:
+        data = base64.b64decode(stored["data"])
+    if fmt == "float16":
+        return np.frombuffer(data, dtype=np.float16).astype(np.float32)
+    return np.frombuffer(data, dtype=np.int8).astype(np.float32) * stored["scale"]
+
+
+class VectorIndex:
+    """
+    Embeddings held in `fmt` as one matrix per model and dimension, so a
+    query is scored against every compatible entry with a single product.
+    Entries from another model or of another dimension are not compared.
+    """
+
+    def __init__(self, fmt: str = "float32", rerank_factor: int = 10):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown embedding format '{fmt}'")
+        self.fmt = fmt
+        self.rerank_factor = rerank_factor
+        # (model, dim) -> (names, matrix, per-row int8 scales)
+        self._groups: Dict[Tuple, Tuple[List[str], np.ndarray, Optional[np.ndarray]]] = {}
+        # (model, dim) -> stored embeddings, decoded for rescoring binary candidates
+        self._stored: Dict[Tuple, List[object]] = {}
+
+    def build(self, items: List[Tuple[str, object, Optional[str]]]):
+        """Index (name, stored embedding, model) triples, replacing the current contents."""
+        by_key: Dict[Tuple, List[Tuple[str, object]]] = {}
+        for name, stored, model in items:
+            if stored_dim(stored):
+                by_key.setdefault((model, stored_dim(stored)), []).append((name, stored))
+        groups, stored_rows = {}, {}
+        for key, rows in by_key.items():
+            names = [name for name, _ in rows]
+            vectors = np.stack([decode(stored) for _, stored in rows])
+            scales = None
+            if self.fmt == "float32":
+                matrix = vectors
+            elif self.fmt == "float16":
+                matrix = vectors.astype(np.float16)
+            elif self.fmt == "int8":
+                scales = np.abs(vectors).max(axis=1) / 127
+                scales[scales == 0] = 1.0
+                matrix = np.round(vectors / scales[:, None]).astype(np.int8)
+            else:
+                matrix = np.packbits(vectors > 0, axis=1)
+                stored_rows[key] = [stored for _, stored in rows]
+            groups[key] = (names, matrix, scales)
+        self._groups, self._stored = groups, stored_rows
+
+    def __len__(self) -> int:
+        return sum(len(names) for names, _, _ in self._groups.values())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(m.nbytes + (s.nbytes if s is not None else 0) for _, m, s in self._groups.values())
+
+    def search(self, query: List[float], limit: int = 3, model: Optional[str] = None) -> Dict[str, float]:
+        """
+        Estimated cosine similarity of `query` to every entry embedded by
+        `model` at the same dimension. For binary codes the `rerank_factor * limit` nearest by
+        Hamming distance are rescored from their stored int8 codes; the rest
+        keep the Hamming estimate.
+        """
+        q = normalize(query)
+        group = self._groups.get((model, len(q)))
+        if group is None:
+            return {}
+        names, matrix, scales = group
+        if self.fmt == "binary":
+            dim = len(q)
+            distances = _POPCOUNT[np.bitwise_xor(matrix, np.packbits(q > 0))].sum(axis=1, dtype=np.int32)
+            scores = np.cos(np.pi * distances / dim)
+            candidates = np.argpartition(distances, min(len(distances), self.rerank_factor * limit) - 1)
+            candidates = candidates[: self.rerank_factor * limit]
+            stored = self._stored[(model, dim)]
+            scores[candidates] = np.stack([decode(stored[i]) for i in candidates]) @ q
+        else:
+            scores = self._scan(matrix, scales, q)
+        return dict(zip(names, scores.astype(float).tolist()))
+
+    def search_many(self, queries: List[List[float]], limit: int = 3, model: Optional[str] = None) -> List[Dict[str, float]]:
+        """`search` for several queries, scored with one matrix product per dimension."""
+        if self.fmt == "binary":
+            return [self.search(q, limit, model) for q in queries]
+        results: List[Dict[str, float]] = [{} for _ in queries]
+        by_dim: Dict[int, List[int]] = {}
+        for position, query in enumerate(queries):
+            by_dim.setdefault(len(query), []).append(position)
+        for dim, positions in by_dim.items():
+            group = self._groups.get((model, dim))
+            if group is None:
+                continue
+            names, matrix, scales = group
+            scores = self._scan(matrix, scales, np.stack([normalize(queries[p]) for p in positions]).T)
+            for column, position in enumerate(positions):
+                results[position] = dict(zip(names, scores[:, column].astype(float).tolist()))
+        return results
+
+    def _scan(self, matrix: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        """Scores of every row against one query vector or a (dim, n) matrix of them."""
+        if self.fmt == "float32":
+            scores = matrix @ queries
+        else:
+            # numpy has no float16/int8 kernels; widen in cache-sized chunks
+            scores = np.concatenate([
+                matrix[i:i + _SCAN_CHUNK].astype(np.float32) @ queries for i in range(0, len(matrix), _SCAN_CHUNK)
+            ])
+        if scales is not None:
+            scores *= scales.reshape((-1,) + (1,) * (scores.ndim - 1))
+        return scores
+
+
+def main():
+    """Memory, scan time and recall@10 of each format on synthetic embeddings."""
+    rng = np.random.default_rng(0)
+    size, full_dim, queries, k = 10000, 768, 50, 10
+    # Clustered vectors whose variance decays over the dimensions, like a
+    # Matryoshka-trained embedding, so truncation keeps the leading signal
+    decay = np.exp(-np.arange(full_dim) / 250)
+    centers = rng.normal(size=(200, full_dim))
+    base = (centers[rng.integers(0, 200, size)] + rng.normal(scale=0.8, size=(size, full_dim))) * decay
+    picks = rng.integers(0, size, queries)
+    query_vectors = base[picks] + rng.normal(scale=0.8, size=(queries, full_dim)) * decay
+
+    exact = np.stack([normalize(v) for v in base])
+    truth = [set(np.argsort(-(exact @ normalize(q)))[:k]) for q in query_vectors]
+    as_list = [float(x) for x in base[0]]
+    list_bytes = sys.getsizeof(as_list) + sum(sys.getsizeof(x) for x in as_list)
+    print(f"{size} vectors; baseline list of {full_dim} floats: {len(json.dumps(as_list))} B JSON, "
+          f"{list_bytes} B in memory\n")
+    print(f"{'format':<8} {'dim':>4} {'JSON B':>7} {'index B/vec':>11} {'scan p50 ms':>11} {'recall@10':>9}")
+    for dim in (full_dim, 256):
+        # Reduced output dimensionality truncates a Matryoshka embedding
+        vectors = [base[i, :dim] for i in range(size)]
+        for fmt in FORMATS:
+            index = VectorIndex(fmt)
+            index.build([(i, encode(v, fmt), None) for i, v in enumerate(vectors)])
+            recall, timings = 0.0, []
+            for q, expected in zip(query_vectors, truth):
+                start = time.perf_counter()
+                scores = index.search(q[:dim], k)
+                timings.append(time.perf_counter() - start)
+                found = sorted(scores, key=scores.get, reverse=True)[:k]
+                recall += len(expected & set(found)) / k
+            timings.sort()
+            print(f"{fmt:<8} {dim:>4} {len(json.dumps(encode(vectors[0], fmt))):>7} "
+                  f"{index.nbytes // size:>11} {1000 * timings[len(timings) // 2]:>11.2f} "
+                  f"{recall / queries:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
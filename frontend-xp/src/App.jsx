@@ -143,7 +143,8 @@ function App() {
         case 'indexes':
           response = await axios.post('http://localhost:5000/db/recommend-indexes', {
             schema: schemaToUse,
-            schema_name: schemaName
+            schema_name: schemaName,
+            narrate: true
           })
           break
         case 'chat':
@@ -718,7 +719,7 @@ function App() {
                               <strong>{rec.table}</strong>
                             </div>
                             <div>Columns: {Array.isArray(rec.columns) ? rec.columns.join(', ') : rec.columns}</div>
-                            {rec.reason && <p>{rec.reason}</p>}
+                            {(rec.rationale || rec.reason) && <p>{rec.rationale || rec.reason}</p>}
                           </div>
                         ))}
                       </div>
@@ -161,7 +161,8 @@ function App() {
         case 'indexes':
           response = await axios.post('http://localhost:5000/db/recommend-indexes', {
             schema: schemaToUse,
-            schema_name: schemaName
+            schema_name: schemaName,
+            narrate: true
           })
           break
         case 'chat':
@@ -708,7 +709,7 @@ function App() {
                             <strong>Columns:</strong> {Array.isArray(rec.columns) ? rec.columns.join(', ') : rec.columns}
                           </div>
                           {rec.index_type && <div className="index-type">Type: {rec.index_type}</div>}
-                          {rec.reason && <div className="reason">{rec.reason}</div>}
+                          {(rec.rationale || rec.reason) && <div className="reason">{rec.rationale || rec.reason}</div>}
                           {rec.estimated_impact && <div className="impact">Impact: {rec.estimated_impact}</div>}
                         </div>
                       ))}
@@ -0,0 +1,99 @@
+"""
+One google-genai client per API key, shared by the converter, every
+knowledge base and the database assistant.
+
+Each `genai.Client` builds its own SSL context and HTTP connection pool, so
+creating one per component (and per namespace knowledge base) paid for
+both again and opened separate connections to the same host. The shared
+client keeps up to MODEL_POOL_SIZE connections alive for
+MODEL_KEEPALIVE_SECONDS between calls, so sparse traffic skips the TCP and
+TLS handshake that httpx's 5 second default expiry would force.
+
+The SDK takes about half a second to import, so it is imported, and the
+client created, on first use rather than when the app starts.
+
+Keys can arrive per request, so at most MODEL_CLIENTS_MAX clients are
+cached; the least recently used one is closed when another key needs a
+client. A component still holding an evicted client reopens it on its
+next call.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from google import genai
+
+_clients: "OrderedDict[str, SharedClient]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def create_client(api_key: str, pool_size: Optional[int] = None, keepalive_seconds: Optional[float] = None,
+                  base_url: Optional[str] = None) -> "genai.Client":
+    """A client whose connection pool keeps `pool_size` connections alive for `keepalive_seconds`."""
+    import httpx
+    from google import genai
+    from google.genai import types
+
+    pool_size = pool_size or int(os.getenv("MODEL_POOL_SIZE", "32"))
+    if keepalive_seconds is None:
+        keepalive_seconds = float(os.getenv("MODEL_KEEPALIVE_SECONDS", "120"))
+    limits = httpx.Limits(
+        max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=keepalive_seconds
+    )
+    return genai.Client(
+        api_key=api_key, http_options=types.HttpOptions(base_url=base_url, client_args={"limits": limits})
+    )
+
+
+class SharedClient:
+    """Stands in for the `genai.Client` of `api_key`, creating it on first use."""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self) -> "genai.Client":
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = create_client(self.api_key)
+        return self._client
+
+    @property
+    def models(self):
+        return self.get().models
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None and hasattr(client, "close"):
+            client.close()
+
+
+def shared_client(api_key: str) -> SharedClient:
+    """The process-wide client for `api_key`, closing the least recently used one past the limit."""
+    evicted = []
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = SharedClient(api_key)
+            max_clients = max(1, int(os.getenv("MODEL_CLIENTS_MAX", "16")))
+            while len(_clients) > max_clients:
+                evicted.append(_clients.popitem(last=False)[1])
+        else:
+            _clients.move_to_end(api_key)
+    for old in evicted:
+        old.close()
+    return client
+
+
+def close_clients():
+    """Close the shared clients' connections."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -0,0 +1,328 @@
+"""
+Workload-driven index recommendations.
+
+Mines a set of SQL queries for the columns they filter, join, sort and
+group on, combines that with the schema's foreign keys, and ranks index
+candidates by how often they would be used times how selective the
+column is likely to be. Everything here is local; no model call.
+"""
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from schema_parser import parse_schema
+from sql_analysis import analyze_predicate, iter_queries, parse_sql, split_conditions
+
+
+# Weight of one use of a column, by how the use benefits from an index
+USAGE_WEIGHTS = {
+    "equality": 3.0,
+    "join": 2.5,
+    "range": 2.0,
+    "order_by": 1.0,
+    "group_by": 1.0,
+    "foreign_key": 1.5,
+}
+
+
+def estimate_selectivity(column: Dict) -> float:
+    """
+    Rough fraction of rows an index on `column` lets a lookup skip, from its
+    name and type: flags and statuses are poor index keys, ids and unique
+    text are good ones.
+    """
+    name = column["name"].lower()
+    upper = (column.get("type") or "").upper()
+    if column.get("unique") or column.get("primary_key"):
+        return 1.0
+    if "BOOL" in upper or name.startswith(("is_", "has_")):
+        return 0.05
+    if name in ("status", "state", "type", "kind", "category", "gender") or name.endswith(("_status", "_type")):
+        return 0.2
+    if "DATE" in upper or "TIME" in upper or name.endswith(("_at", "_date")):
+        return 0.6
+    if name.endswith("_id") or name == "id":
+        return 0.7
+    if "email" in name or "name" in name or "phone" in name or "code" in name:
+        return 0.9
+    return 0.5
+
+
+def _resolver(query: Dict, tables: Dict[str, Dict]):
+    """A function mapping a (qualifier, column) reference in `query` to (table, column)."""
+    lookup = {name.lower(): table for name, table in tables.items()}
+    visible: Dict[str, Dict] = {}
+    for source in query.get("sources", []) + [j["source"] for j in query.get("joins", [])]:
+        table = lookup.get((source.get("name") or "").lower())
+        if not table or source.get("subquery"):
+            continue
+        visible[table["name"].lower()] = table
+        if source.get("alias"):
+            visible[source["alias"].lower()] = table
+
+    def column_names(table):
+        return {c["name"].lower(): c["name"] for c in table["columns"]}
+
+    def resolve(qualifier: Optional[str], column: str) -> Optional[Tuple[str, str]]:
+        if qualifier:
+            table = visible.get(qualifier.lower())
+            owners = [table] if table else []
+        else:
+            owners = list({id(t): t for t in visible.values()}.values())
+        matches = [(t["name"], column_names(t)[column.lower()]) for t in owners if column.lower() in column_names(t)]
+        return matches[0] if len(matches) == 1 else None
+
+    return resolve
+
+
+def mine_workload(queries: List[str], tables: Dict[str, Dict]) -> Dict:
+    """
+    Count how each schema column is used across `queries`. Returns per-column
+    usage counters, the (equality, range, order) column patterns of each
+    query and table for composite candidates with the role of each pattern
+    column ("equality", "range" or "sort"), and how many queries parsed.
+    """
+    usage: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+    patterns: Counter = Counter()
+    pattern_roles: Dict[Tuple[str, Tuple[str, ...]], Counter] = defaultdict(Counter)
+    query_columns: List[set] = []
+    unparsed = 0
+
+    for sql in queries:
+        try:
+            parsed = parse_sql(sql)
+        except Exception:
+            parsed = None
+        if not parsed or parsed["type"] not in ("select", "insert", "update", "delete"):
+            unparsed += 1
+            continue
+        touched = set()
+        for query in iter_queries(parsed):
+            resolve = _resolver(query, tables)
+            equality: Dict[str, List[str]] = defaultdict(list)
+            ranges: Dict[str, List[str]] = defaultdict(list)
+            ordering: Dict[str, List[str]] = defaultdict(list)
+
+            conditions = split_conditions(query.get("where_tokens") or [])
+            sources = query.get("sources", []) + [j["source"] for j in query.get("joins", [])]
+            for join in query.get("joins", []):
+                conditions += split_conditions(join.get("condition_tokens") or [])
+                for column in join.get("using", []):
+                    for source in sources:
+                        target = resolve(source.get("alias") or source.get("name"), column)
+                        if target and target not in touched:
+                            usage[target]["join"] += 1
+                            touched.add(target)
+
+            for condition in conditions:
+                predicate = analyze_predicate(condition)
+                kind = predicate["kind"]
+                if kind not in ("equality", "range", "join"):
+                    continue
+                for qualifier, column in predicate["indexable_columns"]:
+                    target = resolve(qualifier, column)
+                    if not target:
+                        continue
+                    usage[target][kind] += 1
+                    touched.add(target)
+                    if kind == "equality" and target[1] not in equality[target[0]]:
+                        equality[target[0]].append(target[1])
+                    elif kind == "range" and target[1] not in ranges[target[0]]:
+                        ranges[target[0]].append(target[1])
+
+            for item in query.get("order_by", []):
+                for qualifier, column in item["columns"]:
+                    target = resolve(qualifier, column)
+                    if target:
+                        usage[target]["order_by"] += 1
+                        ordering[target[0]].append(target[1])
+            for ref in query.get("column_refs", []):
+                if ref["clause"] == "group_by":
+                    target = resolve(ref["table"], ref["column"])
+                    if target:
+                        usage[target]["group_by"] += 1
+
+            for table in set(equality) | set(ranges):
+                columns = list(equality.get(table, []))
+                roles = ["equality"] * len(columns)
+                tail = ranges.get(table) or ordering.get(table) or []
+                if tail and tail[0] not in columns:
+                    columns.append(tail[0])
+                    roles.append("range" if ranges.get(table) else "sort")
+                if len(columns) > 1:
+                    key = (table, tuple(columns[:3]))
+                    patterns[key] += 1
+                    pattern_roles[key][tuple(roles[:3])] += 1
+        query_columns.append(touched)
+
+    return {
+        "usage": usage,
+        "patterns": patterns,
+        "pattern_roles": {key: roles.most_common(1)[0][0] for key, roles in pattern_roles.items()},
+        "query_columns": query_columns,
+        "queries_parsed": len(queries) - unparsed,
+        "queries_unparsed": unparsed,
+    }
+
+
+def _reason(counts: Counter, references: Optional[str], selectivity: float) -> str:
+    phrases = []
+    labels = [
+        ("equality", "filtered by equality"),
+        ("range", "filtered by range or prefix"),
+        ("join", "used in joins"),
+        ("order_by", "sorted on"),
+        ("group_by", "grouped on"),
+    ]
+    for key, label in labels:
+        if counts.get(key):
+            phrases.append(f"{label} in {counts[key]} quer{'y' if counts[key] == 1 else 'ies'}")
+    if references:
+        phrases.append(f"foreign key to {references}")
+    level = "high" if selectivity >= 0.7 else "moderate" if selectivity >= 0.4 else "low"
+    text = "; ".join(phrases + [f"{level} estimated selectivity"])
+    return text[:1].upper() + text[1:]
+
+
+def _composite_reason(count: int, columns: List[str], roles: Tuple[str, ...]) -> str:
+    """Rationale of a composite candidate, saying how the workload uses each column."""
+    phrases = []
+    for role, label in (("equality", "equality on"), ("range", "range on"), ("sort", "sorted by")):
+        named = [c for c, r in zip(columns, roles) if r == role]
+        if named:
+            phrases.append(f"{label} {', '.join(named)}")
+    return (
+        f"Composite for {count} quer{'y' if count == 1 else 'ies'}: "
+        f"{', '.join(phrases)}; equality columns lead"
+    )
+
+
+def recommend_indexes(
+    schema: str,
+    queries: Optional[List[str]] = None,
+    schema_name: str = "database",
+    max_recommendations: int = 10,
+    source: str = "query_log",
+) -> Dict:
+    """
+    Rank index candidates for `schema` from the workload in `queries` and the
+    schema's foreign keys. Columns that already lead a primary key or are
+    unique are skipped. Each recommendation carries its score, the usage
+    evidence behind it and the CREATE INDEX statement. `source` says where
+    the queries came from ("query_log" or "request") for the impact text.
+    """
+    tables = parse_schema(schema)
+    queries = queries or []
+    workload = mine_workload(queries, tables)
+    usage = workload["usage"]
+
+    indexed = set()
+    unique = set()  # Equality on these matches at most one row
+    primary_keys: Dict[str, List[str]] = {}
+    columns_by_key: Dict[Tuple[str, str], Dict] = {}
+    references: Dict[Tuple[str, str], str] = {}
+    for table in tables.values():
+        if table["primary_key"]:
+            indexed.add((table["name"], table["primary_key"][0]))
+            primary_keys[table["name"]] = table["primary_key"]
+            if len(table["primary_key"]) == 1:
+                unique.add((table["name"], table["primary_key"][0]))
+        for column in table["columns"]:
+            columns_by_key[(table["name"], column["name"])] = column
+            if column["unique"] and not column["primary_key"]:
+                indexed.add((table["name"], column["name"]))
+                unique.add((table["name"], column["name"]))
+        for fk in table["foreign_keys"]:
+            target = fk["references_table"] + (f".{fk['references_column']}" if fk["references_column"] else "")
+            references[(table["name"], fk["column"])] = target
+
+    candidates = []
+    for key in set(usage) | set(references):
+        if key in indexed or key not in columns_by_key:
+            continue
+        counts = usage.get(key, Counter())
+        selectivity = estimate_selectivity(columns_by_key[key])
+        weight = sum(USAGE_WEIGHTS[kind] * n for kind, n in counts.items())
+        if key in references:
+            weight += USAGE_WEIGHTS["foreign_key"]
+        candidates.append({
+            "table": key[0],
+            "columns": [key[1]],
+            "score": round(weight * selectivity, 2),
+            "reason": _reason(counts, references.get(key), selectivity),
+            "evidence": dict(counts, foreign_key=key in references),
+        })
+
+    def score_composite(table: str, columns: List[str], count: int) -> float:
+        selectivity = max(estimate_selectivity(columns_by_key[(table, c)]) for c in columns)
+        return round(count * USAGE_WEIGHTS["equality"] * len(columns) * selectivity, 2)
+
+    roles_of = workload["pattern_roles"]
+    for (table, columns), count in workload["patterns"].items():
+        # The primary key index already serves a composite that prefixes it
+        if (table, columns[0]) in unique or primary_keys.get(table, [])[:len(columns)] == list(columns):
+            continue
+        candidates.append({
+            "table": table,
+            "columns": list(columns),
+            "score": score_composite(table, list(columns), count),
+            "reason": _composite_reason(count, list(columns), roles_of[(table, columns)]),
+            "evidence": {"queries": count},
+        })
+
+    # A candidate adds nothing over a stronger one on the same table whose
+    # columns it prefixes; a dropped composite's queries count for the wider one
+    kept = []
+    for c in sorted(candidates, key=lambda c: -len(c["columns"])):
+        wider = [
+            o for o in kept
+            if o is not c and o["table"] == c["table"]
+            and o["columns"][:len(c["columns"])] == c["columns"] and o["score"] >= c["score"]
+        ]
+        if not wider:
+            kept.append(c)
+            continue
+        if len(c["columns"]) > 1:
+            target = max(wider, key=lambda o: o["score"])
+            target["evidence"]["queries"] += c["evidence"]["queries"]
+            count = target["evidence"]["queries"]
+            target["score"] = score_composite(target["table"], target["columns"], count)
+            target["reason"] = _composite_reason(
+                count, target["columns"], roles_of[(target["table"], tuple(target["columns"]))]
+            )
+    candidates = kept
+    candidates.sort(key=lambda c: (-c["score"], c["table"], c["columns"]))
+    candidates = [c for c in candidates if c["score"] > 0][:max_recommendations]
+
+    top = candidates[0]["score"] if candidates else 0
+    for candidate in candidates:
+        ratio = candidate["score"] / top if top else 0
+        candidate["priority"] = "high" if ratio >= 0.6 else "medium" if ratio >= 0.25 else "low"
+        candidate["index_type"] = "btree"
+        name = f"idx_{candidate['table']}_{'_'.join(candidate['columns'])}".lower()
+        candidate["ddl"] = f"CREATE INDEX {name} ON {candidate['table']} ({', '.join(candidate['columns'])});"
+
+    leading = {(c["table"], c["columns"][0]) for c in candidates}
+    covered = sum(1 for touched in workload["query_columns"] if touched & leading)
+    described = "logged queries" if source == "query_log" else "queries in the request"
+    if workload["queries_parsed"]:
+        impact = (
+            f"The recommended indexes serve the filters or joins of {covered} of "
+            f"{workload['queries_parsed']} {described} on {schema_name}."
+        )
+    else:
+        impact = (
+            f"No {described} for {schema_name}; recommendations are based on "
+            f"foreign keys only."
+        )
+
+    return {
+        "recommendations": candidates,
+        "estimated_impact": impact,
+        "workload": {
+            "queries_analyzed": workload["queries_parsed"],
+            "queries_unparsed": workload["queries_unparsed"],
+            "queries_served": covered,
+            "source": source,
+        },
+        "already_indexed": sorted(f"{t}.{c}" for t, c in indexed),
+    }
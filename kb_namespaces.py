@@ -0,0 +1,140 @@
+"""
+Per-tenant namespaces of the schema knowledge base.
+
+Each namespace is its own SchemaKnowledgeBase with its own storage file,
+lexical index and vector index, so retrieval for one tenant scans only that
+tenant's schemas, however large the others grow.
+
+    python kb_namespaces.py    # retrieval latency as another tenant grows
+"""
+import os
+import re
+import tempfile
+import threading
+import time
+import types
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_NAMESPACE = "default"
+
+_NAMESPACE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+def validate_namespace(namespace: Optional[str]) -> str:
+    """The namespace to use: `default` when none is given. Raises ValueError if invalid."""
+    if namespace in (None, ""):
+        return DEFAULT_NAMESPACE
+    if not isinstance(namespace, str) or not _NAMESPACE.match(namespace) or ".." in namespace:
+        raise ValueError(
+            "Namespace must be 1-64 letters, digits, '_', '-' or '.', starting with a letter or digit"
+        )
+    return namespace
+
+
+class KnowledgeBaseRegistry:
+    """
+    Knowledge bases by namespace, loaded on first use. The default namespace
+    keeps `default_path` (the original single knowledge base); the others
+    are stored as `<directory>/<namespace>.json`. `factory` builds a
+    knowledge base for a storage path and `on_load` is called with each
+    newly loaded one.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], object],
+        directory: str = "kb_namespaces",
+        default_path: str = "schema_kb.json",
+        on_load: Optional[Callable[[str, object], None]] = None,
+    ):
+        self.factory = factory
+        self.directory = directory
+        self.default_path = default_path
+        self.on_load = on_load
+        self._knowledge_bases: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, namespace: str) -> str:
+        if namespace == DEFAULT_NAMESPACE:
+            return self.default_path
+        return os.path.join(self.directory, f"{namespace}.json")
+
+    def get(self, namespace: Optional[str] = None, create: bool = True):
+        """
+        The knowledge base of `namespace`. With `create=False`, None is
+        returned for a namespace that has never stored anything.
+        """
+        namespace = validate_namespace(namespace)
+        with self._lock:
+            kb = self._knowledge_bases.get(namespace)
+            if kb is not None:
+                return kb
+            path = self.path_for(namespace)
+            if not create and not os.path.exists(path):
+                return None
+            if namespace != DEFAULT_NAMESPACE:
+                os.makedirs(self.directory, exist_ok=True)
+            kb = self.factory(path)
+            self._knowledge_bases[namespace] = kb
+        if self.on_load:
+            self.on_load(namespace, kb)
+        return kb
+
+    def loaded(self) -> Dict[str, object]:
+        """Knowledge bases loaded so far, by namespace."""
+        with self._lock:
+            return dict(self._knowledge_bases)
+
+    def namespaces(self) -> List[str]:
+        """Namespaces loaded or stored on disk."""
+        found = set(self._knowledge_bases)
+        if os.path.exists(self.default_path):
+            found.add(DEFAULT_NAMESPACE)
+        if os.path.isdir(self.directory):
+            found.update(f[:-len(".json")] for f in os.listdir(self.directory) if f.endswith(".json"))
+        return sorted(found)
+
+
+def main():
+    """Retrieval latency of a small tenant while another tenant grows."""
+    from retrieval_benchmark import _LocalEmbeddings
+    from schema_kb import SchemaKnowledgeBase
+
+    def factory(path):
+        return SchemaKnowledgeBase(
+            api_key="local", storage_path=path, client=types.SimpleNamespace(models=_LocalEmbeddings(0))
+        )
+
+    def tables(prefix, i):
+        return f"{prefix}_{i}(\n    id INT PRIMARY KEY,\n    {prefix}_label_{i} VARCHAR(50)\n)"
+
+    with tempfile.TemporaryDirectory() as directory:
+        registry = KnowledgeBaseRegistry(factory, directory, os.path.join(directory, "default.json"))
+        small = registry.get("team_a")
+        small.add_schemas([
+            {"name": f"sales_{i}", "schema": tables("sales", i), "description": "Sales ledger"} for i in range(10)
+        ])
+        other = registry.get("team_b")
+        print(f"{'team_b schemas':>14} {'team_a p50 ms':>13} {'team_b p50 ms':>13}")
+        grown = 0
+        for size in (10, 1000, 10000):
+            other.add_schemas([
+                {"name": f"ops_{i}", "schema": tables("ops", i), "description": "Operations"}
+                for i in range(grown, size)
+            ], batch_size=1000)
+            grown = size
+            timings = {}
+            for name, kb in (("team_a", small), ("team_b", other)):
+                kb.retrieve("sales ledger label", 3, "vector")  # build the vector index
+                samples = []
+                for _ in range(20):
+                    start = time.perf_counter()
+                    kb.retrieve("sales ledger label", 3, "vector")
+                    samples.append(time.perf_counter() - start)
+                samples.sort()
+                timings[name] = 1000 * samples[len(samples) // 2]
+            print(f"{size:>14} {timings['team_a']:>13.2f} {timings['team_b']:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+BM25 lexical index over knowledge-base schemas.
+
+Each schema is indexed by its name, description, table names and column
+names, so questions that name tables or columns directly can be matched
+locally, without an embedding call.
+"""
+import math
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+from schema_graph import terms
+from schema_parser import parse_schema
+
+
+# Table names say more about what a schema is for than column names do
+TABLE_NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 2
+
+
+def schema_terms(name: str, description: str, schema: str) -> List[str]:
+    """The terms a schema is indexed under, repeated by weight."""
+    indexed = terms(name) + DESCRIPTION_WEIGHT * terms(description)
+    for table in parse_schema(schema).values():
+        indexed += TABLE_NAME_WEIGHT * terms(table["name"])
+        for column in table["columns"]:
+            indexed += terms(column["name"])
+    return indexed
+
+
+class BM25Index:
+    """Okapi BM25 over a small, mutable set of documents."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._documents: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        # Terms whose postings this index may modify; None for all. A copy
+        # shares its postings with the original until it changes them.
+        self._owned: Optional[Set[str]] = None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._documents
+
+    def copy(self) -> "BM25Index":
+        """
+        An index to modify while this one keeps being searched. The postings
+        of a term are copied the first time the copy changes them.
+        """
+        index = BM25Index(self.k1, self.b)
+        index._documents = dict(self._documents)
+        index._lengths = dict(self._lengths)
+        index._postings = dict(self._postings)
+        index._owned = set()
+        return index
+
+    def _postings_of(self, term: str) -> Dict[str, int]:
+        """The postings of `term`, to modify."""
+        if self._owned is not None and term not in self._owned:
+            self._owned.add(term)
+            self._postings[term] = dict(self._postings.get(term, {}))
+        return self._postings.setdefault(term, {})
+
+    def add(self, doc_id: str, doc_terms: List[str]):
+        """Index a document, replacing any previous version."""
+        self.remove(doc_id)
+        counts = Counter(doc_terms)
+        self._documents[doc_id] = counts
+        self._lengths[doc_id] = len(doc_terms)
+        for term, count in counts.items():
+            self._postings_of(term)[doc_id] = count
+
+    def remove(self, doc_id: str):
+        counts = self._documents.pop(doc_id, None)
+        if counts is None:
+            return
+        self._lengths.pop(doc_id, None)
+        for term in counts:
+            if term not in self._postings:
+                continue
+            postings = self._postings_of(term)
+            postings.pop(doc_id, None)
+            if not postings:
+                self._postings.pop(term, None)
+
+    def _idf(self, term: str) -> float:
+        n = len(self._postings.get(term, ()))
+        return math.log(1 + (len(self._documents) - n + 0.5) / (n + 0.5))
+
+    def search(self, query_terms: List[str]) -> List[Dict]:
+        """
+        Score every document containing a query term. Returns results best
+        first with the BM25 score and the fraction of distinct query terms
+        the document contains.
+        """
+        if not self._documents:
+            return []
+        wanted = list(dict.fromkeys(query_terms))
+        average = sum(self._lengths.values()) / len(self._lengths) or 1.0
+        scores: Dict[str, float] = {}
+        matched: Dict[str, int] = {}
+        for term in wanted:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[doc_id] = matched.get(doc_id, 0) + 1
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return [
+            {"id": doc_id, "score": score, "coverage": matched[doc_id] / len(wanted)}
+            for doc_id, score in ranked
+        ]
@@ -0,0 +1,249 @@
+"""
+Request, stage and token metrics in the Prometheus text format.
+
+Code times a part of the work with `stage("name")`; each stage feeds a
+latency histogram and, while a request is being timed on the same thread
+(`begin_request`), that request's per-stage totals, which app.py can
+return as a Server-Timing header. Model tokens are counted the same way,
+per model and per request. Gauges are computed when metrics are
+rendered. Stages are also spans of the request's trace (see tracing.py).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import tracing
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIX = "sqlsimplify_"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(n, "") for n in self.labelnames), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help, labelnames, buckets
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    le = _labels(self.labelnames, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """
+    A value read from `callback` at render time: a number, or {label values:
+    number}. `kind="counter"` exposes a total kept elsewhere as a counter.
+    """
+
+    def __init__(self, name: str, help: str, callback: Callable, labelnames: Tuple[str, ...] = (),
+                 kind: str = "gauge"):
+        self.name, self.help, self.callback, self.labelnames, self.kind = name, help, callback, labelnames, kind
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            if value is not None:
+                key = key if isinstance(key, tuple) else (key,)
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(PREFIX + name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(PREFIX + name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, callback: Callable, labelnames: Tuple[str, ...] = (),
+              kind: str = "gauge") -> Gauge:
+        """Register a gauge; registering a name again replaces its callback."""
+        gauge = Gauge(PREFIX + name, help, callback, labelnames, kind)
+        with self._lock:
+            self._metrics[gauge.name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+stage_seconds = REGISTRY.histogram(
+    "stage_duration_seconds", "Time spent in each stage of request handling.", ("stage",)
+)
+llm_tokens = REGISTRY.counter(
+    "llm_tokens_total", "Model tokens from response usage metadata.", ("model", "direction")
+)
+
+
+class RequestStats:
+    """Stage durations and model tokens of one request, from any of its threads."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.tokens: Dict[str, List[int]] = {}  # model -> [input, output]
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def add_tokens(self, model: str, input_tokens: int, output_tokens: int):
+        with self._lock:
+            counts = self.tokens.setdefault(model, [0, 0])
+            counts[0] += input_tokens
+            counts[1] += output_tokens
+
+    def take_tokens(self) -> Dict[str, List[int]]:
+        """The tokens counted so far, resetting the count."""
+        with self._lock:
+            tokens, self.tokens = self.tokens, {}
+            return tokens
+
+
+_current = threading.local()
+
+
+def begin_request() -> RequestStats:
+    """Start collecting stage timings and tokens for the request handled on this thread."""
+    _current.stats = RequestStats()
+    return _current.stats
+
+
+def end_request() -> Optional[RequestStats]:
+    """Detach and return the stats of the request handled on this thread."""
+    stats = getattr(_current, "stats", None)
+    _current.stats = None
+    return stats
+
+
+def current_request() -> Optional[RequestStats]:
+    return getattr(_current, "stats", None)
+
+
+@contextmanager
+def attach_request(stats: Optional[RequestStats]):
+    """Count this thread's stages and tokens in `stats`, e.g. in a worker thread of the request."""
+    previous = getattr(_current, "stats", None)
+    _current.stats = stats
+    try:
+        yield
+    finally:
+        _current.stats = previous
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as stage `name`, and as a span of the active trace."""
+    start = time.perf_counter()
+    try:
+        with tracing.span(name):
+            yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name)
+        stats = getattr(_current, "stats", None)
+        if stats is not None:
+            stats.add_stage(name, elapsed)
+
+
+def record_tokens(model: Optional[str], input_tokens: int, output_tokens: int):
+    model = model or "unknown"
+    llm_tokens.inc(input_tokens, model=model, direction="input")
+    llm_tokens.inc(output_tokens, model=model, direction="output")
+    stats = getattr(_current, "stats", None)
+    if stats is not None:
+        stats.add_tokens(model, input_tokens, output_tokens)
+
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    """A Server-Timing header value, durations in milliseconds."""
+    entries = [f"{name};dur={1000 * seconds:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={1000 * total:.1f}")
+    return ", ".join(entries)
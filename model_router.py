@@ -0,0 +1,178 @@
+"""
+Complexity-based model routing for text-to-SQL generation.
+
+Requests are classified locally, without a model call, and sent to the
+cheapest model tier likely to handle them. With cascading enabled, a
+request is escalated to the next tier only when its SQL fails validation.
+"""
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from schema_parser import parse_schema
+
+
+# Tiers in escalation order
+DEFAULT_ROUTES = [
+    ("simple", "gemini-2.5-flash-lite"),
+    ("moderate", "gemini-2.5-flash"),
+    ("complex", "gemini-2.5-pro"),
+]
+
+# USD per 1M tokens (input, output), used for cost estimates only
+MODEL_PRICING = {
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-exp": (0.10, 0.40),
+}
+
+_JOIN_HINTS = re.compile(
+    r"\b(join|each|every|their|along with|together with|across|between|both|"
+    r"with (?:the|their|its)|for each|per)\b", re.IGNORECASE
+)
+_AGGREGATE_HINTS = re.compile(
+    r"\b(average|avg|total|sum|count|how many|number of|top \d+|most|least|highest|"
+    r"lowest|maximum|minimum|max|min|rank|ranking|group|grouped|percentage|percent|"
+    r"ratio|distribution|trend|cumulative|running)\b", re.IGNORECASE
+)
+_NESTED_HINTS = re.compile(
+    r"\b(than (?:the )?average|above average|below average|never|not any|no \w+ (?:in|with)|"
+    r"without|except|who have not|that have not|more than once|at least \d+|"
+    r"compared to|year over year|month over month|previous|second highest|nth)\b",
+    re.IGNORECASE,
+)
+
+
+class ModelRouter:
+    """
+    Picks a model tier per request from local signals: how many tables the
+    schema context holds, join/aggregation/nesting cues in the question,
+    and the prompt size. Keeps per-route latency, token and cost stats.
+    """
+
+    def __init__(
+        self,
+        routes: Optional[List[Tuple[str, str]]] = None,
+        cascade: bool = True,
+        moderate_threshold: int = 3,
+        complex_threshold: int = 6,
+        latency_window: int = 500,
+    ):
+        self.routes = routes or list(DEFAULT_ROUTES)
+        self.cascade = cascade
+        self.moderate_threshold = moderate_threshold
+        self.complex_threshold = complex_threshold
+        self._latency_window = latency_window
+        self._stats: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def classify(self, nl_query: str, schema: Optional[str], prompt: str = "") -> Dict:
+        """Score a request's complexity and choose the route for it."""
+        table_count = len(parse_schema(schema)) if schema else 0
+        join_hints = len(_JOIN_HINTS.findall(nl_query))
+        aggregate_hints = len(_AGGREGATE_HINTS.findall(nl_query))
+        nested_hints = len(_NESTED_HINTS.findall(nl_query))
+        prompt_tokens = len(prompt) // 4
+
+        score = 0
+        score += min(table_count // 5, 3)
+        score += min(join_hints, 3)
+        score += min(aggregate_hints, 2)
+        score += 2 * min(nested_hints, 2)
+        score += 1 if len(nl_query.split()) > 25 else 0
+        score += 1 if prompt_tokens > 4000 else 0
+
+        if score >= self.complex_threshold:
+            index = 2
+        elif score >= self.moderate_threshold:
+            index = 1
+        else:
+            index = 0
+        index = min(index, len(self.routes) - 1)
+
+        return {
+            "route": self.routes[index][0],
+            "model": self.routes[index][1],
+            "score": score,
+            "signals": {
+                "tables": table_count,
+                "join_hints": join_hints,
+                "aggregate_hints": aggregate_hints,
+                "nested_hints": nested_hints,
+                "prompt_tokens": prompt_tokens,
+            },
+        }
+
+    def plan(self, route: str, cascade: Optional[bool] = None) -> List[Tuple[str, str]]:
+        """The tiers to try for `route`, in order; more than one only when cascading."""
+        names = [name for name, _ in self.routes]
+        start = names.index(route) if route in names else 0
+        use_cascade = self.cascade if cascade is None else cascade
+        return self.routes[start:] if use_cascade else self.routes[start:start + 1]
+
+    def record(
+        self,
+        route: str,
+        model: str,
+        latency: float,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        escalated: bool = False,
+        failed: bool = False,
+        repair: bool = False,
+        error: bool = False,
+    ):
+        """Record the outcome of one model call on a route; `error` means the call raised."""
+        input_price, output_price = MODEL_PRICING.get(model, (0.0, 0.0))
+        cost = (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+        with self._lock:
+            stats = self._stats.setdefault(route, {
+                "model": model,
+                "calls": 0,
+                "escalations": 0,
+                "repairs": 0,
+                "validation_failures": 0,
+                "errors": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "estimated_cost_usd": 0.0,
+                "latencies": deque(maxlen=self._latency_window),
+            })
+            stats["model"] = model
+            stats["calls"] += 1
+            stats["escalations"] += 1 if escalated else 0
+            stats["repairs"] += 1 if repair else 0
+            stats["validation_failures"] += 1 if failed else 0
+            stats["errors"] += 1 if error else 0
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["estimated_cost_usd"] += cost
+            if not error:
+                stats["latencies"].append(latency)
+
+    def stats(self) -> Dict:
+        """Per-route call counts, latency percentiles, tokens and cost."""
+        with self._lock:
+            report = {}
+            for route, stats in self._stats.items():
+                latencies = sorted(stats["latencies"])
+                report[route] = {
+                    key: value for key, value in stats.items() if key != "latencies"
+                }
+                report[route]["estimated_cost_usd"] = round(stats["estimated_cost_usd"], 6)
+                report[route]["latency_ms"] = {
+                    "avg": round(1000 * sum(latencies) / len(latencies), 1) if latencies else 0.0,
+                    "p50": round(1000 * _percentile(latencies, 0.50), 1),
+                    "p95": round(1000 * _percentile(latencies, 0.95), 1),
+                }
+            return report
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
@@ -0,0 +1,314 @@
+"""
+Local explanation of SQL queries from their parsed structure.
+
+Produces the step-by-step breakdown, a description of what the query
+returns, and static performance notes (missing join predicates, SELECT *,
+non-sargable filters, leading-wildcard LIKE) without a model call.
+"""
+from typing import Dict, List, Optional
+
+from schema_parser import parse_schema
+from sql_analysis import (
+    analyze_predicate, iter_queries, leaf_conditions, output_columns, parse_sql, split_conditions
+)
+
+
+def _source_label(source: Dict) -> str:
+    if source.get("subquery"):
+        label = "a subquery"
+    elif source.get("function"):
+        label = f"the function {source['function']}"
+    else:
+        label = source["name"] if not source.get("schema") else f"{source['schema']}.{source['name']}"
+    if source.get("alias") and source.get("alias") != source.get("name"):
+        label += f" (as {source['alias']})"
+    return label
+
+
+def _source_key(source: Dict) -> Optional[str]:
+    key = source.get("alias") or source.get("name")
+    return key.lower() if key else None
+
+
+def _target(parsed: Dict) -> str:
+    target = parsed.get("target")
+    return _source_label(target) if target else "the target table"
+
+
+def _join_phrase(join: Dict) -> str:
+    kind = (join["type"] or "JOIN").upper()
+    if kind == "JOIN":
+        kind = "INNER JOIN"
+    text = f"{kind.title().replace('Join', 'join')} {_source_label(join['source'])}"
+    if join.get("condition"):
+        text += f" on {join['condition']}"
+    elif join.get("using"):
+        text += f" using {', '.join(join['using'])}"
+    return text
+
+
+def _select_columns(query: Dict, tables: Dict[str, Dict]) -> List[str]:
+    """Output column names, expanding * from the schema where possible."""
+    lookup = {name.lower(): table for name, table in tables.items()}
+    sources = query.get("sources", []) + [j["source"] for j in query.get("joins", [])]
+    names = []
+    for item in query.get("select", []):
+        if not item["star"]:
+            names.append(item["alias"] or item["expression"])
+            continue
+        expanded = []
+        for source in sources:
+            if item["star_table"] and _source_key(source) != item["star_table"].lower():
+                continue
+            table = lookup.get((source.get("name") or "").lower())
+            if table and not source.get("subquery"):
+                expanded.extend(c["name"] for c in table["columns"])
+            else:
+                expanded = []
+                break
+        names.extend(expanded or [item["expression"]])
+    return names
+
+
+def _disconnected_sources(query: Dict) -> List[List[str]]:
+    """
+    Groups of FROM/JOIN sources that no join predicate connects; more than
+    one group means a cartesian product.
+    """
+    sources = query.get("sources", []) + [j["source"] for j in query.get("joins", [])]
+    keys = [_source_key(s) for s in sources]
+    if len(keys) < 2 or None in keys:
+        return []
+    parent = {key: key for key in keys}
+
+    def find(key):
+        while parent[key] != key:
+            key = parent[key]
+        return key
+
+    def union(a, b):
+        if a in parent and b in parent:
+            parent[find(a)] = find(b)
+
+    conditions = split_conditions(query.get("where_tokens") or [])
+    for join in query.get("joins", []):
+        conditions += split_conditions(join.get("condition_tokens") or [])
+        kind = (join["type"] or "").upper()
+        # USING/NATURAL join to the tables before them; CROSS JOIN is intentional
+        if join.get("using") or kind.startswith("NATURAL") or kind == "CROSS JOIN":
+            union(keys[0], _source_key(join["source"]))
+    for condition in conditions:
+        qualifiers = {q.lower() for q, _ in analyze_predicate(condition)["columns"] if q}
+        qualifiers = [q for q in qualifiers if q in parent]
+        for other in qualifiers[1:]:
+            union(qualifiers[0], other)
+
+    groups: Dict[str, List[str]] = {}
+    for source, key in zip(sources, keys):
+        groups.setdefault(find(key), []).append(_source_label(source))
+    return list(groups.values()) if len(groups) > 1 else []
+
+
+def performance_notes(parsed: Dict) -> List[Dict]:
+    """Static performance findings for a parsed statement and its subqueries."""
+    notes = []
+
+    def note(kind, severity, message):
+        entry = {"type": kind, "severity": severity, "message": message}
+        if entry not in notes:
+            notes.append(entry)
+
+    if parsed["type"] in ("update", "delete") and not parsed.get("where"):
+        note("missing_where", "high",
+             f"{parsed['type'].upper()} without a WHERE clause affects every row of {_target(parsed)}.")
+
+    for query in iter_queries(parsed):
+        for item in query.get("select", []):
+            if item["star"]:
+                note("select_star", "medium",
+                     f"SELECT {item['expression']} reads every column; list only the columns needed "
+                     f"so covering indexes can be used and less data is transferred.")
+
+        groups = _disconnected_sources(query)
+        if groups:
+            parts = "; ".join(", ".join(group) for group in groups)
+            note("missing_join_predicate", "high",
+                 f"No join condition connects these groups of tables: {parts}. "
+                 f"The result is a cartesian product.")
+        for join in query.get("joins", []):
+            if (join["type"] or "").upper() == "CROSS JOIN":
+                note("cross_join", "low",
+                     f"CROSS JOIN with {_source_label(join['source'])} pairs every row with every row.")
+
+        # Every branch of an OR is checked, not just the AND-ed conditions
+        conditions = [(c, "WHERE") for c in leaf_conditions(query.get("where_tokens") or [])]
+        for join in query.get("joins", []):
+            conditions += [(c, "JOIN") for c in leaf_conditions(join.get("condition_tokens") or [])]
+        for condition, clause in conditions:
+            predicate = analyze_predicate(condition)
+            if predicate["non_sargable_columns"] and predicate["kind"] in ("equality", "range", "like"):
+                columns = ", ".join(
+                    f"{q}.{c}" if q else c for q, c in predicate["non_sargable_columns"]
+                )
+                note("non_sargable_filter", "medium",
+                     f"{clause} condition `{predicate['expression']}` applies a function or arithmetic "
+                     f"to {columns}, so an index on it cannot be used; compare the bare column instead.")
+            if predicate["leading_wildcard"]:
+                note("leading_wildcard_like", "medium",
+                     f"`{predicate['expression']}` starts with a wildcard, which forces a full scan; "
+                     f"consider a prefix match or a full-text index.")
+    return notes
+
+
+def _breakdown(query: Dict, tables: Dict[str, Dict]) -> List[str]:
+    steps = []
+    for cte in query.get("ctes", []):
+        steps.append(f"Defines the common table expression {cte['name']}.")
+        steps.extend("  " + step for step in _breakdown(cte["query"], tables))
+
+    sources = query.get("sources", [])
+    if sources:
+        steps.append("Reads from " + ", ".join(_source_label(s) for s in sources) + ".")
+    for join in query.get("joins", []):
+        steps.append(_join_phrase(join) + ".")
+    if query.get("where"):
+        conditions = split_conditions(query["where_tokens"])
+        if len(conditions) > 1:
+            listed = "; ".join(analyze_predicate(c)["expression"] for c in conditions)
+            steps.append(f"Keeps only rows matching all of: {listed}.")
+        else:
+            steps.append(f"Keeps only rows where {query['where']}.")
+    if query.get("group_by"):
+        steps.append("Groups the rows by " + ", ".join(query["group_by"]) + ".")
+    elif any(item["aggregate"] for item in query.get("select", [])):
+        steps.append("Aggregates all matching rows into a single row.")
+    if query.get("having"):
+        steps.append(f"Keeps only groups where {query['having']}.")
+    if query.get("select"):
+        columns = _select_columns(query, tables)
+        steps.append(
+            ("Returns the distinct values of " if query.get("distinct") else "Returns ")
+            + ", ".join(columns) + "."
+        )
+    for operation in query.get("set_operations", []):
+        steps.append(f"Combines the result with another query using {operation['operator']}:")
+        steps.extend("  " + step for step in _breakdown(operation["query"], tables))
+    if query.get("order_by"):
+        steps.append("Sorts by " + ", ".join(
+            f"{o['expression']} {'descending' if (o['direction'] or '').upper() == 'DESC' else 'ascending'}"
+            for o in query["order_by"]
+        ) + ".")
+    if query.get("limit"):
+        text = f"Returns at most {query['limit']} rows"
+        if query.get("offset"):
+            text += f", skipping the first {query['offset']}"
+        steps.append(text + ".")
+    return steps
+
+
+def _dml_breakdown(parsed: Dict) -> List[str]:
+    kind = parsed["type"]
+    target = _target(parsed)
+    steps = []
+    if kind == "insert":
+        columns = parsed.get("insert_columns") or []
+        steps.append(f"Inserts rows into {target}" + (f" ({', '.join(columns)})" if columns else "") + ".")
+        for query in parsed.get("subqueries", []):
+            steps.append("Takes the rows from a query:")
+            steps.extend("  " + s for s in _breakdown(query, {}))
+    elif kind == "update":
+        assigned = [r["column"] for r in parsed.get("column_refs", []) if r["clause"] == "set"]
+        steps.append(f"Updates {', '.join(assigned) or 'columns'} in {target}.")
+    elif kind == "delete":
+        steps.append(f"Deletes rows from {target}.")
+    if parsed.get("where"):
+        steps.append(f"Only rows where {parsed['where']} are affected.")
+    elif kind in ("update", "delete"):
+        steps.append("Every row is affected (no WHERE clause).")
+    return steps
+
+
+def _returns(parsed: Dict, tables: Dict[str, Dict]) -> str:
+    if parsed["type"] in ("insert", "update", "delete"):
+        return f"No rows; the statement modifies {_target(parsed)}."
+    if parsed["type"] != "select":
+        return "No result set."
+    columns = _select_columns(parsed, tables)
+    if parsed.get("group_by"):
+        shape = f"One row per {', '.join(parsed['group_by'])}"
+    elif any(item["aggregate"] for item in parsed.get("select", [])) and not parsed.get("set_operations"):
+        shape = "A single row"
+    else:
+        shape = "One row per matching record"
+    text = f"{shape} with the columns {', '.join(columns)}"
+    if parsed.get("limit"):
+        text += f" (at most {parsed['limit']} rows)"
+    return text + "."
+
+
+def _plain_english(parsed: Dict) -> str:
+    kind = parsed["type"]
+    if kind in ("insert", "update", "delete"):
+        verb = {"insert": "Inserts rows into", "update": "Updates rows in", "delete": "Deletes rows from"}[kind]
+        text = f"{verb} {_target(parsed)}"
+        return text + (f" where {parsed['where']}." if parsed.get("where") else ".")
+    if kind != "select":
+        return f"A {kind.upper()} statement."
+
+    tables = [s["name"] for s in parsed.get("sources", []) if s.get("name")]
+    joined = [j["source"]["name"] for j in parsed.get("joins", []) if j["source"].get("name")]
+    selected = [item["alias"] or item["expression"] for item in parsed.get("select", [])]
+    text = "Selects " + (", ".join(selected) or "nothing")
+    if tables:
+        text += " from " + ", ".join(tables)
+    if joined:
+        text += " joined with " + ", ".join(joined)
+    clauses = []
+    if parsed.get("where"):
+        count = len(split_conditions(parsed["where_tokens"]))
+        clauses.append(f"filtered by {count} condition{'s' if count != 1 else ''}")
+    if parsed.get("group_by"):
+        clauses.append("grouped by " + ", ".join(parsed["group_by"]))
+    if parsed.get("order_by"):
+        clauses.append("sorted by " + ", ".join(o["expression"] for o in parsed["order_by"]))
+    if parsed.get("limit"):
+        clauses.append(f"limited to {parsed['limit']} rows")
+    if clauses:
+        text += ", " + ", ".join(clauses)
+    return text + "."
+
+
+def explain_query(sql_query: str, schema: str = "") -> Dict:
+    """
+    Explain a SQL statement from its parsed structure. Returns the same
+    `plain_english`, `breakdown`, `returns` and `performance_notes` text
+    fields as the model-based explanation, plus the structured `steps`,
+    `tables`, `columns` and `issues` they were built from.
+    """
+    parsed = parse_sql(sql_query)
+    tables = parse_schema(schema) if schema else {}
+
+    if parsed["type"] == "select":
+        steps = _breakdown(parsed, tables)
+    else:
+        steps = _dml_breakdown(parsed)
+    issues = performance_notes(parsed)
+
+    referenced = []
+    for query in iter_queries(parsed):
+        for source in query.get("sources", []) + [j["source"] for j in query.get("joins", [])]:
+            if source.get("name") and source["name"] not in referenced:
+                referenced.append(source["name"])
+    cte_names = {c["name"] for q in iter_queries(parsed) for c in q.get("ctes", [])}
+
+    return {
+        "plain_english": _plain_english(parsed),
+        "breakdown": " ".join(f"{i}. {step.strip()}" for i, step in enumerate(steps, 1)),
+        "returns": _returns(parsed, tables),
+        "performance_notes": " ".join(n["message"] for n in issues) or "No issues found by static analysis.",
+        "statement_type": parsed["type"],
+        "steps": steps,
+        "tables": [t for t in referenced if t not in cte_names],
+        "columns": output_columns(parsed) or (_select_columns(parsed, tables) if parsed["type"] == "select" else []),
+        "issues": issues,
+    }
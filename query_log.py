@@ -0,0 +1,145 @@
+"""
+Append-only log of the SQL generated per schema.
+
+The log is the workload the index advisor mines: every valid query
+`/convert` produces is recorded under the schema it was generated for.
+Once the file holds more than `compact_factor` times the queries kept in
+memory, it is rewritten with just the retained window.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+class QueryLog:
+    """
+    Per-schema ring buffers of generated SQL, persisted as JSON lines so the
+    workload survives restarts.
+    """
+
+    def __init__(self, storage_path: str = "query_log.jsonl", max_per_schema: int = 5000,
+                 compact_factor: float = 2.0):
+        self.storage_path = storage_path
+        self.max_per_schema = max_per_schema
+        self.compact_factor = compact_factor
+        # schema key -> deque of logged entries ({"schema", "sql", "ts"})
+        self._queries: Dict[str, deque] = {}
+        # Lines in the file as last read or written, plus this process's appends
+        self._lines = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def key_for_schema(schema: str) -> str:
+        """Log key for a schema that was passed inline rather than by name."""
+        return "sha256:" + hashlib.sha256((schema or "").encode("utf-8")).hexdigest()[:16]
+
+    def load(self):
+        """Load logged queries from disk, compacting the file if it has outgrown the window."""
+        with self._lock, self._storage_lock():
+            self._read()
+            if self._needs_compaction():
+                self._compact()
+
+    def _read(self):
+        """Replace the buffers with the file's contents, skipping unreadable lines."""
+        self._queries = {}
+        self._lines = 0
+        if not os.path.exists(self.storage_path):
+            return
+        with open(self.storage_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._lines += 1
+                try:
+                    entry = json.loads(line)
+                    self._buffer(entry["schema"]).append(
+                        {"schema": entry["schema"], "sql": entry["sql"], "ts": entry.get("ts")}
+                    )
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    continue
+
+    def _buffer(self, schema_key: str) -> deque:
+        if schema_key not in self._queries:
+            self._queries[schema_key] = deque(maxlen=self.max_per_schema)
+        return self._queries[schema_key]
+
+    @contextmanager
+    def _storage_lock(self):
+        """Exclusive access to the log file across processes, where fcntl is available."""
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(self.storage_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _needs_compaction(self) -> bool:
+        retained = sum(len(entries) for entries in self._queries.values())
+        return self._lines > self.compact_factor * max(retained, 1)
+
+    def _compact(self):
+        """
+        Rewrite the file with only the retained entries. The file is re-read
+        first so entries other processes appended are kept; callers hold
+        both locks.
+        """
+        self._read()
+        entries = sorted(
+            (entry for buffer in self._queries.values() for entry in buffer),
+            key=lambda entry: entry["ts"] or 0,
+        )
+        directory = os.path.dirname(os.path.abspath(self.storage_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.storage_path) + ".", suffix=".tmp",
+                                        dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.storage_path)
+        except OSError as e:
+            print(f"Error compacting query log: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._lines = len(entries)
+
+    def record(self, schema_key: str, sql: str):
+        """Log one generated query under `schema_key`."""
+        if not schema_key or not sql or not sql.strip():
+            return
+        entry = {"schema": schema_key, "sql": sql.strip(), "ts": round(time.time(), 3)}
+        with self._lock:
+            self._buffer(schema_key).append(entry)
+            try:
+                with self._storage_lock():
+                    with open(self.storage_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(entry) + "\n")
+                    self._lines += 1
+                    if self._needs_compaction():
+                        self._compact()
+            except OSError as e:
+                print(f"Error writing query log: {e}")
+
+    def queries(self, *schema_keys: str) -> List[str]:
+        """The logged queries for the given schema keys, oldest first."""
+        with self._lock:
+            result = []
+            for key in schema_keys:
+                result.extend(entry["sql"] for entry in self._queries.get(key, ()))
+            return result
+
+    def counts(self) -> Dict[str, int]:
+        """Number of logged queries per schema key."""
+        with self._lock:
+            return {key: len(queries) for key, queries in self._queries.items()}
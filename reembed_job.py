@@ -0,0 +1,109 @@
+"""
+Background re-embedding of the schema knowledge base.
+
+Switching embedding model or dimension makes the stored vectors useless to
+compare against new queries. The job embeds the knowledge base with the new
+model in batches, staging each vector next to the one in use, so queries
+keep being served from the old vectors until every entry is done. Staged
+vectors are saved after each batch, so a restarted job resumes where the
+last one stopped.
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+from circuit_breaker import CircuitOpenError
+
+
+class ReembedJob:
+    """Re-embeds a SchemaKnowledgeBase with `model` on a daemon thread."""
+
+    def __init__(
+        self,
+        knowledge_base,
+        model: str,
+        dimensions: Optional[int] = None,
+        batch_size: int = 16,
+        retry_seconds: float = 30.0,
+        max_retries: int = 5,
+    ):
+        self.knowledge_base = knowledge_base
+        self.model = model
+        self.dimensions = dimensions
+        self.batch_size = batch_size
+        self.retry_seconds = retry_seconds
+        self.max_retries = max_retries
+        self.state = "pending"
+        self.total = 0
+        self.done = 0
+        self.batches = 0
+        self.retries = 0
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ReembedJob":
+        self._thread = threading.Thread(target=self.run, name="reembed", daemon=True)
+        self._thread.start()
+        return self
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def run(self):
+        """Embed pending entries batch by batch, then switch the knowledge base over."""
+        kb = self.knowledge_base
+        self.state, self.started_at = "running", time.time()
+        pending = kb.pending_reembedding(self.model, self.dimensions)
+        self.total = len(pending)
+        print(f"Re-embedding {self.total} schemas with {self.model}")
+        failures = 0
+        while True:
+            if not pending:
+                if kb.apply_reembedding(self.model, self.dimensions):
+                    break
+                # Schemas added meanwhile were embedded with the old model
+                pending = kb.pending_reembedding(self.model, self.dimensions)
+                self.total = self.done + len(pending)
+                continue
+            batch = pending[:self.batch_size]
+            try:
+                vectors = kb.embed([text for _, text in batch], self.model, self.dimensions)
+            except Exception as e:
+                failures += 1
+                self.retries += 1
+                self.error = str(e)
+                if failures > self.max_retries:
+                    self.state, self.finished_at = "failed", time.time()
+                    print(f"Re-embedding stopped after {self.done}/{self.total}: {e}")
+                    return
+                self.state = "retrying"
+                wait = e.retry_after if isinstance(e, CircuitOpenError) else self.retry_seconds
+                time.sleep(wait)
+                continue
+            failures = 0
+            self.state, self.error = "running", None
+            kb.stage_embeddings([(name, text, v) for (name, text), v in zip(batch, vectors)], self.model)
+            pending = pending[len(batch):]
+            self.done += len(batch)
+            self.batches += 1
+        self.state, self.finished_at = "completed", time.time()
+        print(f"Re-embedded {self.done} schemas with {self.model}")
+
+    def status(self) -> Dict:
+        """Progress of the job."""
+        end = self.finished_at or time.time()
+        return {
+            "state": self.state,
+            "model": self.model,
+            "dimensions": self.dimensions,
+            "total": self.total,
+            "done": self.done,
+            "remaining": max(0, self.total - self.done),
+            "progress": round(self.done / self.total, 3) if self.total else 1.0,
+            "batches": self.batches,
+            "retries": self.retries,
+            "error": self.error,
+            "elapsed_seconds": round(end - self.started_at, 1) if self.started_at else 0.0,
+        }
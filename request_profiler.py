@@ -0,0 +1,132 @@
+"""
+On-demand cProfile of live requests.
+
+An admin arms the profiler for the next N requests or for a time window.
+Requests are profiled one at a time (others meanwhile run unprofiled, as
+only one profiler can be active per process on newer Pythons) and their
+statistics merged. When the run is over the merged profile is written
+to `directory` as a `.prof` file for pstats or snakeviz, with a text
+summary of the top functions next to it.
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class RequestProfiler:
+    def __init__(self, directory: str = "profiles", top: int = 40):
+        self.directory = directory
+        self.top = top
+        self._lock = threading.Lock()
+        self._active = threading.Lock()  # held by the request being profiled
+        self._run: Optional[Dict] = None
+        self._stats: Optional[pstats.Stats] = None
+        self.last_dump: Optional[Dict] = None
+
+    def arm(self, requests: Optional[int] = None, seconds: Optional[float] = None,
+            endpoint: Optional[str] = None) -> Dict:
+        """Profile the next `requests` requests, or those in the next `seconds`, optionally of one endpoint."""
+        if not requests and not seconds:
+            raise ValueError("Give 'requests' or 'seconds' to profile")
+        with self._lock:
+            if self._run is not None:
+                raise ValueError("A profiling run is already in progress")
+            self._run = {
+                "requests": int(requests) if requests else None,
+                "until": time.time() + float(seconds) if seconds else None,
+                "endpoint": endpoint,
+                "profiled": 0,
+                "skipped": 0,
+                "started_at": time.time(),
+            }
+            self._stats = None
+        return self.status()
+
+    def _expired(self) -> bool:
+        run = self._run
+        return run is not None and (
+            (run["requests"] is not None and run["profiled"] >= run["requests"])
+            or (run["until"] is not None and time.time() >= run["until"])
+        )
+
+    def start(self, endpoint: Optional[str]) -> Optional[cProfile.Profile]:
+        """A running profiler for this request, or None if it is not to be profiled."""
+        with self._lock:
+            run = self._run
+            if run is None or (run["endpoint"] and endpoint != run["endpoint"]):
+                return None
+            if self._expired():
+                self._dump()
+                return None
+            if not self._active.acquire(blocking=False):
+                run["skipped"] += 1
+                return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) is active
+            self._active.release()
+            return None
+        return profile
+
+    def stop(self, profile: cProfile.Profile):
+        profile.disable()
+        self._active.release()
+        with self._lock:
+            if self._run is None:
+                return
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self._run["profiled"] += 1
+            if self._expired():
+                self._dump()
+
+    def _dump(self):
+        """Write the merged profile and end the run. Called with the lock held."""
+        run, stats = self._run, self._stats
+        self._run, self._stats = None, None
+        if stats is None:
+            self.last_dump = {"profiled": 0, "path": None, "finished_at": time.time()}
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime("profile-%Y%m%d-%H%M%S") + f"-{run['profiled']}req")
+        stats.dump_stats(path + ".prof")
+        summary = io.StringIO()
+        pstats.Stats(path + ".prof", stream=summary).sort_stats("cumulative").print_stats(self.top)
+        with open(path + ".txt", "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        self.last_dump = {
+            "profiled": run["profiled"],
+            "skipped": run["skipped"],
+            "endpoint": run["endpoint"],
+            "path": path + ".prof",
+            "summary_path": path + ".txt",
+            "finished_at": time.time(),
+        }
+        print(f"Profile of {run['profiled']} requests written to {path}.prof")
+
+    def stop_run(self) -> Dict:
+        """End the current run now, dumping what was collected."""
+        with self._lock:
+            if self._run is not None:
+                self._dump()
+        return self.status()
+
+    def status(self) -> Dict:
+        with self._lock:
+            if self._expired():
+                self._dump()
+            run = dict(self._run) if self._run else None
+        return {"running": run is not None, "run": run, "last_dump": self.last_dump, "dumps": self.dumps()}
+
+    def dumps(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f for f in os.listdir(self.directory) if f.endswith(".prof"))
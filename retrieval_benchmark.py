@@ -0,0 +1,116 @@
+"""
+Retrieval benchmark on the seed schemas: how often the BM25 index answers
+without an embedding call, the latency that saves, and top-1 accuracy and
+MRR of lexical, vector and hybrid retrieval. "skip ok" is the share of
+questions answered without an embedding whose top match was right.
+
+Uses the Gemini embedding API when GEMINI_API_KEY is set. Otherwise
+embeddings come from a local bag-of-words hash with EMBED_LATENCY_MS of
+simulated latency, which measures the skip rate and latency honestly but
+makes the vector quality numbers a stand-in only. EMBEDDING_FORMAT selects
+how embeddings are stored.
+
+    python retrieval_benchmark.py
+"""
+import hashlib
+import os
+import tempfile
+import time
+import types
+from typing import Dict, List
+
+import numpy as np
+
+from schema_kb import SchemaKnowledgeBase
+from seed_data import SAMPLE_SCHEMAS
+
+
+# (question, schema that answers it)
+QUESTIONS = [
+    ("Show all users who registered in the last 30 days", "ecommerce_db"),
+    ("Find all orders over $500 with customer details", "ecommerce_db"),
+    ("Top 10 products by sales", "ecommerce_db"),
+    ("Which products have the best average review rating?", "ecommerce_db"),
+    ("Total payments by payment method this month", "ecommerce_db"),
+    ("Items left in shopping carts", "ecommerce_db"),
+    ("What do customers buy most often?", "ecommerce_db"),
+    ("List employees in IT department earning above average", "company_hr_db"),
+    ("Employees assigned to more than two projects", "company_hr_db"),
+    ("Average salary per department", "company_hr_db"),
+    ("Who manages the most people?", "company_hr_db"),
+    ("Staff hired in 2023 with their job titles", "company_hr_db"),
+    ("Get students with GPA above 3.5 enrolled this year", "school_management_db"),
+    ("Courses taught by each teacher", "school_management_db"),
+    ("Average grade per course", "school_management_db"),
+    ("Attendance rate of each class", "school_management_db"),
+    ("Which pupils failed an exam last term?", "school_management_db"),
+    ("Find appointments for next week with doctor names", "hospital_db"),
+    ("Patients admitted to the cardiology ward", "hospital_db"),
+    ("Unpaid bills per patient", "hospital_db"),
+    ("Prescriptions written by each doctor", "hospital_db"),
+    ("Who is sick and being treated right now?", "hospital_db"),
+]
+
+
+def _hash_embedding(text: str, dim: int = 768) -> List[float]:
+    vector = np.zeros(dim)
+    for word in "".join(c.lower() if c.isalnum() else " " for c in text).split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % dim] += 1
+    return list(vector)
+
+
+class _LocalEmbeddings:
+    """Stands in for `client.models` when no API key is configured."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def embed_content(self, model, contents, config=None):
+        time.sleep(self.latency)
+        texts = contents if isinstance(contents, list) else [contents]
+        return types.SimpleNamespace(embeddings=[types.SimpleNamespace(values=_hash_embedding(t)) for t in texts])
+
+
+def _rank(results: List[Dict], expected: str) -> int:
+    names = [r["name"] for r in results]
+    return names.index(expected) + 1 if expected in names else 0
+
+
+def main():
+    api_key = os.getenv("GEMINI_API_KEY")
+    latency = float(os.getenv("EMBED_LATENCY_MS", "150")) / 1000
+    with tempfile.TemporaryDirectory() as directory:
+        kb = SchemaKnowledgeBase(
+            api_key=api_key or "local",
+            storage_path=os.path.join(directory, "kb.json"),
+            embedding_format=os.getenv("EMBEDDING_FORMAT", "float32"),
+            client=None if api_key else types.SimpleNamespace(models=_LocalEmbeddings(latency)),
+        )
+        if not api_key:
+            print(f"No GEMINI_API_KEY: local hash embeddings, {latency * 1000:.0f} ms simulated latency")
+        for sample in SAMPLE_SCHEMAS:
+            kb.add_schema(sample["name"], sample["schema"], sample["description"])
+
+        print(f"{len(QUESTIONS)} questions over {len(SAMPLE_SCHEMAS)} seed schemas\n")
+        print(f"{'mode':<8} {'top-1':>6} {'MRR':>6} {'skipped':>8} {'skip ok':>8} {'mean ms':>8} {'p50 ms':>7}")
+        for mode in ("vector", "lexical", "hybrid"):
+            hits, reciprocal, skipped, skipped_hits, timings = 0, 0.0, 0, 0, []
+            for question, expected in QUESTIONS:
+                start = time.perf_counter()
+                ranked = kb.retrieve(question, top_k=len(SAMPLE_SCHEMAS), mode=mode)
+                timings.append(time.perf_counter() - start)
+                rank = _rank(ranked["results"], expected)
+                hits += rank == 1
+                reciprocal += 1 / rank if rank else 0.0
+                skipped += ranked["embedding_skipped"]
+                skipped_hits += ranked["embedding_skipped"] and rank == 1
+            timings.sort()
+            print(
+                f"{mode:<8} {hits / len(QUESTIONS):>6.2f} {reciprocal / len(QUESTIONS):>6.2f} "
+                f"{skipped:>4}/{len(QUESTIONS):<3} {skipped_hits / skipped if skipped else 0.0:>8.2f} "
+                f"{1000 * sum(timings) / len(timings):>8.1f} {1000 * timings[len(timings) // 2]:>7.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
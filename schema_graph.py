@@ -0,0 +1,243 @@
+"""
+Foreign-key graph of a schema and join-path pruning.
+
+For schemas too large to send whole, the tables a question mentions are
+matched lexically and connected through the foreign-key graph with a
+Steiner-tree approximation, so the prompt holds exactly the matched
+tables plus the bridge tables needed to join them.
+"""
+import random
+import re
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from schema_parser import parse_schema, render_table
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "at", "to", "by", "with", "and", "or",
+    "all", "any", "each", "every", "per", "from", "who", "what", "which", "that", "their",
+    "is", "are", "was", "were", "be", "have", "has", "had", "how", "many", "much", "show",
+    "list", "get", "find", "give", "me", "top", "than", "more", "less", "most", "id", "ids",
+    "name", "names", "number", "count", "total", "average", "last", "first", "this",
+}
+
+
+def _stem(word: str) -> str:
+    """Crude singular form so `orders` matches `order` and `categories` `category`."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def terms(text: str) -> List[str]:
+    """Lower-cased, stemmed terms of a question or identifier, minus stopwords."""
+    words = _WORD.findall((text or "").replace("_", " ").lower())
+    return [_stem(w) for w in words if w not in _STOPWORDS]
+
+
+class SchemaGraph:
+    """
+    Undirected graph of tables joined by foreign keys. Edges keep the
+    foreign-key columns so a connecting subgraph can report its joins.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, str] = {}
+        self.adjacency: Dict[str, Dict[str, List[Dict]]] = {}
+
+    @classmethod
+    def from_tables(cls, tables: Dict[str, Dict]) -> "SchemaGraph":
+        """Build the graph from `parse_schema` output."""
+        graph = cls()
+        for table in tables.values():
+            graph.add_table(table["name"])
+        for table in tables.values():
+            for fk in table["foreign_keys"]:
+                graph.add_foreign_key(table["name"], fk["column"], fk["references_table"], fk["references_column"])
+        return graph
+
+    def add_table(self, name: str):
+        key = name.lower()
+        self.tables.setdefault(key, name)
+        self.adjacency.setdefault(key, {})
+
+    def add_foreign_key(self, table: str, column: str, ref_table: str, ref_column: Optional[str]):
+        source, target = table.lower(), ref_table.lower()
+        if source == target or target not in self.tables:
+            return
+        edge = {"table": self.tables[source], "column": column,
+                "references_table": self.tables[target], "references_column": ref_column}
+        self.adjacency[source].setdefault(target, []).append(edge)
+        self.adjacency[target].setdefault(source, []).append(edge)
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def edge_count(self) -> int:
+        return sum(len(n) for n in self.adjacency.values()) // 2
+
+    def _nearest_terminal(self, tree: set, remaining: set) -> Optional[List[str]]:
+        """Shortest path from any tree table to the closest remaining terminal."""
+        parents = {node: None for node in tree}
+        queue = deque(tree)
+        while queue:
+            node = queue.popleft()
+            if node in remaining:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                return path[::-1]
+            for neighbor in self.adjacency[node]:
+                if neighbor not in parents:
+                    parents[neighbor] = node
+                    queue.append(neighbor)
+        return None
+
+    def connecting_subgraph(self, terminals: List[str]) -> Dict:
+        """
+        Approximate the minimal set of tables connecting `terminals` (the
+        shortest-path Steiner heuristic: grow a tree from the first terminal,
+        repeatedly attaching the nearest remaining one). Terminals in other
+        components start a new tree and are reported as disconnected.
+        Returns the tables in the order added, the bridge tables and the
+        foreign-key joins along the tree.
+        """
+        wanted = [t.lower() for t in terminals if t and t.lower() in self.tables]
+        wanted = list(dict.fromkeys(wanted))
+        result = {"tables": [], "terminals": [self.tables[t] for t in wanted],
+                  "bridges": [], "joins": [], "disconnected": []}
+        if not wanted:
+            return result
+
+        order = [wanted[0]]
+        tree = {wanted[0]}
+        remaining = set(wanted[1:])
+        joins = []
+        while remaining:
+            path = self._nearest_terminal(tree, remaining)
+            if path is None:
+                seed = next(t for t in wanted if t in remaining)
+                result["disconnected"].append(self.tables[seed])
+                tree.add(seed)
+                order.append(seed)
+                remaining.discard(seed)
+                continue
+            for a, b in zip(path, path[1:]):
+                joins.append(self.adjacency[a][b][0])
+                if b not in tree:
+                    tree.add(b)
+                    order.append(b)
+            remaining.discard(path[-1])
+
+        result["tables"] = [self.tables[t] for t in order]
+        terminal_set = set(wanted)
+        result["bridges"] = [self.tables[t] for t in order if t not in terminal_set]
+        result["joins"] = joins
+        return result
+
+
+def table_terms(tables: Dict[str, Dict]) -> List[Tuple[str, Set[str], Set[str]]]:
+    """Per table: its name, the terms of its name, and the terms of its column names."""
+    return [
+        (table["name"], set(terms(table["name"])), {t for c in table["columns"] for t in terms(c["name"])})
+        for table in tables.values()
+    ]
+
+
+def match_tables(question: str, index: List[Tuple[str, Set[str], Set[str]]], limit: int = 8) -> List[str]:
+    """
+    Tables a question refers to, by term overlap with table names (strong)
+    and column names (weak), best first. `index` comes from `table_terms`.
+    """
+    wanted = set(terms(question))
+    if not wanted:
+        return []
+    scored = []
+    for position, (name, name_terms, column_terms) in enumerate(index):
+        score = 3 * len(wanted & name_terms) + len((wanted - name_terms) & column_terms)
+        if score >= 2:
+            scored.append((-score, position, name))
+    scored.sort()
+    return [name for _, _, name in scored[:limit]]
+
+
+def prune_schema(
+    schema: str,
+    question: str,
+    tables: Optional[Dict[str, Dict]] = None,
+    graph: Optional[SchemaGraph] = None,
+    index: Optional[List[Tuple[str, Set[str], Set[str]]]] = None,
+    max_matched: int = 8,
+) -> Optional[Dict]:
+    """
+    Reduce `schema` to the tables `question` matches plus the bridge tables
+    joining them. The parsed tables, graph and term index can be passed in
+    when cached. Returns the pruned schema text and what was kept, or None
+    when nothing matched (the caller should keep the whole schema).
+    """
+    tables = tables if tables is not None else parse_schema(schema)
+    matched = match_tables(question, index if index is not None else table_terms(tables), max_matched)
+    if not matched:
+        return None
+    graph = graph or SchemaGraph.from_tables(tables)
+    subgraph = graph.connecting_subgraph(matched)
+    by_key = {name.lower(): table for name, table in tables.items()}
+    return {
+        "schema": "\n\n".join(render_table(by_key[t.lower()]) for t in subgraph["tables"]),
+        "total_tables": len(tables),
+        "tables": subgraph["tables"],
+        "matched": subgraph["terminals"],
+        "bridges": subgraph["bridges"],
+        "joins": subgraph["joins"],
+        "disconnected": subgraph["disconnected"],
+    }
+
+
+def main():
+    """Time graph construction and pruning on synthetic schemas."""
+    for size in (1000, 10000, 50000):
+        rng = random.Random(size)
+        lines = []
+        for i in range(size):
+            columns = [f"t{i}_id INT PRIMARY KEY", f"label_{i} VARCHAR(50)"]
+            for target in rng.sample(range(i), min(i, rng.randint(1, 3))):
+                columns.append(f"t{target}_ref INT REFERENCES table_{target}(t{target}_id)")
+            lines.append(f"table_{i}(\n    " + ",\n    ".join(columns) + "\n)")
+        schema = "\n\n".join(lines)
+
+        start = time.perf_counter()
+        tables = parse_schema(schema)
+        parsed = time.perf_counter()
+        graph = SchemaGraph.from_tables(tables)
+        built = time.perf_counter()
+        index = table_terms(tables)
+        indexed = time.perf_counter()
+        timings = []
+        for _ in range(20):
+            terminals = [f"table_{rng.randrange(size)}" for _ in range(5)]
+            query_start = time.perf_counter()
+            subgraph = graph.connecting_subgraph(terminals)
+            timings.append(time.perf_counter() - query_start)
+        timings.sort()
+        prune_start = time.perf_counter()
+        prune_schema(schema, "labels of table 7 and table 42", tables, graph, index)
+        pruned = time.perf_counter()
+        print(
+            f"{size:>6} tables, {graph.edge_count():>6} FKs: parse {1000 * (parsed - start):8.1f} ms, "
+            f"graph {1000 * (built - parsed):7.1f} ms, term index {1000 * (indexed - built):7.1f} ms, "
+            f"prune {1000 * (pruned - prune_start):6.1f} ms, 5-table subgraph p50 "
+            f"{1000 * timings[len(timings) // 2]:6.2f} ms / max {1000 * timings[-1]:6.2f} ms "
+            f"({len(subgraph['tables'])} tables kept)"
+        )
+
+
+if __name__ == "__main__":
+    main()
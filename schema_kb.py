@@ -1,40 +1,440 @@
+import hashlib
 import json
 import os
-from typing import List, Dict, Tuple
-from google import genai
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Dict, Tuple, Optional
 import numpy as np
+from circuit_breaker import CircuitBreaker, CircuitOpenError, call_model
+from genai_client import shared_client
+from schema_parser import parse_schema
+import schema_graph
+from lexical_index import BM25Index, schema_terms
+from embedding_codec import VectorIndex, decode, encode, stored_dim, stored_format
+from metrics import stage
+
+
+# Model of entries stored before the model was recorded per entry
+DEFAULT_EMBEDDING_MODEL = "models/text-embedding-004"
+
+
+def _embed_config(dimensions: Optional[int]):
+    """Embedding request options; the SDK is imported here, on first use, not at startup."""
+    if not dimensions:
+        return None
+    from google.genai import types
+
+    return types.EmbedContentConfig(output_dimensionality=dimensions)
+
+
+def select_relevant(
+    results: List[Dict],
+    min_score: float = 0.0,
+    max_gap: Optional[float] = None,
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Split ranked retrieval results into the schemas worth sending and the
+    ones to drop. After the best match, a schema is kept only if it scores
+    at least `min_score` and no more than `max_gap` below the best. The best
+    match is always kept so the model has some context.
+    """
+    if not results:
+        return [], []
+    best = results[0]["relevance_score"]
+    kept, dropped = [results[0]], []
+    for result in results[1:]:
+        score = result["relevance_score"]
+        if score < min_score:
+            dropped.append({**result, "reason": f"score {score:.3f} below minimum {min_score:.3f}"})
+        elif max_gap is not None and best - score > max_gap:
+            dropped.append({**result, "reason": f"score {score:.3f} is {best - score:.3f} below the best match"})
+        else:
+            kept.append(result)
+    return kept, dropped
+
+
+def context_block(schema: Dict) -> str:
+    """How a retrieved schema appears in the prompt."""
+    return f"-- {schema['name']}: {schema['description']}\n{schema['schema']}"
+
+
+def schema_context(retrieved_schemas: List[Dict], selected_schema: Optional[str] = None) -> Optional[str]:
+    """The schema text sent to the model for the knowledge-base schemas used."""
+    if selected_schema and retrieved_schemas:
+        return retrieved_schemas[0]['schema']
+    if not retrieved_schemas:
+        return None
+    return "\n\n".join([context_block(s) for s in retrieved_schemas])
+
+
+def prune_context(
+    nl_query: str,
+    retrieved_schemas: List[Dict],
+    manual_schema: Optional[str],
+    prune: Optional[bool],
+    knowledge_base: Optional["SchemaKnowledgeBase"] = None,
+    min_tables: int = 25,
+) -> Tuple[List[Dict], Optional[str], List[Dict]]:
+    """
+    Prune large schemas to the tables the question needs. `prune` is None
+    for automatic (schemas of `min_tables` or more), or a bool to
+    force it on or off. Returns the schemas to put in the prompt, the
+    pruned manual schema, and a report of what was dropped.
+    """
+    report = []
+    if prune is False:
+        return retrieved_schemas, manual_schema, report
+
+    def pruned(name, table_count, prune_fn):
+        if prune is None and table_count < min_tables:
+            return None
+        result = prune_fn()
+        if not result or len(result['tables']) >= result['total_tables']:
+            return None
+        report.append({
+            "schema": name,
+            "total_tables": result['total_tables'],
+            "included_tables": result['tables'],
+            "matched_tables": result['matched'],
+            "bridge_tables": result['bridges'],
+        })
+        return result['schema']
+
+    if manual_schema:
+        tables = parse_schema(manual_schema)
+        text = pruned(None, len(tables), lambda: schema_graph.prune_schema(manual_schema, nl_query, tables))
+        return retrieved_schemas, text or manual_schema, report
+
+    context = []
+    for s in retrieved_schemas:
+        structure = knowledge_base.schema_structure(s['name']) if knowledge_base else None
+        if structure is None:
+            context.append(s)
+            continue
+        text = pruned(
+            s['name'], len(structure['tables']),
+            lambda: knowledge_base.prune_schema(s['name'], nl_query)
+        )
+        context.append({**s, 'schema': text} if text else s)
+    return context, manual_schema, report
+
+
+class KnowledgeBaseSnapshot:
+    """
+    The schemas of a knowledge base and their indexes at one point in time.
+    A published snapshot is never modified: writers build a new one and swap
+    it in, so readers need no lock and always see a consistent state.
+    """
+
+    def __init__(self, schemas: List[Dict], lexical_index: BM25Index, embedding_format: str,
+                 embedding_model: str, embedding_dimensions: Optional[int]):
+        self.schemas: Tuple[Dict, ...] = tuple(schemas)
+        self.by_name: Dict[str, Dict] = {s["name"]: s for s in self.schemas}
+        self.lexical_index = lexical_index
+        self.embedding_format = embedding_format
+        self.embedding_model = embedding_model
+        self.embedding_dimensions = embedding_dimensions
+        self._vector_index: Optional[VectorIndex] = None
+        self._lock = threading.Lock()
+
+    def vector_index(self) -> VectorIndex:
+        """The vector index, built by the first query that needs it."""
+        index = self._vector_index
+        if index is None:
+            with self._lock:
+                if self._vector_index is None:
+                    with stage("vector_index_build"):
+                        index = VectorIndex(self.embedding_format)
+                        index.build([
+                            (s["name"], s["embedding"], s.get("embedding_model", DEFAULT_EMBEDDING_MODEL))
+                            for s in self.schemas
+                        ])
+                    self._vector_index = index
+                index = self._vector_index
+        return index
+
+    @property
+    def vector_index_bytes(self) -> int:
+        return self._vector_index.nbytes if self._vector_index is not None else 0
 
 
 class SchemaKnowledgeBase:
     """
     Knowledge Base for storing and retrieving database schemas using RAG.
+
+    Reads use the current KnowledgeBaseSnapshot without locking. Writes are
+    serialized (across processes too, where file locks are available),
+    start from the latest stored state, save atomically and then publish a
+    new snapshot. Every `reload_seconds` a read checks whether another
+    process changed the storage file, and if so it is reloaded in the
+    background.
     """
     
-    def __init__(self, api_key: str, storage_path: str = "schema_kb.json"):
-        self.client = genai.Client(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        storage_path: str = "schema_kb.json",
+        breaker: Optional[CircuitBreaker] = None,
+        lexical_margin: float = 2.0,
+        lexical_coverage: float = 0.5,
+        vector_weight: float = 0.7,
+        embedding_format: str = "float32",
+        embedding_dimensions: Optional[int] = None,
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+        client=None,
+        reload_seconds: float = 2.0,
+    ):
+        self.client = client or shared_client(api_key)
         self.storage_path = storage_path
-        self.schemas: List[Dict] = []
+        self.breaker = breaker
+        # Embeddings are stored as float32 lists, float16, int8 or binary
+        # codes (see embedding_codec), optionally at a reduced dimension.
+        # Each entry records its model and dimension; if most entries were
+        # embedded differently from the configured model, queries keep
+        # using theirs and `reembed_target` holds the configured one until
+        # a ReembedJob has moved the knowledge base over.
+        self.embedding_format = embedding_format
+        self.embedding_model = embedding_model
+        self.embedding_dimensions = embedding_dimensions
+        self._configured = {"model": embedding_model, "dimensions": embedding_dimensions}
+        # A model chosen through /kb/reembed, saved with the storage file so
+        # a restart keeps it; it is dropped once the configured model changes
+        self._chosen: Optional[Dict] = None
+        self.reembed_target: Optional[Dict] = None
+        # Serializes writers in this process; _storage_lock across processes
+        self.lock = threading.RLock()
+        # A lexical match is trusted without an embedding call when it scores
+        # `lexical_margin` times the runner-up and covers `lexical_coverage`
+        # of the question's terms; otherwise scores are fused with
+        # `vector_weight` on the cosine similarity.
+        self.lexical_margin = lexical_margin
+        self.lexical_coverage = lexical_coverage
+        self.vector_weight = vector_weight
+        self.retrieval_counts = {"lexical": 0, "hybrid": 0, "vector": 0, "lexical_fallback": 0}
+        # name -> (schema text, parsed tables / FK graph / term index)
+        self._structures: Dict[str, Tuple[str, Dict]] = {}
+        self.reload_seconds = reload_seconds
+        self._next_check = time.monotonic() + reload_seconds
+        self._reloading = threading.Lock()
+        # (mtime, size, inode) of the storage file as last read or written
+        self._signature: Optional[Tuple] = None
+        self._snapshot = self._new_snapshot([], BM25Index())
         self.load_schemas()
     
+    @property
+    def schemas(self) -> Tuple[Dict, ...]:
+        return self.snapshot().schemas
+    
+    def snapshot(self) -> KnowledgeBaseSnapshot:
+        """The current snapshot; starts a reload if another process changed the storage file."""
+        if self.reload_seconds and time.monotonic() >= self._next_check:
+            self._next_check = time.monotonic() + self.reload_seconds
+            if self._file_signature() != self._signature and self._reloading.acquire(blocking=False):
+                threading.Thread(target=self._reload, name="kb-reload", daemon=True).start()
+        return self._snapshot
+    
+    def _reload(self):
+        try:
+            with self.lock, self._storage_lock():
+                if self._file_signature() != self._signature:
+                    self._load()
+                    print(f"Reloaded {len(self._snapshot.schemas)} schemas changed on disk in {self.storage_path}")
+        except Exception as e:
+            print(f"Reloading {self.storage_path} failed: {e}")
+        finally:
+            self._reloading.release()
+    
+    def _file_signature(self, stat: Optional[os.stat_result] = None) -> Optional[Tuple]:
+        try:
+            stat = stat or os.stat(self.storage_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+    
+    @contextmanager
+    def _storage_lock(self):
+        """Exclusive access to the storage file across processes, where fcntl is available."""
+        try:
+            import fcntl
+        except ImportError:
+            # Writers are then serialized within this process only
+            yield
+            return
+        with open(self.storage_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    @contextmanager
+    def _writing(self):
+        """Serialized write access, starting from the latest stored state."""
+        with self.lock, self._storage_lock():
+            if self._file_signature() != self._signature:
+                self._load()
+            yield self._snapshot
+    
+    def _new_snapshot(self, schemas: List[Dict], lexical_index: BM25Index) -> KnowledgeBaseSnapshot:
+        return KnowledgeBaseSnapshot(
+            schemas, lexical_index, self.embedding_format, self.embedding_model, self.embedding_dimensions
+        )
+    
+    def _publish(self, schemas: List[Dict], lexical_index: BM25Index):
+        """Save `schemas` and make them the snapshot readers use."""
+        self._save(schemas)
+        self._snapshot = self._new_snapshot(schemas, lexical_index)
+    
     def load_schemas(self):
         """Load schemas from disk."""
+        with self.lock, self._storage_lock():
+            self._load()
+    
+    def _load(self):
+        """Read the storage file and publish it as a new snapshot. Called with the write locks held."""
+        schemas, signature, chosen = [], None, None
         if os.path.exists(self.storage_path):
-            with open(self.storage_path, 'r', encoding='utf-8') as f:
-                self.schemas = json.load(f)
+            with open(self.storage_path, 'r', encoding='utf-8') as f, stage("kb_json_parse"):
+                signature = self._file_signature(os.fstat(f.fileno()))
+                schemas = json.load(f)
+            if isinstance(schemas, dict):
+                chosen, schemas = schemas.get("embedding_choice"), schemas["schemas"]
+        self._chosen = chosen if chosen and chosen.get("configured") == self._configured else None
+        converted = 0
+        for entry in schemas:
+            if entry["embedding"] and stored_format(entry["embedding"]) != self.embedding_format:
+                entry["embedding"] = encode(decode(entry["embedding"]).tolist(), self.embedding_format)
+                converted += 1
+        self._select_serving_embedding(schemas)
+        lexical_index = BM25Index()
+        with stage("kb_lexical_index"):
+            for entry in schemas:
+                lexical_index.add(entry["name"], self._terms(entry))
+        self._signature = signature
+        if converted:
+            print(f"Converted {converted} embeddings to {self.embedding_format}")
+            self._publish(schemas, lexical_index)
+        else:
+            self._snapshot = self._new_snapshot(schemas, lexical_index)
+        self._structures.clear()
+    
+    def _select_serving_embedding(self, schemas: List[Dict]):
+        """
+        Keep querying with the model most entries were embedded with, and
+        set `reembed_target` if any entry differs from the configured one
+        (or from the one chosen through /kb/reembed).
+        """
+        target = ({"model": self._chosen["model"], "dimensions": self._chosen["dimensions"]}
+                  if self._chosen else dict(self._configured))
+        embedded = Counter()
+        for entry in schemas:
+            entry.setdefault("embedding_model", DEFAULT_EMBEDDING_MODEL)
+            entry.setdefault("embedding_dim", stored_dim(entry["embedding"]))
+            entry.setdefault("content_hash", self.content_hash(entry))
+            if entry["embedding"]:
+                embedded[(entry["embedding_model"], entry["embedding_dim"])] += 1
+        pending = self._pending(schemas, target["model"], target["dimensions"])
+        self.reembed_target = target if pending else None
+        self.embedding_model, self.embedding_dimensions = target["model"], target["dimensions"]
+        if not embedded:
+            return
+        (model, dim), _ = embedded.most_common(1)[0]
+        if model == target["model"] and (not target["dimensions"] or dim == target["dimensions"]):
+            return
+        self.embedding_model, self.embedding_dimensions = model, dim
+        print(
+            f"Serving embeddings from {model} ({dim} dims) until re-embedded with "
+            f"{target['model']} ({target['dimensions'] or 'default'} dims)"
+        )
+    
+    @staticmethod
+    def embedding_text(entry: Dict) -> str:
+        """The text a schema is embedded from."""
+        return f"{entry['name']}\n{entry['description']}\n{entry['schema']}"
+    
+    @classmethod
+    def content_hash(cls, entry: Dict) -> str:
+        """Hash of the text a schema is embedded from."""
+        return hashlib.sha256(cls.embedding_text(entry).encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _terms(entry: Dict) -> List[str]:
+        return schema_terms(entry["name"], entry["description"], entry["schema"])
+    
+    def _vector_scores(self, snapshot: KnowledgeBaseSnapshot, query_embedding: List[float],
+                       top_k: int) -> Dict[str, float]:
+        """Similarity of the query to every stored embedding of its model and dimension."""
+        index = snapshot.vector_index()
+        with stage("vector_scan"):
+            return index.search(query_embedding, top_k, snapshot.embedding_model)
+    
+    def _vector_scores_many(self, snapshot: KnowledgeBaseSnapshot, query_embeddings: List[List[float]],
+                            top_k: int) -> List[Dict[str, float]]:
+        index = snapshot.vector_index()
+        with stage("vector_scan"):
+            return index.search_many(query_embeddings, top_k, snapshot.embedding_model)
     
     def save_schemas(self):
         """Save schemas to disk."""
-        with open(self.storage_path, 'w', encoding='utf-8') as f:
-            json.dump(self.schemas, f, indent=2)
+        with self.lock, self._storage_lock():
+            self._save(list(self._snapshot.schemas))
     
-    def get_embedding(self, text: str) -> List[float]:
-        """Get embedding for text using Gemini API."""
+    def _save(self, schemas: List[Dict]):
+        """
+        Write `schemas` to a temporary file and rename it over the storage
+        file, so a crash leaves either the old or the new file, never half of one.
+        """
+        directory = os.path.dirname(os.path.abspath(self.storage_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.storage_path) + ".", suffix=".tmp",
+                                        dir=directory)
         try:
-            result = self.client.models.embed_content(
-                model='models/text-embedding-004',
-                content=text
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                # A plain list unless a model was chosen, as before that existed
+                data = {"embedding_choice": self._chosen, "schemas": schemas} if self._chosen else schemas
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(self.storage_path):
+                shutil.copymode(self.storage_path, tmp_path)
+            os.replace(tmp_path, self.storage_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._signature = self._file_signature()
+    
+    def embed(self, contents: List[str], model: str, dimensions: Optional[int] = None) -> List[List[float]]:
+        """Embed several texts with one API call. Errors are raised."""
+        with stage("embedding"):
+            result = call_model(
+                self.breaker,
+                self.client.models.embed_content,
+                model=model,
+                contents=contents,
+                config=_embed_config(dimensions)
             )
+        return [e.values for e in result.embeddings]
+    
+    def get_embedding(self, text: str, model: Optional[str] = None, dimensions: Optional[int] = None) -> List[float]:
+        """Get embedding for text using Gemini API, with the serving model unless one is given."""
+        if model is None:
+            model, dimensions = self.embedding_model, self.embedding_dimensions
+        try:
+            with stage("embedding"):
+                result = call_model(
+                    self.breaker,
+                    self.client.models.embed_content,
+                    model=model,
+                    contents=text,
+                    config=_embed_config(dimensions)
+                )
             return result.embeddings[0].values
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print(f"Error getting embedding: {e}")
             return []
@@ -47,37 +447,197 @@ class SchemaKnowledgeBase:
         b_np = np.array(b)
         return float(np.dot(a_np, b_np) / (np.linalg.norm(a_np) * np.linalg.norm(b_np)))
     
-    def add_schema(self, name: str, schema: str, description: str = ""):
-        """Add a new schema to the knowledge base."""
-        # Create embedding for schema + description
-        text_to_embed = f"{name}\n{description}\n{schema}"
-        embedding = self.get_embedding(text_to_embed)
-        
+    def _is_current(self, entry: Dict) -> bool:
+        """Whether `entry` is stored unchanged, with an embedding queries can use."""
+        stored = self.snapshot().by_name.get(entry["name"])
+        return (
+            stored is not None
+            and stored.get("content_hash") == entry["content_hash"]
+            and self._embedded_with(stored, self.embedding_model, self.embedding_dimensions)
+        )
+    
+    def _with_embedding(self, entry: Dict, embedding: List[float]) -> Dict:
+        entry.update({
+            "embedding": encode(embedding, self.embedding_format),
+            "embedding_model": self.embedding_model,
+            "embedding_dim": len(embedding),
+        })
+        return entry
+    
+    def _store(self, entries: List[Dict]) -> Dict[str, str]:
+        """Insert or replace entries by name and save once. Returns name -> "added"/"updated"."""
+        outcome = {}
+        if not entries:
+            return outcome
+        with self._writing() as snapshot:
+            schemas = list(snapshot.schemas)
+            positions = {s["name"]: i for i, s in enumerate(schemas)}
+            lexical_index = snapshot.lexical_index.copy()
+            for entry in entries:
+                lexical_index.add(entry["name"], self._terms(entry))
+                # Check if schema with same name exists, update if so
+                if entry["name"] in positions:
+                    schemas[positions[entry["name"]]] = entry
+                    outcome[entry["name"]] = "updated"
+                else:
+                    positions[entry["name"]] = len(schemas)
+                    schemas.append(entry)
+                    outcome[entry["name"]] = "added"
+            self._publish(schemas, lexical_index)
+        return outcome
+    
+    def add_schema(self, name: str, schema: str, description: str = "") -> str:
+        """
+        Add a new schema to the knowledge base. Returns "added", "updated",
+        or "skipped" when the same content is already stored and embedded.
+        """
         schema_entry = {
             "name": name,
             "schema": schema,
             "description": description,
-            "embedding": embedding
         }
+        schema_entry["content_hash"] = self.content_hash(schema_entry)
+        if self._is_current(schema_entry):
+            return "skipped"
         
-        # Check if schema with same name exists, update if so
-        for i, s in enumerate(self.schemas):
-            if s["name"] == name:
-                self.schemas[i] = schema_entry
-                self.save_schemas()
-                return
+        # Create embedding for schema + description
+        embedding = self.get_embedding(self.embedding_text(schema_entry))
+        return self._store([self._with_embedding(schema_entry, embedding)])[name]
+    
+    def add_schemas(self, schemas: List[Dict], batch_size: int = 32) -> Dict:
+        """
+        Add or update many schemas ({name, schema, description, source}), embedding
+        only new and changed ones, `batch_size` per API call, and saving
+        once. Returns the counts and names added, updated and skipped.
+        """
+        entries, skipped = {}, []
+        for item in schemas:
+            entry = {"name": item["name"], "schema": item["schema"], "description": item.get("description", "")}
+            entry["content_hash"] = self.content_hash(entry)
+            if item.get("source"):
+                # Where the schema came from, e.g. the database a catalog sync read
+                entry["source"] = item["source"]
+            if self._is_current(entry):
+                skipped.append(entry["name"])
+            else:
+                entries[entry["name"]] = entry
+        
+        changed = list(entries.values())
+        for start in range(0, len(changed), batch_size):
+            batch = changed[start:start + batch_size]
+            try:
+                vectors = self.embed(
+                    [self.embedding_text(e) for e in batch], self.embedding_model, self.embedding_dimensions
+                )
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                print(f"Error getting embeddings: {e}")
+                vectors = [[] for _ in batch]
+            for entry, vector in zip(batch, vectors):
+                self._with_embedding(entry, vector)
         
-        self.schemas.append(schema_entry)
-        self.save_schemas()
+        outcome = self._store(changed)
+        names = {status: [n for n, s in outcome.items() if s == status] for status in ("added", "updated")}
+        names["skipped"] = skipped
+        return {
+            **{status: len(found) for status, found in names.items()},
+            "names": names,
+        }
     
     def delete_schema(self, name: str) -> bool:
         """Delete a schema by name."""
-        for i, s in enumerate(self.schemas):
-            if s["name"] == name:
-                self.schemas.pop(i)
-                self.save_schemas()
-                return True
-        return False
+        return self.delete_schemas([name]) == 1
+    
+    def delete_schemas(self, names: List[str]) -> int:
+        """Delete schemas by name, saving once. Returns how many were deleted."""
+        with self._writing() as snapshot:
+            found = {name for name in names if name in snapshot.by_name}
+            if not found:
+                return 0
+            schemas = [s for s in snapshot.schemas if s["name"] not in found]
+            lexical_index = snapshot.lexical_index.copy()
+            for name in found:
+                lexical_index.remove(name)
+                self._structures.pop(name, None)
+            self._publish(schemas, lexical_index)
+            return len(found)
+    
+    @staticmethod
+    def _embedded_with(embedded: Dict, model: str, dimensions: Optional[int]) -> bool:
+        return (
+            embedded.get("embedding_model", DEFAULT_EMBEDDING_MODEL) == model
+            and bool(embedded.get("embedding"))
+            and (not dimensions or stored_dim(embedded["embedding"]) == dimensions)
+        )
+    
+    @classmethod
+    def _pending(cls, schemas, model: str, dimensions: Optional[int]) -> List[Tuple[str, str]]:
+        return [
+            (s["name"], cls.embedding_text(s)) for s in schemas
+            if not cls._embedded_with(s, model, dimensions)
+            and not cls._embedded_with(s.get("next_embedding", {}), model, dimensions)
+        ]
+    
+    def pending_reembedding(self, model: str, dimensions: Optional[int] = None) -> List[Tuple[str, str]]:
+        """(name, text) of entries neither embedded nor staged with `model`."""
+        return self._pending(self.snapshot().schemas, model, dimensions)
+    
+    def stage_embeddings(self, embedded: List[Tuple[str, str, List[float]]], model: str):
+        """
+        Store new embeddings next to the ones in use, so queries keep using
+        the old vectors and a restarted job can skip what is done. An entry
+        whose text changed since it was embedded is left pending.
+        """
+        with self._writing() as snapshot:
+            staged = {}
+            for name, text, vector in embedded:
+                entry = snapshot.by_name.get(name)
+                if entry is not None and self.embedding_text(entry) == text:
+                    staged[name] = {
+                        "embedding": encode(vector, self.embedding_format),
+                        "embedding_model": model,
+                        "embedding_dim": len(vector),
+                    }
+            schemas = [{**s, "next_embedding": staged[s["name"]]} if s["name"] in staged else s
+                       for s in snapshot.schemas]
+            self._publish(schemas, snapshot.lexical_index)
+    
+    def _choose(self, model: str, dimensions: Optional[int]):
+        target = {"model": model, "dimensions": dimensions}
+        self._chosen = None if target == self._configured else {**target, "configured": dict(self._configured)}
+
+    def choose_embedding(self, model: str, dimensions: Optional[int] = None):
+        """
+        Record `model` as the one to move to, overriding the configured model
+        across restarts until that configuration changes.
+        """
+        with self._writing() as snapshot:
+            self._choose(model, dimensions)
+            pending = self._pending(snapshot.schemas, model, dimensions)
+            self.reembed_target = {"model": model, "dimensions": dimensions} if pending else None
+            self._publish(list(snapshot.schemas), snapshot.lexical_index)
+
+    def apply_reembedding(self, model: str, dimensions: Optional[int] = None) -> bool:
+        """
+        Switch queries and stored entries to `model` once every entry has
+        been embedded with it. Returns False while some are still pending.
+        """
+        with self._writing() as snapshot:
+            if self._pending(snapshot.schemas, model, dimensions):
+                return False
+            schemas = []
+            for entry in snapshot.schemas:
+                entry = dict(entry)
+                staged = entry.pop("next_embedding", None)
+                if staged and not self._embedded_with(entry, model, dimensions):
+                    entry.update(staged)
+                schemas.append(entry)
+            self.embedding_model, self.embedding_dimensions = model, dimensions
+            self._choose(model, dimensions)
+            self.reembed_target = None
+            self._publish(schemas, snapshot.lexical_index)
+            return True
     
     def list_schemas(self) -> List[Dict]:
         """List all schemas (without embeddings for efficiency)."""
@@ -87,48 +647,175 @@ class SchemaKnowledgeBase:
                 "description": s["description"],
                 "schema": s["schema"]
             }
-            for s in self.schemas
+            for s in self.snapshot().schemas
         ]
     
     def retrieve_relevant_schemas(self, query: str, top_k: int = 3) -> List[Dict]:
         """
         Retrieve the most relevant schemas for a given query using RAG.
         """
-        if not self.schemas:
-            return []
-        
-        # Get query embedding
-        query_embedding = self.get_embedding(query)
-        if not query_embedding:
-            return []
+        return self.retrieve(query, top_k)["results"]
+    
+    def _lexical_match(self, lexical: List[Dict]) -> bool:
+        """Whether the best lexical match is clear enough to skip embedding."""
+        if not lexical or lexical[0]["coverage"] < self.lexical_coverage:
+            return False
+        runner_up = lexical[1]["score"] if len(lexical) > 1 else 0.0
+        return lexical[0]["score"] >= self.lexical_margin * runner_up
+    
+    def _lexical(self, snapshot: KnowledgeBaseSnapshot, query: str, mode: str) -> Tuple[List[Dict], Dict[str, float]]:
+        """BM25 hits for `query`, and their scores normalized by the best one."""
+        with stage("lexical"):
+            lexical = snapshot.lexical_index.search(schema_graph.terms(query)) if mode != "vector" else []
+        best_lexical = lexical[0]["score"] if lexical else 0.0
+        return lexical, ({r["id"]: r["score"] / best_lexical for r in lexical} if best_lexical else {})
+    
+    def _needs_embedding(self, lexical: List[Dict], mode: str) -> bool:
+        return mode == "vector" or (mode == "hybrid" and not self._lexical_match(lexical))
+    
+    def retrieve(self, query: str, top_k: int = 3, mode: str = "hybrid") -> Dict:
+        """
+        Rank schemas for `query`. In "hybrid" mode a BM25 match over table
+        names, column names and descriptions that clearly beats the rest is
+        returned without an embedding call; otherwise BM25 and cosine scores
+        are fused. "lexical" and "vector" use one signal only. Returns the
+        results, the mode actually used and whether the embedding was skipped.
+        """
+        if mode not in ("hybrid", "lexical", "vector"):
+            raise ValueError(f"Unknown retrieval mode '{mode}'")
+        snapshot = self.snapshot()
+        if not snapshot.schemas:
+            return {"results": [], "mode": mode, "embedding_skipped": mode == "lexical"}
         
-        # Calculate similarities
-        similarities = []
-        for schema in self.schemas:
-            similarity = self.cosine_similarity(query_embedding, schema["embedding"])
-            similarities.append((similarity, schema))
+        lexical, lexical_scores = self._lexical(snapshot, query, mode)
+        if not self._needs_embedding(lexical, mode):
+            return self._ranked(snapshot, "lexical", lexical_scores, None, top_k)
+        query_embedding = self.get_embedding(query, snapshot.embedding_model, snapshot.embedding_dimensions)
+        vector_scores = self._vector_scores(snapshot, query_embedding, top_k) if query_embedding else None
+        return self._ranked(snapshot, mode, lexical_scores, vector_scores, top_k)
+    
+    def retrieve_many(self, queries: List[str], top_k: int = 3, mode: str = "hybrid",
+                      batch_size: int = 100) -> List[Dict]:
+        """
+        `retrieve` for many queries at once: the queries that need an
+        embedding are embedded `batch_size` per API call and scored against
+        the knowledge base in one matrix product.
+        """
+        if mode not in ("hybrid", "lexical", "vector"):
+            raise ValueError(f"Unknown retrieval mode '{mode}'")
+        snapshot = self.snapshot()
+        if not snapshot.schemas:
+            return [{"results": [], "mode": mode, "embedding_skipped": mode == "lexical"} for _ in queries]
         
-        # Sort by similarity and get top_k
-        similarities.sort(reverse=True, key=lambda x: x[0])
+        lexical = [self._lexical(snapshot, query, mode) for query in queries]
+        pending = [i for i, (hits, _) in enumerate(lexical) if self._needs_embedding(hits, mode)]
+        embeddings: Dict[int, List[float]] = {}
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            try:
+                vectors = self.embed(
+                    [queries[i] for i in chunk], snapshot.embedding_model, snapshot.embedding_dimensions
+                )
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                print(f"Error getting embeddings: {e}")
+                vectors = [[] for _ in chunk]
+            embeddings.update((i, v) for i, v in zip(chunk, vectors) if v)
         
-        # Return top_k schemas without embeddings
+        embedded = sorted(embeddings)
+        scored = dict(zip(embedded, self._vector_scores_many(snapshot, [embeddings[i] for i in embedded], top_k)))
+        wanted = set(pending)
         return [
-            {
+            self._ranked(snapshot, mode if i in wanted else "lexical", lexical[i][1], scored.get(i), top_k)
+            for i in range(len(queries))
+        ]
+    
+    def _ranked(self, snapshot: KnowledgeBaseSnapshot, mode: str, lexical_scores: Dict[str, float],
+                vector_scores: Optional[Dict[str, float]], top_k: int) -> Dict:
+        """
+        Rank by lexical scores in "lexical" mode, by cosine similarity in
+        "vector" mode and by the fused score in "hybrid". When the query's
+        embedding failed (`vector_scores` None) fall back to lexical scores.
+        """
+        used = mode
+        if mode != "lexical" and vector_scores is None:
+            if not lexical_scores:
+                return {"results": [], "mode": mode, "embedding_skipped": False}
+            used = "lexical_fallback"
+        self.retrieval_counts[used] += 1
+        
+        scored = []
+        for schema in snapshot.schemas:
+            name = schema["name"]
+            lexical_score = lexical_scores.get(name, 0.0)
+            if used == "hybrid":
+                score = self.vector_weight * vector_scores.get(name, 0.0) + (1 - self.vector_weight) * lexical_score
+            elif used == "vector":
+                score = vector_scores.get(name, 0.0)
+            else:
+                if name not in lexical_scores:
+                    continue
+                score = lexical_score
+            scored.append((score, lexical_score, schema))
+        scored.sort(reverse=True, key=lambda x: x[0])
+        
+        results = []
+        for score, lexical_score, s in scored[:top_k]:
+            result = {
                 "name": s["name"],
                 "description": s["description"],
                 "schema": s["schema"],
-                "relevance_score": sim
+                "relevance_score": score
             }
-            for sim, s in similarities[:top_k]
-        ]
+            if used == "hybrid":
+                result["lexical_score"] = lexical_score
+                result["vector_score"] = vector_scores.get(s["name"], 0.0)
+            results.append(result)
+        return {"results": results, "mode": used, "embedding_skipped": used == "lexical"}
     
     def get_schema_by_name(self, name: str) -> Dict:
         """Get a specific schema by name."""
-        for s in self.schemas:
-            if s["name"] == name:
-                return {
-                    "name": s["name"],
-                    "description": s["description"],
-                    "schema": s["schema"]
-                }
-        return None
+        s = self.snapshot().by_name.get(name)
+        if s is None:
+            return None
+        return {
+            "name": s["name"],
+            "description": s["description"],
+            "schema": s["schema"]
+        }
+    
+    def _structure(self, entry: Dict) -> Dict:
+        """
+        Parsed tables, foreign-key graph and table term index of a stored
+        schema, built once and reused until the schema text changes.
+        """
+        cached = self._structures.get(entry["name"])
+        if cached and cached[0] == entry["schema"]:
+            return cached[1]
+        tables = parse_schema(entry["schema"])
+        structure = {
+            "tables": tables,
+            "graph": schema_graph.SchemaGraph.from_tables(tables),
+            "index": schema_graph.table_terms(tables),
+        }
+        self._structures[entry["name"]] = (entry["schema"], structure)
+        return structure
+    
+    def schema_structure(self, name: str) -> Optional[Dict]:
+        entry = self.snapshot().by_name.get(name)
+        return self._structure(entry) if entry is not None else None
+    
+    def prune_schema(self, name: str, question: str, max_matched: int = 8) -> Optional[Dict]:
+        """
+        The tables of a stored schema that `question` needs: the ones it
+        matches plus the bridge tables joining them over foreign keys.
+        """
+        entry = self.snapshot().by_name.get(name)
+        if entry is None:
+            return None
+        structure = self._structure(entry)
+        return schema_graph.prune_schema(
+            entry["schema"], question,
+            structure["tables"], structure["graph"], structure["index"], max_matched
+        )
@@ -0,0 +1,419 @@
+"""
+Schema Parser - Deterministic parsing of schema definitions without the model
+"""
+import re
+from typing import Dict, List, Optional
+
+
+_TABLE_START = re.compile(
+    r'^[ \t]*(?:create\s+(?:temporary\s+|temp\s+)?table\s+(?:if\s+not\s+exists\s+)?)?'
+    r'([\w."`\[\]]+)\s*\(',
+    re.IGNORECASE | re.MULTILINE,
+)
+_REFERENCES = re.compile(
+    r'references\s+([\w."`\[\]]+)\s*(?:\(\s*([^)]*)\))?', re.IGNORECASE
+)
+_TABLE_CONSTRAINT_KEYWORDS = ("primary", "foreign", "constraint", "unique", "check", "index", "key")
+_NON_TABLE_NAMES = {"values", "insert", "select", "index", "view", "on"}
+
+
+def _strip_identifier(name: str) -> str:
+    """Remove quoting characters and any schema prefix from an identifier."""
+    name = name.strip().strip('`"[]')
+    return name.split('.')[-1].strip('`"[]')
+
+
+def strip_comments(text: str) -> str:
+    """Remove -- and /* */ comments, leaving quoted strings intact."""
+    out = []
+    i = 0
+    quote = None
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            out.append(ch)
+            if ch == quote:
+                quote = None
+            i += 1
+        elif ch in ("'", '"', '`'):
+            quote = ch
+            out.append(ch)
+            i += 1
+        elif text.startswith('--', i):
+            end = text.find('\n', i)
+            i = len(text) if end == -1 else end
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = len(text) if end == -1 else end + 2
+        else:
+            out.append(ch)
+            i += 1
+    return ''.join(out)
+
+
+def _split_top_level(body: str) -> List[str]:
+    """Split a table body on commas that are not nested inside parentheses."""
+    parts = []
+    depth = 0
+    current = []
+    quote = None
+    for ch in body:
+        if quote:
+            current.append(ch)
+            if ch == quote:
+                quote = None
+            continue
+        if ch in ("'", '"', '`'):
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    if ''.join(current).strip():
+        parts.append(''.join(current).strip())
+    return [p for p in parts if p]
+
+
+def _matching_paren(text: str, start: int) -> int:
+    """Return the index of the parenthesis closing the one at `start`."""
+    depth = 0
+    quote = None
+    for i in range(start, len(text)):
+        ch = text[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"', '`'):
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _column_list(text: str) -> List[str]:
+    return [_strip_identifier(c) for c in text.split(',') if c.strip()]
+
+
+def _parse_column(definition: str) -> Optional[Dict]:
+    """Parse a single column definition such as `user_id INT PRIMARY KEY`."""
+    match = re.match(r'([\w"`\[\]]+)\s*(.*)', definition, re.DOTALL)
+    if not match:
+        return None
+    name = _strip_identifier(match.group(1))
+    rest = ' '.join(match.group(2).split())
+
+    type_match = re.match(r'([A-Za-z_][\w ]*?(?:\([^)]*\))?)(?=\s+(?:primary|not|null|unique|default|references|foreign|check|auto_increment|autoincrement|generated|constraint)\b|$)',
+                          rest, re.IGNORECASE)
+    col_type = type_match.group(1).strip() if type_match else rest.split(' ')[0] if rest else ''
+    constraints_text = rest[len(col_type):].strip()
+    upper = constraints_text.upper()
+
+    constraints = []
+    if 'PRIMARY KEY' in upper:
+        constraints.append('PRIMARY KEY')
+    if 'NOT NULL' in upper:
+        constraints.append('NOT NULL')
+    if re.search(r'\bUNIQUE\b', upper):
+        constraints.append('UNIQUE')
+    default = re.search(r'\bDEFAULT\s+(\'[^\']*\'|\S+)', constraints_text, re.IGNORECASE)
+    if default:
+        constraints.append(f"DEFAULT {default.group(1)}")
+    if re.search(r'\bAUTO_?INCREMENT\b', upper):
+        constraints.append('AUTO_INCREMENT')
+
+    references = None
+    ref = _REFERENCES.search(constraints_text)
+    if ref:
+        ref_columns = _column_list(ref.group(2)) if ref.group(2) else []
+        references = {
+            "table": _strip_identifier(ref.group(1)),
+            "column": ref_columns[0] if ref_columns else None,
+        }
+        constraints.append(
+            f"REFERENCES {references['table']}"
+            + (f"({references['column']})" if references['column'] else "")
+        )
+
+    return {
+        "name": name,
+        "type": col_type,
+        "constraints": constraints,
+        "primary_key": 'PRIMARY KEY' in constraints,
+        "nullable": 'NOT NULL' not in constraints and 'PRIMARY KEY' not in constraints,
+        "unique": 'UNIQUE' in constraints or 'PRIMARY KEY' in constraints,
+        "references": references,
+    }
+
+
+def _apply_table_constraint(table: Dict, definition: str):
+    """Apply a table-level PRIMARY KEY / FOREIGN KEY / UNIQUE constraint."""
+    text = ' '.join(definition.split())
+    text = re.sub(r'^constraint\s+\S+\s+', '', text, flags=re.IGNORECASE)
+
+    pk = re.match(r'primary\s+key\s*\(([^)]*)\)', text, re.IGNORECASE)
+    if pk:
+        for column_name in _column_list(pk.group(1)):
+            if column_name not in table["primary_key"]:
+                table["primary_key"].append(column_name)
+            column = _find_column(table, column_name)
+            if column:
+                column["primary_key"] = True
+                column["nullable"] = False
+        return
+
+    fk = re.match(r'foreign\s+key\s*\(([^)]*)\)\s*' + _REFERENCES.pattern, text, re.IGNORECASE)
+    if fk:
+        columns = _column_list(fk.group(1))
+        ref_columns = _column_list(fk.group(3)) if fk.group(3) else []
+        for i, column_name in enumerate(columns):
+            table["foreign_keys"].append({
+                "column": column_name,
+                "references_table": _strip_identifier(fk.group(2)),
+                "references_column": ref_columns[i] if i < len(ref_columns) else None,
+            })
+        return
+
+    unique = re.match(r'unique(?:\s+key)?\s*(?:\w+\s*)?\(([^)]*)\)', text, re.IGNORECASE)
+    if unique:
+        columns = _column_list(unique.group(1))
+        if len(columns) == 1:
+            column = _find_column(table, columns[0])
+            if column:
+                column["unique"] = True
+
+
+def _find_column(table: Dict, name: str) -> Optional[Dict]:
+    lowered = name.lower()
+    for column in table["columns"]:
+        if column["name"].lower() == lowered:
+            return column
+    return None
+
+
+def parse_schema(schema: str) -> Dict[str, Dict]:
+    """
+    Parse a schema definition into tables, columns, primary and foreign keys.
+
+    Accepts both `CREATE TABLE name (...)` statements and the compact
+    `name(...)` notation used by the sample schemas. Returns a dict keyed
+    by table name, preserving the order tables appear in the schema.
+    """
+    text = strip_comments(schema or "")
+    tables: Dict[str, Dict] = {}
+    pos = 0
+    while True:
+        match = _TABLE_START.search(text, pos)
+        if not match:
+            break
+        open_paren = match.end() - 1
+        close_paren = _matching_paren(text, open_paren)
+        if close_paren == -1:
+            break
+        pos = close_paren + 1
+
+        name = _strip_identifier(match.group(1))
+        if not name or name.lower() in _NON_TABLE_NAMES:
+            continue
+
+        table = {"name": name, "columns": [], "primary_key": [], "foreign_keys": []}
+        for definition in _split_top_level(text[open_paren + 1:close_paren]):
+            first_word = definition.split(None, 1)[0].lower().strip('`"[]')
+            if first_word in _TABLE_CONSTRAINT_KEYWORDS and not re.match(
+                r'\w+\s+(?:int|integer|varchar|char|text|date|timestamp|decimal|numeric|boolean|bigint|float|real)\b',
+                definition, re.IGNORECASE,
+            ):
+                _apply_table_constraint(table, definition)
+                continue
+            column = _parse_column(definition)
+            if not column:
+                continue
+            table["columns"].append(column)
+            if column["primary_key"]:
+                table["primary_key"].append(column["name"])
+            if column["references"]:
+                table["foreign_keys"].append({
+                    "column": column["name"],
+                    "references_table": column["references"]["table"],
+                    "references_column": column["references"]["column"],
+                })
+        tables[name] = table
+    return tables
+
+
+def render_table(table: Dict) -> str:
+    """Render a parsed table back into the compact `name(...)` notation."""
+    lines = []
+    for column in table["columns"]:
+        parts = [column["name"], column["type"]] + list(column["constraints"])
+        lines.append(" ".join(p for p in parts if p))
+    if len(table["primary_key"]) > 1:
+        lines.append(f"PRIMARY KEY ({', '.join(table['primary_key'])})")
+    inline = {c["name"].lower() for c in table["columns"] if c["references"]}
+    for fk in table["foreign_keys"]:
+        if fk["column"].lower() not in inline:
+            target = fk["references_table"] + (f"({fk['references_column']})" if fk["references_column"] else "")
+            lines.append(f"FOREIGN KEY ({fk['column']}) REFERENCES {target}")
+    return f"{table['name']}(\n    " + ",\n    ".join(lines) + "\n)"
+
+
+def find_table(tables: Dict[str, Dict], name: str) -> Optional[Dict]:
+    """Case-insensitive table lookup, ignoring any schema prefix or quotes."""
+    wanted = _strip_identifier(name or "").lower()
+    for table_name, table in tables.items():
+        if table_name.lower() == wanted:
+            return table
+    return None
+
+
+def _relationship_type(tables: Dict[str, Dict], table: Dict, fk: Dict) -> str:
+    column = _find_column(table, fk["column"])
+    if column and column["unique"] and table["primary_key"] != [column["name"]]:
+        return "one-to-one"
+    if table["primary_key"] == [fk["column"]]:
+        return "one-to-one"
+    return "many-to-one"
+
+
+def _is_junction_table(table: Dict) -> bool:
+    """A table whose job is linking two others: two FKs and little else."""
+    referenced = {fk["references_table"].lower() for fk in table["foreign_keys"]}
+    return len(referenced) == 2 and len(table["columns"]) <= len(table["foreign_keys"]) + 3
+
+
+def explain_relationships(schema: str) -> dict:
+    """
+    Describe the foreign key relationships of a schema, in the same shape
+    as `DatabaseAssistant.explain_relationships`.
+    """
+    tables = parse_schema(schema)
+    relationships = []
+    key_joins = []
+    for table in tables.values():
+        for fk in table["foreign_keys"]:
+            target = find_table(tables, fk["references_table"])
+            to_table = target["name"] if target else fk["references_table"]
+            to_column = fk["references_column"] or (
+                target["primary_key"][0] if target and target["primary_key"] else fk["column"]
+            )
+            relationship_type = _relationship_type(tables, table, fk)
+            relationships.append({
+                "from_table": table["name"],
+                "to_table": to_table,
+                "from_column": fk["column"],
+                "to_column": to_column,
+                "relationship_type": relationship_type,
+                "description": f"{table['name']}.{fk['column']} references {to_table}.{to_column}",
+            })
+            key_joins.append(
+                f"{table['name']} JOIN {to_table} ON {table['name']}.{fk['column']} = {to_table}.{to_column}"
+            )
+
+        if _is_junction_table(table):
+            first, second = sorted({fk["references_table"] for fk in table["foreign_keys"]})
+            relationships.append({
+                "from_table": first,
+                "to_table": second,
+                "relationship_type": "many-to-many",
+                "description": f"{first} and {second} are linked through {table['name']}",
+            })
+
+    connected = {r["from_table"] for r in relationships} | {r["to_table"] for r in relationships}
+    isolated = [name for name in tables if name not in connected]
+    diagram = f"{len(tables)} tables with {len(relationships)} relationships."
+    if isolated:
+        diagram += f" Tables without relationships: {', '.join(isolated)}."
+
+    return {
+        "relationships": relationships,
+        "diagram_description": diagram,
+        "key_joins": key_joins,
+    }
+
+
+def describe_table(schema: str, table_name: str) -> dict:
+    """
+    Describe a single table from the parsed schema, in the same shape as
+    `DatabaseAssistant.describe_table`.
+    """
+    tables = parse_schema(schema)
+    table = find_table(tables, table_name)
+    if not table:
+        return {
+            "error": f"Table '{table_name}' not found in schema",
+            "table_name": table_name,
+            "columns": [],
+            "purpose": "Table not found",
+        }
+
+    referenced_by = [
+        f"{other['name']}.{fk['column']}"
+        for other in tables.values()
+        for fk in other["foreign_keys"]
+        if fk["references_table"].lower() == table["name"].lower()
+    ]
+    purpose = f"Stores {table['name'].replace('_', ' ')} records"
+    if table["foreign_keys"]:
+        linked = sorted({fk["references_table"] for fk in table["foreign_keys"]})
+        purpose += f" linked to {', '.join(linked)}"
+    purpose += "."
+
+    return {
+        "table_name": table["name"],
+        "columns": [
+            {"name": c["name"], "type": c["type"], "constraints": c["constraints"]}
+            for c in table["columns"]
+        ],
+        "primary_key": table["primary_key"],
+        "foreign_keys": [
+            {
+                "column": fk["column"],
+                "references": f"{fk['references_table']}({fk['references_column'] or ''})",
+            }
+            for fk in table["foreign_keys"]
+        ],
+        "referenced_by": referenced_by,
+        "purpose": purpose,
+    }
+
+
+def analyze_schema(schema: str, schema_name: str = "database") -> dict:
+    """
+    Summarize a schema structurally, in the same shape as
+    `DatabaseAssistant.analyze_schema`.
+    """
+    tables = parse_schema(schema)
+    relationships = explain_relationships(schema)["relationships"]
+
+    reference_counts = {name: 0 for name in tables}
+    for r in relationships:
+        if r["to_table"] in reference_counts and r["relationship_type"] != "many-to-many":
+            reference_counts[r["to_table"]] += 1
+    key_entities = [
+        name for name, count in sorted(reference_counts.items(), key=lambda x: -x[1]) if count > 0
+    ][:5]
+
+    total = len(tables)
+    if total <= 5:
+        complexity = "Simple"
+    elif total <= 15:
+        complexity = "Medium"
+    else:
+        complexity = "Complex"
+
+    return {
+        "tables": list(tables.keys()),
+        "total_tables": total,
+        "relationships": [r["description"] for r in relationships],
+        "key_entities": key_entities,
+        "complexity": complexity,
+        "summary": f"The {schema_name} schema has {total} tables and {len(relationships)} relationships.",
+    }
@@ -498,23 +498,40 @@ billing(
 
 def initialize_knowledge_base(knowledge_base):
     """
-    Initialize the knowledge base with sample schemas.
+    Initialize the knowledge base with sample schemas. If adding them in one
+    batch fails, they are added one at a time so a bad schema only skips
+    itself; RuntimeError names the ones that could not be added.
     """
     print("\n" + "="*60)
     print("Initializing Knowledge Base with Sample Schemas")
     print("="*60)
     
-    for schema_data in SAMPLE_SCHEMAS:
-        try:
-            knowledge_base.add_schema(
-                name=schema_data["name"],
-                schema=schema_data["schema"],
-                description=schema_data["description"]
-            )
-            print(f"✓ Added schema: {schema_data['name']}")
-        except Exception as e:
-            print(f"✗ Error adding schema {schema_data['name']}: {e}")
+    names = {"added": [], "updated": [], "skipped": []}
+    failed = []
+    try:
+        names = knowledge_base.add_schemas(SAMPLE_SCHEMAS)["names"]
+    except Exception as e:
+        print(f"✗ Error adding sample schemas together, adding them one at a time: {e}")
+        for schema in SAMPLE_SCHEMAS:
+            try:
+                added = knowledge_base.add_schemas([schema])["names"]
+            except Exception as e:
+                print(f"✗ Error adding schema {schema['name']}: {e}")
+                failed.append(schema["name"])
+                continue
+            for status, found in added.items():
+                names[status].extend(found)
+    for status in ("added", "updated", "skipped"):
+        for name in names[status]:
+            print(f"✓ {status.capitalize()} schema: {name}")
     
     print("="*60)
-    print(f"Knowledge Base initialized with {len(SAMPLE_SCHEMAS)} schemas")
+    print(
+        f"Knowledge Base initialized with {len(knowledge_base.schemas)} schemas "
+        f"({len(names['added'])} added, {len(names['updated'])} updated, "
+        f"{len(names['skipped'])} unchanged, {len(failed)} failed)"
+    )
     print("="*60 + "\n")
+    if failed:
+        raise RuntimeError(f"Could not add sample schemas: {', '.join(failed)}")
+    return names
@@ -0,0 +1,866 @@
+"""
+SQL Analysis - Lightweight tokenizer and structural parser for generated SQL
+
+Understands the subset of SQL the generator produces (SELECT with CTEs,
+joins, subqueries and set operations, plus simple INSERT/UPDATE/DELETE)
+well enough to resolve identifiers and describe a query, without a
+database or a model call.
+"""
+import re
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+
+Token = namedtuple("Token", ["type", "value"])
+
+_TOKEN_PATTERN = r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")*"|`[^`]*`BRACKETS)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+  | (?P<param>\?|:[A-Za-z_]\w*|\$\d+|@\w+)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<op><>|<=|>=|!=|==|\|\||::|->>|->|[-+*/%=<>!~^&|])
+  | (?P<punct>[(),;.\[\]])
+  | (?P<other>.)
+"""
+_TOKEN_RE = re.compile(_TOKEN_PATTERN.replace("BRACKETS", r"|\[[^\]]*\]"), re.VERBOSE | re.DOTALL)
+# PostgreSQL has no [bracket] quoting: brackets are arrays and subscripts
+_POSTGRES_TOKEN_RE = re.compile(_TOKEN_PATTERN.replace("BRACKETS", ""), re.VERBOSE | re.DOTALL)
+
+# Words that are never column references when unquoted
+KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "IN", "IS", "NULL", "LIKE", "ILIKE",
+    "SIMILAR", "BETWEEN", "EXISTS", "CASE", "WHEN", "THEN", "ELSE", "END", "AS", "ON",
+    "ASC", "DESC", "TRUE", "FALSE", "DISTINCT", "ALL", "ANY", "SOME", "INTERVAL",
+    "CURRENT_DATE", "CURRENT_TIMESTAMP", "CURRENT_TIME", "LOCALTIME", "LOCALTIMESTAMP",
+    "CURRENT_USER", "SESSION_USER", "NULLS", "OVER", "PARTITION", "BY", "ORDER", "GROUP",
+    "HAVING", "LIMIT", "OFFSET", "ROWS", "RANGE", "UNBOUNDED", "PRECEDING", "FOLLOWING",
+    "CURRENT", "FILTER", "WITHIN", "ESCAPE", "COLLATE", "BOTH", "LEADING", "TRAILING",
+    "FOR", "UNKNOWN", "JOIN", "LEFT", "RIGHT", "FULL", "INNER", "OUTER", "CROSS",
+    "NATURAL", "USING", "UNION", "INTERSECT", "EXCEPT", "WITH", "RECURSIVE", "LATERAL",
+    "FETCH", "NEXT", "ONLY", "WINDOW", "QUALIFY", "TOP", "SET", "VALUES", "INTO",
+    "INSERT", "UPDATE", "DELETE", "DEFAULT", "RETURNING", "CONFLICT", "DO", "NOTHING",
+    "SYSDATE", "ROWNUM", "REGEXP", "RLIKE", "DIV", "MOD", "XOR", "PRECISION", "VARYING",
+}
+
+_CLAUSE_KEYWORDS = {
+    "FROM": "from", "WHERE": "where", "GROUP": "group_by", "HAVING": "having",
+    "ORDER": "order_by", "LIMIT": "limit", "OFFSET": "offset", "FETCH": "fetch",
+    "WINDOW": "window", "QUALIFY": "qualify",
+}
+_JOIN_WORDS = {"JOIN", "LEFT", "RIGHT", "FULL", "INNER", "OUTER", "CROSS", "NATURAL",
+               "LATERAL", "STRAIGHT_JOIN"}
+_SET_OPERATORS = {"UNION", "INTERSECT", "EXCEPT", "MINUS"}
+AGGREGATE_FUNCTIONS = {"COUNT", "SUM", "AVG", "MIN", "MAX", "ARRAY_AGG", "STRING_AGG",
+                       "GROUP_CONCAT", "STDDEV", "VARIANCE", "BOOL_AND", "BOOL_OR"}
+_TYPE_CONTINUATIONS = {"PRECISION", "VARYING", "WITH", "WITHOUT", "TIME", "ZONE"}
+_TIME_UNITS = {"YEAR", "YEARS", "MONTH", "MONTHS", "DAY", "DAYS", "HOUR", "HOURS",
+               "MINUTE", "MINUTES", "SECOND", "SECONDS", "WEEK", "WEEKS", "QUARTER",
+               "EPOCH", "DOW", "DOY", "MICROSECOND", "MILLISECOND"}
+
+
+def tokenize(sql: str, keep_whitespace: bool = False, bracket_identifiers: bool = True) -> List[Token]:
+    """
+    Split SQL into tokens; whitespace and comments are dropped unless asked
+    for. With `bracket_identifiers` False, `[` and `]` are punctuation
+    (PostgreSQL arrays) rather than quoting an identifier.
+    """
+    pattern = _TOKEN_RE if bracket_identifiers else _POSTGRES_TOKEN_RE
+    tokens = []
+    for match in pattern.finditer(sql or ""):
+        kind = match.lastgroup
+        if kind in ("ws", "comment") and not keep_whitespace:
+            continue
+        tokens.append(Token(kind, match.group()))
+    return tokens
+
+
+def _upper(token: Token) -> str:
+    return token.value.upper() if token.type == "word" else ""
+
+
+def _is_identifier(token: Token) -> bool:
+    return token.type == "qident" or (token.type == "word" and token.value.upper() not in KEYWORDS)
+
+
+def identifier_name(token: Token) -> str:
+    """The bare name of a word or quoted identifier token."""
+    if token.type == "qident":
+        return token.value[1:-1].replace('""', '"')
+    return token.value
+
+
+def _matching(tokens: List[Token], start: int) -> int:
+    """Index of the parenthesis closing tokens[start], or the last index."""
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i].value == "(":
+            depth += 1
+        elif tokens[i].value == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(tokens) - 1
+
+
+def _split_depth0(tokens: List[Token], separator: str = ",") -> List[List[Token]]:
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        if depth == 0 and token.type in ("punct", "word") and token.value.upper() == separator:
+            parts.append(current)
+            current = []
+            continue
+        current.append(token)
+    if current:
+        parts.append(current)
+    return parts
+
+
+def render_tokens(tokens: List[Token]) -> str:
+    """Join tokens back into readable SQL text."""
+    out = ""
+    previous = None
+    for token in tokens:
+        if previous is not None and not (
+            token.value in (",", ")", ".") or previous.value in ("(", ".")
+            or (token.value == "(" and previous.type == "word" and previous.value.upper() not in KEYWORDS)
+            or token.value == "::" or previous.value == "::"
+        ):
+            out += " "
+        out += token.value
+        previous = token
+    return out
+
+
+def _starts_query(tokens: List[Token]) -> bool:
+    return bool(tokens) and _upper(tokens[0]) in ("SELECT", "WITH")
+
+
+def _unwrap(tokens: List[Token]) -> List[Token]:
+    while tokens and tokens[0].value == "(" and _matching(tokens, 0) == len(tokens) - 1:
+        tokens = tokens[1:-1]
+    return tokens
+
+
+def _skip_type(tokens: List[Token], i: int) -> int:
+    """
+    Index just past the type name starting at tokens[i], as in `x::type` or
+    CAST(x AS type): multi-word names, (precision) and [] suffixes included.
+    """
+    if i < len(tokens) and tokens[i].type in ("word", "qident"):
+        i += 1
+        while i + 1 < len(tokens) and tokens[i].value == "." and tokens[i + 1].type in ("word", "qident"):
+            i += 2
+    while i < len(tokens) and _upper(tokens[i]) in _TYPE_CONTINUATIONS:
+        i += 1
+    if i < len(tokens) and tokens[i].value == "(":
+        i = _matching(tokens, i) + 1
+    while i < len(tokens):
+        if tokens[i].value == "[":
+            while i < len(tokens) and tokens[i].value != "]":
+                i += 1
+            i += 1
+        elif tokens[i].type == "qident" and tokens[i].value.startswith("["):
+            i += 1
+        else:
+            break
+    return i
+
+
+def analyze_expression(tokens: List[Token]) -> Dict:
+    """
+    Collect the column references, function calls and nested subqueries of an
+    expression. Column references are (qualifier, column) pairs.
+    """
+    columns: List[Tuple[Optional[str], str]] = []
+    functions: List[str] = []
+    subqueries: List[Dict] = []
+    skip_next_word = False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        upper = _upper(token)
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+
+        if token.value == "(" and nxt is not None and _upper(nxt) in ("SELECT", "WITH"):
+            end = _matching(tokens, i)
+            subqueries.append(parse_query(tokens[i + 1:end]))
+            i = end + 1
+            continue
+
+        if token.value == "::":
+            i = _skip_type(tokens, i + 1)
+            continue
+
+        if token.type not in ("word", "qident"):
+            i += 1
+            continue
+
+        if skip_next_word:
+            skip_next_word = False
+            i += 1
+            continue
+
+        if token.type == "word" and nxt is not None and nxt.value == "(":
+            functions.append(upper)
+            if upper == "EXTRACT" and i + 2 < len(tokens) and tokens[i + 2].type == "word":
+                i += 3
+                continue
+            i += 1
+            continue
+
+        if upper in ("AS",):
+            # CAST(x AS type)
+            i = _skip_type(tokens, i + 1)
+            continue
+        if upper == "ARRAY" and nxt is not None and nxt.value == "[":
+            i += 1
+            continue
+        if upper in ("NULLS", "OVER") and nxt is not None and nxt.type == "word":
+            # NULLS FIRST, OVER named_window
+            skip_next_word = True
+            i += 1
+            continue
+        if upper in ("DATE", "TIME", "TIMESTAMP") and nxt is not None and nxt.type == "string":
+            i += 1
+            continue
+        if upper in _TIME_UNITS and i > 0 and tokens[i - 1].type in ("number", "string"):
+            i += 1
+            continue
+        if token.type == "word" and upper in KEYWORDS:
+            i += 1
+            continue
+
+        # Identifier chain: a, t.a, s.t.a or t.*
+        chain = [identifier_name(token)]
+        j = i + 1
+        while j + 1 < len(tokens) and tokens[j].value == "." and (
+            tokens[j + 1].type in ("word", "qident") or tokens[j + 1].value == "*"
+        ):
+            chain.append(identifier_name(tokens[j + 1]))
+            j += 2
+        if len(chain) == 1:
+            columns.append((None, chain[0]))
+        else:
+            columns.append((chain[-2], chain[-1]))
+        i = j
+
+    return {"columns": columns, "functions": functions, "subqueries": subqueries}
+
+
+def _parse_select_item(tokens: List[Token]) -> Dict:
+    alias = None
+    expr = tokens
+    if len(tokens) >= 2 and _upper(tokens[-2]) == "AS" and tokens[-1].type in ("word", "qident", "string"):
+        alias = identifier_name(tokens[-1]) if tokens[-1].type != "string" else tokens[-1].value[1:-1]
+        expr = tokens[:-2]
+    elif (
+        len(tokens) >= 2 and _is_identifier(tokens[-1])
+        and (tokens[-2].type in ("word", "qident", "number", "string") or tokens[-2].value == ")")
+        and _upper(tokens[-2]) not in ("AS",)
+        and not (tokens[-2].type == "word" and tokens[-2].value.upper() in KEYWORDS
+                 and tokens[-2].value.upper() not in ("END",))
+    ):
+        alias = identifier_name(tokens[-1])
+        expr = tokens[:-1]
+
+    star_table = None
+    star = len(expr) == 1 and expr[0].value == "*"
+    if len(expr) == 3 and expr[1].value == "." and expr[2].value == "*":
+        star = True
+        star_table = identifier_name(expr[0])
+
+    analysis = analyze_expression(expr)
+    return {
+        "expression": render_tokens(expr),
+        "alias": alias,
+        "star": star,
+        "star_table": star_table,
+        "aggregate": any(f in AGGREGATE_FUNCTIONS for f in analysis["functions"]),
+        "window": any(_upper(t) == "OVER" for t in expr),
+        "columns": analysis["columns"],
+        "functions": analysis["functions"],
+        "subqueries": analysis["subqueries"],
+        "tokens": expr,
+    }
+
+
+def _parse_source(tokens: List[Token], i: int) -> Tuple[Dict, int]:
+    """Parse one FROM-clause source starting at tokens[i]."""
+    source = {"name": None, "schema": None, "alias": None, "subquery": None, "function": None}
+    if i < len(tokens) and _upper(tokens[i]) == "LATERAL":
+        source["lateral"] = True
+        i += 1
+    if i < len(tokens) and tokens[i].value == "(":
+        end = _matching(tokens, i)
+        inner = tokens[i + 1:end]
+        if _starts_query(_unwrap(inner)):
+            source["subquery"] = parse_query(_unwrap(inner))
+        else:
+            nested = _parse_from(inner)
+            source["nested"] = nested
+        i = end + 1
+    elif i < len(tokens) and tokens[i].type in ("word", "qident"):
+        chain = [identifier_name(tokens[i])]
+        i += 1
+        while i + 1 < len(tokens) and tokens[i].value == "." and tokens[i + 1].type in ("word", "qident"):
+            chain.append(identifier_name(tokens[i + 1]))
+            i += 2
+        if i < len(tokens) and tokens[i].value == "(":
+            source["function"] = chain[-1]
+            i = _matching(tokens, i) + 1
+        else:
+            source["name"] = chain[-1]
+            source["schema"] = chain[-2] if len(chain) > 1 else None
+
+    if i < len(tokens) and _upper(tokens[i]) == "AS":
+        i += 1
+    if i < len(tokens) and _is_identifier(tokens[i]) and _upper(tokens[i]) not in _JOIN_WORDS:
+        source["alias"] = identifier_name(tokens[i])
+        i += 1
+        if i < len(tokens) and tokens[i].value == "(":
+            end = _matching(tokens, i)
+            source["column_aliases"] = [
+                identifier_name(t) for t in tokens[i + 1:end] if t.type in ("word", "qident")
+            ]
+            i = end + 1
+    return source, i
+
+
+def _parse_from(tokens: List[Token]) -> Dict:
+    """Parse a FROM clause into comma-separated sources and explicit joins."""
+    sources, joins = [], []
+    i = 0
+    pending_join = None
+    while i < len(tokens):
+        token = tokens[i]
+        if token.value == ",":
+            i += 1
+            continue
+        join_words = []
+        while i < len(tokens) and _upper(tokens[i]) in _JOIN_WORDS - {"LATERAL"}:
+            join_words.append(_upper(tokens[i]))
+            i += 1
+            if join_words[-1] in ("JOIN", "STRAIGHT_JOIN"):
+                break
+        if join_words:
+            pending_join = " ".join(w for w in join_words if w != "OUTER")
+
+        source, i = _parse_source(tokens, i)
+        if pending_join is None:
+            if source.get("nested"):
+                sources.extend(source["nested"]["sources"])
+                joins.extend(source["nested"]["joins"])
+            else:
+                sources.append(source)
+            continue
+
+        join = {"type": pending_join, "source": source, "condition": None, "using": []}
+        pending_join = None
+        if i < len(tokens) and _upper(tokens[i]) == "ON":
+            start = i + 1
+            depth = 0
+            i = start
+            while i < len(tokens):
+                if tokens[i].value == "(":
+                    depth += 1
+                elif tokens[i].value == ")":
+                    depth -= 1
+                elif depth == 0 and (tokens[i].value == "," or _upper(tokens[i]) in _JOIN_WORDS):
+                    break
+                i += 1
+            join["condition_tokens"] = tokens[start:i]
+            join["condition"] = render_tokens(tokens[start:i])
+        elif i < len(tokens) and _upper(tokens[i]) == "USING" and i + 1 < len(tokens) and tokens[i + 1].value == "(":
+            end = _matching(tokens, i + 1)
+            join["using"] = [identifier_name(t) for t in tokens[i + 2:end] if t.type in ("word", "qident")]
+            i = end + 1
+        joins.append(join)
+    return {"sources": sources, "joins": joins}
+
+
+def _clause_positions(tokens: List[Token]) -> List[Tuple[str, int, int]]:
+    """Depth-0 clause keywords of a SELECT, as (clause, keyword index, body index)."""
+    positions = []
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif depth == 0 and token.type == "word":
+            clause = _CLAUSE_KEYWORDS.get(token.value.upper())
+            if not clause:
+                continue
+            body = i + 1
+            if clause in ("group_by", "order_by"):
+                if i + 1 >= len(tokens) or _upper(tokens[i + 1]) != "BY":
+                    continue
+                body = i + 2
+            positions.append((clause, i, body))
+    return positions
+
+
+def split_conditions(tokens: List[Token]) -> List[List[Token]]:
+    """Split a WHERE/ON/HAVING expression on its top-level ANDs."""
+    parts, current, depth = [], [], 0
+    pending_between = False
+    for token in tokens:
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        upper = _upper(token)
+        if depth == 0 and upper == "BETWEEN":
+            pending_between = True
+        elif depth == 0 and upper == "AND":
+            if pending_between:
+                pending_between = False
+            else:
+                parts.append(current)
+                current = []
+                continue
+        current.append(token)
+    if current:
+        parts.append(current)
+    return [p for p in parts if p]
+
+
+def split_disjuncts(tokens: List[Token]) -> List[List[Token]]:
+    """Split an expression on its top-level ORs."""
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        if depth == 0 and _upper(token) == "OR":
+            parts.append(current)
+            current = []
+            continue
+        current.append(token)
+    parts.append(current)
+    return [p for p in parts if p]
+
+
+def leaf_conditions(tokens: List[Token]) -> List[List[Token]]:
+    """The simple conditions of an AND/OR expression, at any nesting of parentheses."""
+    tokens = _unwrap(tokens)
+    parts = split_conditions(tokens)
+    if len(parts) == 1:
+        parts = split_disjuncts(tokens)
+    if len(parts) == 1:
+        return parts
+    return [leaf for part in parts for leaf in leaf_conditions(part)]
+
+
+def _empty_query(kind: str) -> Dict:
+    return {
+        "type": kind,
+        "ctes": [],
+        "distinct": False,
+        "select": [],
+        "sources": [],
+        "joins": [],
+        "where": None,
+        "group_by": [],
+        "having": None,
+        "order_by": [],
+        "limit": None,
+        "offset": None,
+        "set_operations": [],
+        "subqueries": [],
+        "column_refs": [],
+    }
+
+
+def _add_expression(query: Dict, tokens: List[Token], clause: str):
+    analysis = analyze_expression(tokens)
+    for table, column in analysis["columns"]:
+        query["column_refs"].append({"table": table, "column": column, "clause": clause})
+    query["subqueries"].extend(analysis["subqueries"])
+    return analysis
+
+
+def _parse_select(tokens: List[Token]) -> Dict:
+    query = _empty_query("select")
+    positions = _clause_positions(tokens)
+    select_end = positions[0][1] if positions else len(tokens)
+
+    items = tokens[1:select_end]
+    if items and _upper(items[0]) in ("DISTINCT", "ALL"):
+        query["distinct"] = _upper(items[0]) == "DISTINCT"
+        items = items[1:]
+        if items and _upper(items[0]) == "ON" and len(items) > 1 and items[1].value == "(":
+            items = items[_matching(items, 1) + 1:]
+    if items and _upper(items[0]) == "TOP" and len(items) > 1:
+        query["limit"] = items[1].value
+        items = items[2:]
+
+    for item_tokens in _split_depth0(items):
+        item = _parse_select_item(item_tokens)
+        query["select"].append(item)
+        for table, column in item["columns"]:
+            query["column_refs"].append({"table": table, "column": column, "clause": "select"})
+        query["subqueries"].extend(item["subqueries"])
+
+    for index, (clause, _, body_start) in enumerate(positions):
+        body_end = positions[index + 1][1] if index + 1 < len(positions) else len(tokens)
+        body = tokens[body_start:body_end]
+        if clause == "from":
+            parsed = _parse_from(body)
+            query["sources"] = parsed["sources"]
+            query["joins"] = parsed["joins"]
+            for join in query["joins"]:
+                if join.get("condition_tokens"):
+                    _add_expression(query, join["condition_tokens"], "join")
+                for column in join["using"]:
+                    query["column_refs"].append({"table": None, "column": column, "clause": "join"})
+            for source in query["sources"] + [j["source"] for j in query["joins"]]:
+                if source.get("subquery"):
+                    query["subqueries"].append(source["subquery"])
+        elif clause in ("where", "having", "qualify"):
+            query[clause] = render_tokens(body)
+            query[f"{clause}_tokens"] = body
+            _add_expression(query, body, clause)
+        elif clause == "group_by":
+            for part in _split_depth0(body):
+                query["group_by"].append(render_tokens(part))
+                _add_expression(query, part, "group_by")
+        elif clause == "order_by":
+            for part in _split_depth0(body):
+                direction = "ASC"
+                expr = part
+                while expr and _upper(expr[-1]) in ("ASC", "DESC", "FIRST", "LAST", "NULLS"):
+                    if _upper(expr[-1]) in ("ASC", "DESC"):
+                        direction = _upper(expr[-1])
+                    expr = expr[:-1]
+                analysis = _add_expression(query, expr, "order_by")
+                query["order_by"].append({
+                    "expression": render_tokens(expr),
+                    "direction": direction,
+                    "columns": analysis["columns"],
+                })
+        elif clause == "limit":
+            parts = _split_depth0(body)
+            if len(parts) == 2:
+                # MySQL LIMIT offset, count
+                query["offset"] = render_tokens(parts[0])
+                query["limit"] = render_tokens(parts[1])
+            else:
+                query["limit"] = render_tokens(body)
+        elif clause == "offset":
+            query["offset"] = render_tokens([t for t in body if _upper(t) not in ("ROWS", "ROW")])
+        elif clause == "fetch":
+            numbers = [t.value for t in body if t.type == "number"]
+            query["limit"] = numbers[0] if numbers else query["limit"]
+    return query
+
+
+def _parse_insert(tokens: List[Token]) -> Dict:
+    query = _empty_query("insert")
+    i = 1
+    if i < len(tokens) and _upper(tokens[i]) == "INTO":
+        i += 1
+    source = {"name": None, "schema": None, "alias": None, "subquery": None, "function": None}
+    chain = []
+    while i < len(tokens) and tokens[i].type in ("word", "qident") and _upper(tokens[i]) not in ("VALUES", "SELECT"):
+        chain.append(identifier_name(tokens[i]))
+        i += 1
+        if i < len(tokens) and tokens[i].value == ".":
+            i += 1
+        else:
+            break
+    if chain:
+        source["name"] = chain[-1]
+        source["schema"] = chain[-2] if len(chain) > 1 else None
+    query["target"] = source
+    query["insert_columns"] = []
+    if i < len(tokens) and tokens[i].value == "(" and not _starts_query(tokens[i + 1:i + 2]):
+        end = _matching(tokens, i)
+        query["insert_columns"] = [identifier_name(t) for t in tokens[i + 1:end] if t.type in ("word", "qident")]
+        i = end + 1
+    rest = tokens[i:]
+    if _starts_query(_unwrap(rest)):
+        query["subqueries"].append(parse_query(_unwrap(rest)))
+    else:
+        _add_expression(query, [t for t in rest if _upper(t) != "VALUES"], "values")
+    for column in query["insert_columns"]:
+        query["column_refs"].append({"table": None, "column": column, "clause": "insert"})
+    query["sources"] = [query["target"]]
+    return query
+
+
+def _parse_update(tokens: List[Token]) -> Dict:
+    query = _empty_query("update")
+    source, i = _parse_source(tokens, 1)
+    query["target"] = source
+    query["sources"] = [source]
+    positions = [(c, k, b) for c, k, b in _clause_positions(tokens) if c in ("from", "where")]
+    set_end = positions[0][1] if positions else len(tokens)
+    if i < len(tokens) and _upper(tokens[i]) == "SET":
+        for assignment in _split_depth0(tokens[i + 1:set_end]):
+            if len(assignment) >= 2 and assignment[1].value in ("=", "."):
+                target = assignment[0] if assignment[1].value == "=" else assignment[2]
+                query["column_refs"].append({"table": None, "column": identifier_name(target), "clause": "set"})
+                eq = next((k for k, t in enumerate(assignment) if t.value == "="), len(assignment) - 1)
+                _add_expression(query, assignment[eq + 1:], "set")
+    for index, (clause, _, body_start) in enumerate(positions):
+        body_end = positions[index + 1][1] if index + 1 < len(positions) else len(tokens)
+        body = tokens[body_start:body_end]
+        if clause == "from":
+            parsed = _parse_from(body)
+            query["sources"] += parsed["sources"]
+            query["joins"] = parsed["joins"]
+        else:
+            query["where"] = render_tokens(body)
+            query["where_tokens"] = body
+            _add_expression(query, body, "where")
+    return query
+
+
+def _parse_delete(tokens: List[Token]) -> Dict:
+    query = _empty_query("delete")
+    i = 1
+    if i < len(tokens) and _upper(tokens[i]) == "FROM":
+        i += 1
+    source, i = _parse_source(tokens, i)
+    query["target"] = source
+    query["sources"] = [source]
+    for clause, _, body_start in _clause_positions(tokens[i:]):
+        if clause == "where":
+            body = tokens[i + body_start:]
+            query["where"] = render_tokens(body)
+            query["where_tokens"] = body
+            _add_expression(query, body, "where")
+    return query
+
+
+def parse_query(tokens: List[Token]) -> Dict:
+    """Parse a token list holding one statement, including CTEs and set operations."""
+    tokens = _unwrap(tokens)
+    ctes = []
+    i = 0
+    recursive = False
+    if tokens and _upper(tokens[0]) == "WITH":
+        i = 1
+        if i < len(tokens) and _upper(tokens[i]) == "RECURSIVE":
+            recursive = True
+            i += 1
+        while i < len(tokens) and tokens[i].type in ("word", "qident"):
+            name = identifier_name(tokens[i])
+            i += 1
+            columns = []
+            if i < len(tokens) and tokens[i].value == "(":
+                end = _matching(tokens, i)
+                columns = [identifier_name(t) for t in tokens[i + 1:end] if t.type in ("word", "qident")]
+                i = end + 1
+            if i < len(tokens) and _upper(tokens[i]) == "AS":
+                i += 1
+            while i < len(tokens) and _upper(tokens[i]) in ("NOT", "MATERIALIZED"):
+                i += 1
+            if i >= len(tokens) or tokens[i].value != "(":
+                break
+            end = _matching(tokens, i)
+            ctes.append({
+                "name": name, "columns": columns, "recursive": recursive,
+                "query": parse_query(tokens[i + 1:end]),
+            })
+            i = end + 1
+            if i < len(tokens) and tokens[i].value == ",":
+                i += 1
+                continue
+            break
+    tokens = tokens[i:]
+
+    # Split on top-level set operators
+    parts, operators, current, depth = [], [], [], 0
+    for index, token in enumerate(tokens):
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        if depth == 0 and _upper(token) in _SET_OPERATORS:
+            parts.append(current)
+            operators.append(token.value.upper())
+            current = []
+            continue
+        if depth == 0 and _upper(token) in ("ALL", "DISTINCT") and not current and operators:
+            operators[-1] += f" {token.value.upper()}"
+            continue
+        current.append(token)
+    parts.append(current)
+
+    first = _unwrap(parts[0])
+    keyword = _upper(first[0]) if first else ""
+    if keyword == "SELECT":
+        query = _parse_select(first)
+    elif keyword == "WITH":
+        query = parse_query(first)
+    elif keyword == "INSERT":
+        query = _parse_insert(first)
+    elif keyword == "UPDATE":
+        query = _parse_update(first)
+    elif keyword == "DELETE":
+        query = _parse_delete(first)
+    else:
+        query = _empty_query(keyword.lower() or "unknown")
+
+    query["ctes"] = ctes + query["ctes"]
+    for operator, part in zip(operators, parts[1:]):
+        query["set_operations"].append({"operator": operator, "query": parse_query(part)})
+    return query
+
+
+def split_statements(sql: str, bracket_identifiers: bool = True) -> List[List[Token]]:
+    """Tokenize SQL and split it into statements on top-level semicolons."""
+    return [s for s in _split_depth0(tokenize(sql, bracket_identifiers=bracket_identifiers), ";") if s]
+
+
+def parse_sql(sql: str, bracket_identifiers: bool = True) -> Dict:
+    """
+    Parse the first statement of `sql`. The result records sources, joins,
+    select items, clauses and every column reference with the clause it
+    appears in; nested queries are parsed the same way. Pass
+    `bracket_identifiers=False` for PostgreSQL, where brackets are arrays.
+    """
+    statements = split_statements(sql, bracket_identifiers)
+    query = parse_query(statements[0]) if statements else _empty_query("unknown")
+    query["statement_count"] = len(statements)
+    return query
+
+
+def output_columns(query: Dict) -> Optional[List[str]]:
+    """Names of the columns a query returns, or None if it selects `*`."""
+    names = []
+    for item in query.get("select", []):
+        if item["star"]:
+            return None
+        if item["alias"]:
+            names.append(item["alias"])
+        elif item["columns"] and len(item["tokens"]) in (1, 3):
+            names.append(item["columns"][-1][1])
+        else:
+            names.append(item["expression"])
+    return names
+
+
+def iter_queries(query: Dict):
+    """Yield a parsed query and every query nested in it (CTEs, subqueries, set operations)."""
+    yield query
+    for cte in query.get("ctes", []):
+        yield from iter_queries(cte["query"])
+    for subquery in query.get("subqueries", []):
+        yield from iter_queries(subquery)
+    for operation in query.get("set_operations", []):
+        yield from iter_queries(operation["query"])
+
+
+def referenced_tables(sql: str) -> List[str]:
+    """Names of the tables a statement reads or writes, excluding its CTEs."""
+    query = parse_sql(sql)
+    cte_names = {cte["name"].lower() for q in iter_queries(query) for cte in q.get("ctes", [])}
+    names = []
+    for q in iter_queries(query):
+        for source in q.get("sources", []) + [j["source"] for j in q.get("joins", [])]:
+            name = source.get("name")
+            if name and name.lower() not in cte_names and name not in names:
+                names.append(name)
+    return names
+
+
+_COMPARISON_OPERATORS = {"=", "==", "<", ">", "<=", ">=", "<>", "!="}
+
+
+def _bare_column(tokens: List[Token]) -> Optional[Tuple[Optional[str], str]]:
+    """The (qualifier, column) if `tokens` is nothing but a column reference."""
+    if len(tokens) == 1 and _is_identifier(tokens[0]):
+        return (None, identifier_name(tokens[0]))
+    if (
+        len(tokens) in (3, 5)
+        and all(t.value == "." for t in tokens[1::2])
+        and all(t.type in ("word", "qident") for t in tokens[0::2])
+    ):
+        return (identifier_name(tokens[-3]), identifier_name(tokens[-1]))
+    return None
+
+
+def analyze_predicate(tokens: List[Token]) -> Dict:
+    """
+    Classify one condition of a WHERE/ON/HAVING clause: its operator, whether
+    it is an equality, range, LIKE or join predicate, which columns an index
+    could serve, and whether a column is hidden behind a function or
+    arithmetic (non-sargable) or searched with a leading wildcard.
+    """
+    operator, index, depth, negated = None, None, 0, False
+    has_or = False
+    for i, token in enumerate(tokens):
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        elif depth == 0:
+            upper = _upper(token)
+            if upper == "OR":
+                has_or = True
+            if operator is None:
+                if token.type == "op" and token.value in _COMPARISON_OPERATORS:
+                    operator, index = token.value, i
+                elif upper in ("LIKE", "ILIKE", "IN", "BETWEEN", "IS", "EXISTS"):
+                    operator, index = upper, i
+                elif upper == "NOT":
+                    negated = True
+
+    analysis = analyze_expression(tokens)
+    result = {
+        "expression": render_tokens(tokens),
+        "operator": operator,
+        "negated": negated,
+        "kind": "other",
+        "columns": analysis["columns"],
+        "indexable_columns": [],
+        "non_sargable_columns": [],
+        "leading_wildcard": False,
+        "subqueries": analysis["subqueries"],
+    }
+    if has_or:
+        result["kind"] = "or"
+        return result
+    if operator is None or index is None:
+        return result
+
+    left, right = tokens[:index], tokens[index + 1:]
+    if operator == "IS" and right and _upper(right[0]) == "NOT":
+        right = right[1:]
+    left_column = _bare_column(left)
+    right_column = _bare_column(right)
+
+    if operator in ("=", "==") and left_column and right_column:
+        result["kind"] = "join"
+        result["indexable_columns"] = [left_column, right_column]
+        return result
+
+    if operator in ("=", "==", "IN", "IS"):
+        result["kind"] = "equality"
+    elif operator in ("<", ">", "<=", ">=", "BETWEEN"):
+        result["kind"] = "range"
+    elif operator in ("LIKE", "ILIKE"):
+        pattern = right[0].value[1:] if right and right[0].type == "string" else ""
+        result["leading_wildcard"] = pattern[:1] in ("%", "_")
+        result["kind"] = "like" if result["leading_wildcard"] or not pattern else "range"
+
+    if negated or operator in ("<>", "!="):
+        result["kind"] = "other"
+
+    column = left_column or (right_column if not analyze_expression(left)["columns"] else None)
+    if column:
+        result["indexable_columns"] = [column]
+    else:
+        result["non_sargable_columns"] = analyze_expression(left)["columns"]
+    return result
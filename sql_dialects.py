@@ -0,0 +1,791 @@
+"""
+Rule-based SQL dialect transpilation.
+
+SQL is generated once in the canonical PostgreSQL dialect and rewritten
+locally for MySQL and SQLite: identifier quoting, `::` casts and cast
+types, string concatenation, interval and date arithmetic, aggregate
+FILTER clauses, ILIKE, regex matches, and the common functions whose names
+or signatures differ. Constructs with no
+equivalent in the target are left in place and reported as warnings.
+"""
+import re
+from typing import Callable, Dict, List, Optional
+
+from sql_analysis import KEYWORDS, Token, tokenize
+
+
+CANONICAL_DIALECT = "postgres"
+DIALECTS = ("postgres", "mysql", "sqlite")
+DIALECT_NAMES = {"postgres": "PostgreSQL", "mysql": "MySQL", "sqlite": "SQLite"}
+
+_ALIASES = {
+    "postgres": "postgres", "postgresql": "postgres", "pg": "postgres",
+    "mysql": "mysql", "mariadb": "mysql",
+    "sqlite": "sqlite", "sqlite3": "sqlite",
+}
+
+_INTERVAL_RE = re.compile(r"^\s*([+-]?\d+(?:\.\d+)?)\s*([A-Za-z]+?)s?\s*$")
+_INTERVAL_UNITS = {"second", "minute", "hour", "day", "week", "month", "quarter", "year"}
+
+_EXTRACT_SQLITE = {
+    "YEAR": "%Y", "MONTH": "%m", "DAY": "%d", "HOUR": "%H", "MINUTE": "%M",
+    "SECOND": "%S", "DOW": "%w", "DOY": "%j", "WEEK": "%W", "EPOCH": "%s",
+}
+_TRUNC_MYSQL = {
+    "year": "%Y-01-01", "month": "%Y-%m-01", "day": "%Y-%m-%d",
+    "hour": "%Y-%m-%d %H:00:00", "minute": "%Y-%m-%d %H:%i:00",
+}
+_TRUNC_SQLITE = {
+    "year": ("date", ["'start of year'"]),
+    "month": ("date", ["'start of month'"]),
+    "week": ("date", ["'-6 days'", "'weekday 1'"]),
+    "day": ("date", []),
+    "hour": ("strftime", None),
+    "minute": ("strftime", None),
+}
+_FILTER_AGGREGATES = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
+_MULTIWORD_TYPES = {"PRECISION", "VARYING", "WITH", "WITHOUT", "TIME", "ZONE"}
+
+
+def normalize_dialect(name: str) -> str:
+    """Canonical name of a dialect; raises ValueError for unsupported ones."""
+    dialect = _ALIASES.get(str(name or "").strip().lower())
+    if not dialect:
+        raise ValueError(f"Unsupported dialect '{name}'; expected one of {', '.join(DIALECTS)}")
+    return dialect
+
+
+# Token helpers ---------------------------------------------------------------
+
+def _punct(value: str) -> Token:
+    return Token("punct", value)
+
+
+def _space() -> Token:
+    return Token("ws", " ")
+
+
+def _upper(token: Token) -> str:
+    return token.value.upper() if token.type == "word" else ""
+
+
+def _is_space(token: Token) -> bool:
+    return token.type in ("ws", "comment")
+
+
+def _last(tokens: List[Token], end: Optional[int] = None) -> int:
+    """Index of the last non-whitespace token before `end`, or -1."""
+    j = (len(tokens) if end is None else end) - 1
+    while j >= 0 and _is_space(tokens[j]):
+        j -= 1
+    return j
+
+
+def _next(tokens: List[Token], start: int) -> int:
+    """Index of the first non-whitespace token after `start`, or len(tokens)."""
+    j = start + 1
+    while j < len(tokens) and _is_space(tokens[j]):
+        j += 1
+    return j
+
+
+def _close(tokens: List[Token], start: int) -> int:
+    depth = 0
+    for j in range(start, len(tokens)):
+        if tokens[j].value == "(":
+            depth += 1
+        elif tokens[j].value == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(tokens) - 1
+
+
+def _open(tokens: List[Token], end: int) -> int:
+    depth = 0
+    for j in range(end, -1, -1):
+        if tokens[j].value == ")":
+            depth += 1
+        elif tokens[j].value == "(":
+            depth -= 1
+            if depth == 0:
+                return j
+    return 0
+
+
+def _operand_start(tokens: List[Token], end: int) -> int:
+    """Start of the operand (column, literal, call or parenthesized group) ending at `end`."""
+    j = end
+    if tokens[j].value == ")":
+        j = _open(tokens, j)
+        if j > 0 and tokens[j - 1].type == "word" and tokens[j - 1].value.upper() not in KEYWORDS:
+            j -= 1
+        else:
+            return j
+    while j >= 2 and tokens[j - 1].value == "." and tokens[j - 2].type in ("word", "qident"):
+        j -= 2
+    return j
+
+
+def _operand_end(tokens: List[Token], start: int) -> int:
+    """End of the operand starting at `start`."""
+    j = start
+    if j >= len(tokens):
+        return len(tokens) - 1
+    if tokens[j].value == "(":
+        return _close(tokens, j)
+    while j + 2 < len(tokens) and tokens[j + 1].value == "." and tokens[j + 2].type in ("word", "qident"):
+        j += 2
+    if j + 1 < len(tokens) and tokens[j + 1].value == "(" and tokens[j].type == "word":
+        return _close(tokens, j + 1)
+    return j
+
+
+def _strip(tokens: List[Token]) -> List[Token]:
+    start, end = 0, len(tokens)
+    while start < end and _is_space(tokens[start]):
+        start += 1
+    while end > start and _is_space(tokens[end - 1]):
+        end -= 1
+    return tokens[start:end]
+
+
+def _split_args(tokens: List[Token]) -> List[List[Token]]:
+    """Split the tokens between a call's parentheses on top-level commas."""
+    args, current, depth = [], [], 0
+    for token in tokens:
+        if token.value == "(":
+            depth += 1
+        elif token.value == ")":
+            depth -= 1
+        if token.value == "," and depth == 0:
+            args.append(_strip(current))
+            current = []
+        else:
+            current.append(token)
+    if current or args:
+        args.append(_strip(current))
+    return args
+
+
+def _call(name: str, *args: List[Token]) -> List[Token]:
+    tokens = [Token("word", name), _punct("(")]
+    for i, arg in enumerate(args):
+        if i:
+            tokens += [_punct(","), _space()]
+        tokens += arg
+    return tokens + [_punct(")")]
+
+
+def _string(value: str) -> List[Token]:
+    return [Token("string", "'" + value.replace("'", "''") + "'")]
+
+
+def _literal(token: Token) -> Optional[str]:
+    if token.type != "string":
+        return None
+    return token.value[1:-1].replace("''", "'")
+
+
+def _words(text: str) -> List[Token]:
+    return tokenize(text, keep_whitespace=True, bracket_identifiers=False)
+
+
+# Rewrite passes ---------------------------------------------------------------
+
+def _double_colon_casts(tokens: List[Token], target: str, warnings: List[str]) -> List[Token]:
+    """`expr::type` -> `CAST(expr AS type)`."""
+    out: List[Token] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        end = _last(out)
+        if token.value != "::" or end < 0:
+            out.append(token)
+            i += 1
+            continue
+        start = _operand_start(out, end)
+        operand = out[start:end + 1]
+        del out[start:]
+
+        j = _next(tokens, i)
+        type_end = j
+        while True:
+            k = _next(tokens, type_end)
+            if k < len(tokens) and _upper(tokens[k]) in _MULTIWORD_TYPES:
+                type_end = k
+            else:
+                break
+        k = type_end + 1
+        if k < len(tokens) and tokens[k].value == "(":
+            type_end = _close(tokens, k)
+        if type_end + 1 < len(tokens) and tokens[type_end + 1].value == "[]":
+            type_end += 1
+        out += [Token("word", "CAST"), _punct("(")] + operand
+        out += [_space(), Token("word", "AS"), _space()] + tokens[j:type_end + 1] + [_punct(")")]
+        i = type_end + 1
+    return out
+
+
+def _cast_type(type_tokens: List[Token], target: str) -> Optional[str]:
+    """The target spelling of a cast type, a conversion function name, or None to keep it."""
+    words = " ".join(t.value.upper() for t in type_tokens if t.type == "word")
+    args = "".join(t.value for t in type_tokens[next(
+        (i for i, t in enumerate(type_tokens) if t.value == "("), len(type_tokens)):])
+    base = words.split(" ")[0] if words else ""
+    integers = ("INT", "INTEGER", "BIGINT", "SMALLINT", "INT2", "INT4", "INT8", "SERIAL", "BIGSERIAL")
+    decimals = ("NUMERIC", "DECIMAL")
+    floats = ("REAL", "FLOAT", "FLOAT4", "FLOAT8", "DOUBLE")
+    texts = ("TEXT", "VARCHAR", "CHAR", "CHARACTER", "UUID", "CITEXT")
+
+    if target == "mysql":
+        if base in integers or base in ("BOOLEAN", "BOOL"):
+            return "SIGNED"
+        if base in decimals:
+            return "DECIMAL" + args
+        if base in floats:
+            return "DOUBLE"
+        if base == "UUID":
+            return "CHAR(36)"
+        if base in texts:
+            return "CHAR" + (args if base in ("VARCHAR", "CHAR", "CHARACTER") else "")
+        if base in ("TIMESTAMP", "TIMESTAMPTZ"):
+            return "DATETIME"
+        if base in ("JSON", "JSONB"):
+            return "JSON"
+        return None
+    if target == "sqlite":
+        if base == "DATE":
+            return "date()"
+        if base in ("TIMESTAMP", "TIMESTAMPTZ"):
+            return "datetime()"
+        if base == "TIME":
+            return "time()"
+        if base in integers or base in ("BOOLEAN", "BOOL"):
+            return "INTEGER"
+        if base in decimals or base in floats:
+            return "REAL"
+        if base in texts or base in ("JSON", "JSONB"):
+            return "TEXT"
+    return None
+
+
+def _map_casts(tokens: List[Token], target: str, warnings: List[str]) -> List[Token]:
+    """Rewrite CAST target types the target dialect does not accept."""
+    tokens = list(tokens)
+    starts = [
+        i for i, t in enumerate(tokens)
+        if _upper(t) == "CAST" and i + 1 < len(tokens) and tokens[i + 1].value == "("
+    ]
+    for i in reversed(starts):
+        close = _close(tokens, i + 1)
+        depth, as_index = 0, None
+        for j in range(i + 2, close):
+            if tokens[j].value == "(":
+                depth += 1
+            elif tokens[j].value == ")":
+                depth -= 1
+            elif depth == 0 and _upper(tokens[j]) == "AS":
+                as_index = j
+        if as_index is None:
+            continue
+        expression = _strip(tokens[i + 2:as_index])
+        mapped = _cast_type(_strip(tokens[as_index + 1:close]), target)
+        if mapped is None:
+            continue
+        if mapped.endswith("()"):
+            replacement = _call(mapped[:-2], expression)
+        else:
+            replacement = (
+                [Token("word", "CAST"), _punct("(")] + expression
+                + [_space(), Token("word", "AS"), _space()] + _words(mapped) + [_punct(")")]
+            )
+        tokens[i:close + 1] = replacement
+    return tokens
+
+
+def _concat(tokens: List[Token], target: str, warnings: List[str]) -> List[Token]:
+    """MySQL: `a || b || c` -> `CONCAT(a, b, c)`."""
+    out: List[Token] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        end = _last(out)
+        if token.value != "||" or end < 0:
+            out.append(token)
+            i += 1
+            continue
+        start = _operand_start(out, end)
+        operands = [out[start:end + 1]]
+        del out[start:]
+        while True:
+            j = _next(tokens, i)
+            if j >= len(tokens):
+                break
+            operand_end = _operand_end(tokens, j)
+            operands.append(_concat(tokens[j:operand_end + 1], target, warnings))
+            k = _next(tokens, operand_end)
+            i = operand_end + 1
+            if k < len(tokens) and tokens[k].value == "||":
+                i = k
+                continue
+            break
+        out += _call("CONCAT", *operands)
+    return out
+
+
+def _intervals(tokens: List[Token], target: str, warnings: List[str]) -> List[Token]:
+    """Interval literals and `expr +/- INTERVAL '...'` arithmetic."""
+    out: List[Token] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        j = _next(tokens, i)
+        if _upper(token) != "INTERVAL" or j >= len(tokens) or tokens[j].type != "string":
+            out.append(token)
+            i += 1
+            continue
+        literal = _literal(tokens[j])
+        match = _INTERVAL_RE.match(literal or "")
+        unit = match.group(2).lower() if match else ""
+        if not match or unit not in _INTERVAL_UNITS:
+            warnings.append(f"Interval '{literal}' could not be translated to {DIALECT_NAMES[target]}")
+            out.append(token)
+            i += 1
+            continue
+        amount = match.group(1)
+
+        if target == "mysql":
+            out += [token, _space(), Token("number", amount.lstrip("+")), _space(), Token("word", unit.upper())]
+            i = j + 1
+            continue
+
+        op_index = _last(out)
+        if op_index < 0 or out[op_index].value not in ("+", "-"):
+            warnings.append(f"INTERVAL '{literal}' is only translated to SQLite in `expr +/- INTERVAL` form")
+            out.append(token)
+            i += 1
+            continue
+        operand_end = _last(out, op_index)
+        start = _operand_start(out, operand_end)
+        operand = out[start:operand_end + 1]
+        sign = out[op_index].value
+        del out[start:]
+        number = float(amount) * (7 if unit == "week" else 3 if unit == "quarter" else 1)
+        if sign == "-":
+            number = -number
+        sqlite_unit = "day" if unit == "week" else "month" if unit == "quarter" else unit
+        text = f"{number:+g} {sqlite_unit}{'s' if abs(number) != 1 else ''}"
+        function = "date" if operand and _upper(operand[0]) == "CURRENT_DATE" else "datetime"
+        out += _call(function, operand, _string(text))
+        i = j + 1
+    return out
+
+
+def _is_date(operand: List[Token]) -> bool:
+    """Whether an operand is a date: CURRENT_DATE, DATE '...', DATE(...) or CAST(... AS DATE)."""
+    if not operand:
+        return False
+    first = _upper(operand[0])
+    if len(operand) == 1:
+        return first == "CURRENT_DATE"
+    if first == "DATE":
+        return operand[-1].type == "string" or operand[_next(operand, 0)].value == "("
+    if first == "CAST" and operand[-1].value == ")":
+        return _upper(operand[_last(operand, len(operand) - 1)]) == "DATE"
+    return False
+
+
+def _date_arithmetic(tokens: List[Token], target: str, warnings: List[str]) -> List[Token]:
+    """`date +/- n` (n days in PostgreSQL; numeric arithmetic elsewhere)."""
+    out: List[Token] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        end = _last(out)
+        if token.value not in ("+", "-") or token.type != "op" or end < 0:
+            out.append(token)
+            i += 1
+            continue
+        start = _operand_start(out, end)
+        if start > 0 and out[start].type == "string" and _upper(out[_last(out, start)]) == "DATE":
+            start = _last(out, start)  # DATE '...'
+        operand = out[start:end + 1]
+        if not _is_date(operand):
+            out.append(token)
+            i += 1
+            continue
+        j = _next(tokens, i)
+        k = _next(tokens, j)
+        whole = j < len(tokens) and tokens[j].type == "number" and tokens[j].value.isdigit()
+        if not whole or (k < len(tokens) and tokens[k].value in ("*", "/", "%", "||")):
+            if j < len(tokens) and _upper(tokens[j]) not in ("INTERVAL", "DATE"):
+                warnings.append(
+                    f"Date arithmetic other than `date +/- <days>` is not translated to {DIALECT_NAMES[target]}"
+                )
+            out.append(token)
+            i += 1
+            continue
+        del out[start:]
+        days = tokens[j].value
+        if target == "mysql":
+            interval = [Token("word", "INTERVAL"), _space(), Token("number", days), _space(), Token("word", "DAY")]
+            out += _call("DATE_ADD" if token.value == "+" else "DATE_SUB", operand, interval)
+        else:
+            out += _call("date", operand, _string(f"{token.value}{days} days"))
+        i = j + 1
+    return out
+
+
+def _aggregate_filters(tokens: List[Token], target: str, warnings: List[str]) -> List[Token]:
+    """MySQL: `AGG(x) FILTER (WHERE c)` -> `AGG(CASE WHEN c THEN x END)`."""
+    out: List[Token] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        end = _last(out)
+        j = _next(tokens, i)
+        k = _next(tokens, j)
+        if not (_upper(token) == "FILTER" and end >= 0 and out[end].value == ")"
+                and j < len(tokens) and tokens[j].value == "(" and k < len(tokens) and _upper(tokens[k]) == "WHERE"):
+            out.append(token)
+            i += 1
+            continue
+        close = _close(tokens, j)
+        condition = _strip(tokens[k + 1:close])
+        start = _operand_start(out, end)
+        name = _upper(out[start])
+        args = _split_args(out[start + 2:end]) if name else []
+        if name not in _FILTER_AGGREGATES or len(args) != 1:
+            warnings.append(f"MySQL does not support FILTER (WHERE ...) on {name or 'this aggregate'}")
+            out.append(token)
+            i += 1
+            continue
+        arg = args[0]
+        prefix = []
+        if arg and _upper(arg[0]) == "DISTINCT":
+            prefix, arg = [arg[0], _space()], _strip(arg[1:])
+        value = [Token("number", "1")] if len(arg) == 1 and arg[0].value == "*" else arg
+        case = _words("CASE WHEN ") + condition + _words(" THEN ") + value + _words(" END")
+        del out[start:]
+        out += _call(name, prefix + case)
+        i = close + 1
+    return out
+
+
+def _distinct_from(tokens: List[Token], target: str, warnings: List[str]) -> List[Token]:
+    """`IS [NOT] DISTINCT FROM` for targets without it."""
+    out: List[Token] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        positions, j = [], i
+        for _ in range(3):
+            j = _next(tokens, j)
+            positions.append(j)
+        words = [_upper(tokens[p]) if p < len(tokens) else "" for p in positions]
+        if _upper(token) == "IS" and words[:2] == ["DISTINCT", "FROM"]:
+            negated, last = False, positions[1]
+        elif _upper(token) == "IS" and words == ["NOT", "DISTINCT", "FROM"]:
+            negated, last = True, positions[2]
+        else:
+            out.append(token)
+            i += 1
+            continue
+
+        if target == "sqlite":
+            out += _words("IS" if negated else "IS NOT")
+            i = last + 1
+        elif negated:
+            out.append(Token("op", "<=>"))
+            i = last + 1
+        else:
+            end = _last(out)
+            start = _operand_start(out, end)
+            left = out[start:end + 1]
+            del out[start:]
+            right_start = _next(tokens, last)
+            right_end = _operand_end(tokens, right_start)
+            out += [Token("word", "NOT"), _space(), _punct("(")] + left + [_space(), Token("op", "<=>"), _space()]
+            out += tokens[right_start:right_end + 1] + [_punct(")")]
+            i = right_end + 1
+    return out
+
+
+def _regex_matches(tokens: List[Token], target: str, warnings: List[str]) -> List[Token]:
+    """`a ~ b`, `a ~* b` and their `!~` negations -> `a [NOT] REGEXP b`."""
+    out: List[Token] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        end = _last(out)
+        if token.value != "~" or end < 0 or (
+            out[end].type in ("op", "punct") and out[end].value not in (")", "!")
+        ) or (out[end].type == "word" and out[end].value.upper() in KEYWORDS):
+            # Unary ~ is bitwise NOT
+            out.append(token)
+            i += 1
+            continue
+        negated = out[end].value == "!"
+        if negated:
+            del out[end:]
+        insensitive = i + 1 < len(tokens) and tokens[i + 1].value == "*"
+        right_start = _next(tokens, i + 1 if insensitive else i)
+        right_end = _operand_end(tokens, right_start)
+        right = tokens[right_start:right_end + 1]
+
+        while out and _is_space(out[-1]):
+            out.pop()
+        out += _words(" NOT REGEXP " if negated else " REGEXP ")
+        if target == "mysql":
+            # REGEXP follows the collation: make the case rule explicit
+            collation = "utf8mb4_general_ci" if insensitive else "utf8mb4_bin"
+            out += right + _words(f" COLLATE {collation}")
+        else:
+            warnings.append("SQLite has no built-in REGEXP; the connection must register a regexp() function")
+            pattern = _literal(right[0]) if len(right) == 1 else None
+            if insensitive and pattern is not None:
+                out += _string("(?i)" + pattern)
+            else:
+                if insensitive:
+                    warnings.append("SQLite REGEXP has no case-insensitive form; ~* was translated as case-sensitive")
+                out += right
+        i = right_end + 1
+    return out
+
+
+def _rewrite_function(name: str, args: List[List[Token]], target: str, warnings: List[str]) -> Optional[List[Token]]:
+    """Replacement tokens for a function call, or None to keep it."""
+    if name == "RANDOM" and target == "mysql":
+        return _call("RAND")
+    if name == "NOW" and target == "sqlite":
+        return [Token("word", "CURRENT_TIMESTAMP")]
+    if name == "LENGTH" and target == "mysql":
+        return _call("CHAR_LENGTH", *args)
+    if name in ("GREATEST", "LEAST") and target == "sqlite":
+        return _call("MAX" if name == "GREATEST" else "MIN", *args)
+
+    if name == "STRING_AGG" and len(args) == 2:
+        separator, order = args[1], []
+        for k, t in enumerate(separator):
+            if _upper(t) == "ORDER":
+                separator, order = _strip(separator[:k]), separator[k:]
+                break
+        if target == "mysql":
+            body = args[0] + ([_space()] + order if order else []) + [_space(), Token("word", "SEPARATOR"), _space()]
+            return _call("GROUP_CONCAT", body + separator)
+        if order:
+            warnings.append("SQLite GROUP_CONCAT ignores the ORDER BY of STRING_AGG")
+        return _call("GROUP_CONCAT", args[0], separator)
+
+    if name in ("DATE_TRUNC",) and len(args) == 2 and len(args[0]) == 1:
+        unit = (_literal(args[0][0]) or "").lower()
+        value = args[1]
+        if target == "mysql" and unit in _TRUNC_MYSQL:
+            if unit == "day":
+                return _call("DATE", value)
+            return _call("DATE_FORMAT", value, _string(_TRUNC_MYSQL[unit]))
+        if target == "mysql" and unit == "week":
+            return _call("DATE", value + _words(" - INTERVAL ") + _call("WEEKDAY", value) + _words(" DAY"))
+        if target == "sqlite" and unit in _TRUNC_SQLITE:
+            function, modifiers = _TRUNC_SQLITE[unit]
+            if function == "strftime":
+                pattern = "%Y-%m-%d %H:00:00" if unit == "hour" else "%Y-%m-%d %H:%M:00"
+                return _call("strftime", _string(pattern), value)
+            return _call(function, value, *[[Token("string", m)] for m in modifiers])
+        warnings.append(f"DATE_TRUNC('{unit}', ...) has no {DIALECT_NAMES[target]} translation")
+        return None
+
+    if name in ("EXTRACT", "DATE_PART"):
+        if name == "EXTRACT":
+            body = _strip(sum(args, []))
+            k = next((k for k, t in enumerate(body) if _upper(t) == "FROM"), None)
+            if k is None:
+                return None
+            unit, value = "".join(t.value for t in body[:k]).strip().upper(), _strip(body[k + 1:])
+        else:
+            if len(args) != 2 or len(args[0]) != 1:
+                return None
+            unit, value = (_literal(args[0][0]) or "").upper(), args[1]
+        unit = unit.rstrip("S") if unit.endswith("S") and unit != "DOWS" else unit
+        if target == "mysql":
+            if unit == "DOW":
+                return _words("(") + _call("DAYOFWEEK", value) + _words(" - 1)")
+            if unit == "DOY":
+                return _call("DAYOFYEAR", value)
+            if unit == "EPOCH":
+                return _call("UNIX_TIMESTAMP", value)
+            return _call("EXTRACT", [Token("word", unit), _space(), Token("word", "FROM"), _space()] + value)
+        if target == "sqlite":
+            if unit == "QUARTER":
+                month = _call("CAST", _call("strftime", _string("%m"), value) + _words(" AS INTEGER"))
+                return _words("((") + month + _words(" + 2) / 3)")
+            if unit in _EXTRACT_SQLITE:
+                return _call("CAST", _call("strftime", _string(_EXTRACT_SQLITE[unit]), value) + _words(" AS INTEGER"))
+            warnings.append(f"EXTRACT({unit} ...) has no SQLite translation")
+        return None
+
+    if name == "POSITION" and target == "sqlite" and len(args) == 1:
+        body = args[0]
+        k = next((k for k, t in enumerate(body) if _upper(t) == "IN"), None)
+        if k is not None:
+            return _call("INSTR", _strip(body[k + 1:]), _strip(body[:k]))
+    if name in ("TO_CHAR", "AGE", "GENERATE_SERIES", "ARRAY_AGG") and target != "postgres":
+        warnings.append(f"{name}() has no direct {DIALECT_NAMES[target]} equivalent; review the translated query")
+    return None
+
+
+def _functions(tokens: List[Token], target: str, warnings: List[str]) -> List[Token]:
+    """Rename or restructure function calls, innermost first."""
+    tokens = list(tokens)
+    calls = [
+        i for i, t in enumerate(tokens)
+        if t.type == "word" and i + 1 < len(tokens) and tokens[i + 1].value == "("
+    ]
+    for i in reversed(calls):
+        close = _close(tokens, i + 1)
+        args = _split_args(tokens[i + 2:close])
+        replacement = _rewrite_function(tokens[i].value.upper(), args, target, warnings)
+        if replacement is not None:
+            tokens[i:close + 1] = replacement
+    return tokens
+
+
+def _keywords(tokens: List[Token], target: str, warnings: List[str]) -> List[Token]:
+    """ILIKE, identifier quoting, and constructs the target cannot express."""
+    out: List[Token] = []
+    for i, token in enumerate(tokens):
+        upper = _upper(token)
+        if upper == "ILIKE":
+            token = Token("word", "LIKE")
+        elif token.type == "qident" and len(token.value) > 2:
+            name = token.value[1:-1]
+            if token.value[0] == '"':
+                name = name.replace('""', '"')
+            if target == "mysql":
+                token = Token("qident", "`" + name.replace("`", "``") + "`")
+            else:
+                token = Token("qident", '"' + name.replace('"', '""') + '"')
+        elif upper == "NULLS" and target == "mysql":
+            j = _next(tokens, i)
+            if j < len(tokens) and _upper(tokens[j]) in ("FIRST", "LAST"):
+                warnings.append("MySQL does not support NULLS FIRST/LAST; NULLs sort first ascending")
+        elif upper == "FULL" and target == "mysql":
+            warnings.append("MySQL does not support FULL OUTER JOIN; rewrite as a UNION of LEFT and RIGHT joins")
+        elif upper == "RETURNING" and target == "mysql":
+            warnings.append("MySQL does not support RETURNING")
+        elif upper == "CONFLICT" and target == "mysql" and _upper(tokens[_last(tokens, i)]) == "ON":
+            warnings.append("MySQL does not support INSERT ... ON CONFLICT; use ON DUPLICATE KEY UPDATE "
+                            "(or INSERT IGNORE for DO NOTHING)")
+        elif token.type == "other" and token.value == "$":
+            warnings.append(f"{DIALECT_NAMES[target]} does not support dollar-quoted strings ($$...$$); "
+                            "use single-quoted strings")
+        elif token.value == "[" or (upper == "ARRAY" and _next(tokens, i) < len(tokens)
+                                    and tokens[_next(tokens, i)].value == "("):
+            warnings.append(f"{DIALECT_NAMES[target]} has no array equivalent for ARRAY[...], ARRAY(...) "
+                            "or [subscripts]; review the translated query")
+        elif upper == "DISTINCT":
+            j = _next(tokens, i)
+            if j < len(tokens) and _upper(tokens[j]) == "ON":
+                warnings.append(f"{DIALECT_NAMES[target]} does not support DISTINCT ON; use ROW_NUMBER() instead")
+        out.append(token)
+    return out
+
+
+def _drop_nulls_ordering(tokens: List[Token]) -> List[Token]:
+    out: List[Token] = []
+    i = 0
+    while i < len(tokens):
+        j = _next(tokens, i)
+        if _upper(tokens[i]) == "NULLS" and j < len(tokens) and _upper(tokens[j]) in ("FIRST", "LAST"):
+            while out and _is_space(out[-1]):
+                out.pop()
+            i = j + 1
+            continue
+        out.append(tokens[i])
+        i += 1
+    return out
+
+
+_PASSES: List[Callable[[List[Token], str, List[str]], List[Token]]] = [
+    _double_colon_casts,
+    _intervals,
+    _date_arithmetic,
+    _distinct_from,
+    _regex_matches,
+    _functions,
+    _map_casts,
+    _keywords,
+]
+
+
+def transpile(sql: str, dialect: str) -> Dict:
+    """
+    Rewrite canonical (PostgreSQL) SQL for `dialect`. Returns the dialect,
+    the rewritten SQL and warnings for anything that could not be
+    translated.
+    """
+    dialect = normalize_dialect(dialect)
+    warnings: List[str] = []
+    if dialect == CANONICAL_DIALECT:
+        return {"dialect": dialect, "sql": sql, "warnings": warnings}
+
+    tokens = tokenize(sql, keep_whitespace=True, bracket_identifiers=False)
+    if dialect == "mysql":
+        tokens = _concat(tokens, dialect, warnings)
+        tokens = _aggregate_filters(tokens, dialect, warnings)
+    for rewrite in _PASSES:
+        tokens = rewrite(tokens, dialect, warnings)
+    if dialect == "mysql":
+        tokens = _drop_nulls_ordering(tokens)
+
+    return {
+        "dialect": dialect,
+        "sql": "".join(t.value for t in tokens),
+        "warnings": list(dict.fromkeys(warnings)),
+    }
+
+
+# (canonical SQL, target, expected SQL, expected warning fragment or None)
+_REGRESSIONS = [
+    ("SELECT * FROM t WHERE a = ANY(ARRAY[1,2])", "mysql",
+     "SELECT * FROM t WHERE a = ANY(ARRAY[1,2])", "no array equivalent"),
+    ("SELECT * FROM t WHERE a = ANY(ARRAY[1,2])", "sqlite",
+     "SELECT * FROM t WHERE a = ANY(ARRAY[1,2])", "no array equivalent"),
+    ("SELECT tags[1] FROM t", "mysql", "SELECT tags[1] FROM t", "no array equivalent"),
+    ("SELECT tags[1] FROM t", "sqlite", "SELECT tags[1] FROM t", "no array equivalent"),
+    ("SELECT COUNT(*) FILTER (WHERE paid) FROM t", "mysql",
+     "SELECT COUNT(CASE WHEN paid THEN 1 END) FROM t", None),
+    ("SELECT * FROM t WHERE d >= CURRENT_DATE - 7", "mysql",
+     "SELECT * FROM t WHERE d >= DATE_SUB(CURRENT_DATE, INTERVAL 7 DAY)", None),
+    ("SELECT * FROM t WHERE d >= CURRENT_DATE - 7", "sqlite",
+     "SELECT * FROM t WHERE d >= date(CURRENT_DATE, '-7 days')", None),
+    ("SELECT * FROM t WHERE name ~ '^A' AND code !~* 'x'", "mysql",
+     "SELECT * FROM t WHERE name REGEXP '^A' COLLATE utf8mb4_bin AND code NOT REGEXP 'x' COLLATE utf8mb4_general_ci",
+     None),
+    ("SELECT * FROM t WHERE name ~* '^a'", "sqlite",
+     "SELECT * FROM t WHERE name REGEXP '(?i)^a'", "register a regexp() function"),
+    ("SELECT * FROM t WHERE name !~ pattern", "sqlite",
+     "SELECT * FROM t WHERE name NOT REGEXP pattern", "register a regexp() function"),
+    ("SELECT ~flags FROM t", "mysql", "SELECT ~flags FROM t", None),
+    ("INSERT INTO t (id) VALUES (1) ON CONFLICT DO NOTHING", "mysql",
+     "INSERT INTO t (id) VALUES (1) ON CONFLICT DO NOTHING", "ON DUPLICATE KEY UPDATE"),
+    ("SELECT $$it's$$ FROM t", "mysql", "SELECT $$it's$$ FROM t", "dollar-quoted"),
+]
+
+
+def main():
+    """Check the transpiler against known translations; exits non-zero on a mismatch."""
+    failures = 0
+    for sql, target, expected, warning in _REGRESSIONS:
+        result = transpile(sql, target)
+        warned = any(warning in w for w in result["warnings"]) if warning else not result["warnings"]
+        if result["sql"] != expected or not warned:
+            failures += 1
+            print(f"FAIL {target}: {sql}\n  got {result['sql']} {result['warnings']}\n  expected {expected}")
+    print(f"{len(_REGRESSIONS) - failures}/{len(_REGRESSIONS)} translations as expected")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
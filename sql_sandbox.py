@@ -0,0 +1,304 @@
+"""
+Sandbox dry runs of generated SQL in an in-memory SQLite database.
+
+The schema DDL is materialized once per schema version (optionally with
+synthetic rows) and cached; each dry run executes inside a transaction
+that is rolled back, under a row and time limit, and reports the
+`EXPLAIN QUERY PLAN` output along with the measured runtime. The SQL may
+not end or nest that transaction, attach other databases or change
+settings with a PRAGMA, so nothing it does outlives the dry run.
+"""
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from schema_parser import parse_schema
+
+
+_SQLITE_DENY = {
+    sqlite3.SQLITE_ATTACH,
+    sqlite3.SQLITE_DETACH,
+    sqlite3.SQLITE_TRANSACTION,
+    sqlite3.SQLITE_SAVEPOINT,
+}
+# Pragmas that only read the schema; every other pragma is denied
+_SQLITE_READ_PRAGMAS = {
+    "table_info", "table_xinfo", "table_list", "index_list", "index_info", "index_xinfo",
+    "foreign_key_list", "collation_list", "function_list",
+}
+
+
+def _json_value(value):
+    """A result value as JSON can carry it: BLOBs become hex strings."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    return value
+
+
+def sqlite_type(column_type: str) -> str:
+    """Map a declared column type to its SQLite equivalent."""
+    upper = (column_type or "").upper()
+    if "INT" in upper or "BOOL" in upper or "SERIAL" in upper:
+        return "INTEGER"
+    if any(t in upper for t in ("DEC", "NUMERIC", "FLOAT", "REAL", "DOUBLE", "MONEY")):
+        return "REAL"
+    if "BLOB" in upper or "BINARY" in upper or "BYTEA" in upper:
+        return "BLOB"
+    return "TEXT"
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def schema_to_sqlite_ddl(schema: str) -> List[str]:
+    """Translate a parsed schema into SQLite CREATE TABLE statements."""
+    statements = []
+    for table in parse_schema(schema).values():
+        definitions = []
+        single_pk = len(table["primary_key"]) == 1
+        for column in table["columns"]:
+            definition = f"{_quote(column['name'])} {sqlite_type(column['type'])}"
+            if single_pk and column["primary_key"]:
+                definition += " PRIMARY KEY"
+            elif not column["nullable"]:
+                definition += " NOT NULL"
+            if column["unique"] and not column["primary_key"]:
+                definition += " UNIQUE"
+            definitions.append(definition)
+        if len(table["primary_key"]) > 1:
+            definitions.append(f"PRIMARY KEY ({', '.join(_quote(c) for c in table['primary_key'])})")
+        for fk in table["foreign_keys"]:
+            target = _quote(fk["references_table"])
+            if fk["references_column"]:
+                target += f"({_quote(fk['references_column'])})"
+            definitions.append(f"FOREIGN KEY ({_quote(fk['column'])}) REFERENCES {target}")
+        if definitions:
+            statements.append(f"CREATE TABLE {_quote(table['name'])} ({', '.join(definitions)})")
+    return statements
+
+
+def _synthetic_value(column: Dict, row: int, rng: random.Random, fk_sizes: Dict[str, int]):
+    """A plausible value for `column` in synthetic row number `row` (1-based)."""
+    name = column["name"].lower()
+    affinity = sqlite_type(column["type"])
+    upper = column["type"].upper()
+
+    if column["references"] and column["references"]["table"].lower() in fk_sizes:
+        size = fk_sizes[column["references"]["table"].lower()]
+        return rng.randint(1, size) if size else None
+    if column["primary_key"] and affinity == "INTEGER":
+        return row
+    if "BOOL" in upper or name.startswith(("is_", "has_")):
+        return rng.randint(0, 1)
+    if "DATE" in upper or "TIME" in upper:
+        day = date(2024, 1, 1) + timedelta(days=rng.randint(0, 730))
+        if "TIMESTAMP" in upper or "DATETIME" in upper:
+            return f"{day.isoformat()} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+        if upper.startswith("TIME"):
+            return f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+        return day.isoformat()
+    if affinity == "INTEGER":
+        return rng.randint(1, 100)
+    if affinity == "REAL":
+        return round(rng.uniform(1, 1000), 2)
+    if "email" in name:
+        return f"user{row}@example.com"
+    if "status" in name:
+        return rng.choice(["active", "pending", "completed", "cancelled"])
+    return f"{name}_{row}"
+
+
+def _load_order(tables: Dict[str, Dict]) -> List[Dict]:
+    """Tables ordered so referenced tables come before the tables referencing them."""
+    ordered, seen = [], set()
+
+    def visit(table, path):
+        key = table["name"].lower()
+        if key in seen or key in path:
+            return
+        path.add(key)
+        for fk in table["foreign_keys"]:
+            target = next((t for n, t in tables.items() if n.lower() == fk["references_table"].lower()), None)
+            if target:
+                visit(target, path)
+        seen.add(key)
+        ordered.append(table)
+
+    for table in tables.values():
+        visit(table, set())
+    return ordered
+
+
+class SQLiteSandbox:
+    """
+    Cache of in-memory SQLite databases, one per (schema version, sample
+    rows) pair, used to dry-run generated SQL.
+    """
+
+    def __init__(self, max_databases: int = 16):
+        self.max_databases = max_databases
+        self._databases: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def schema_version(schema: str) -> str:
+        """Content hash identifying a schema definition."""
+        return hashlib.sha256((schema or "").encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _authorize(action, arg1, arg2, *args):
+        if action in _SQLITE_DENY:
+            return sqlite3.SQLITE_DENY
+        if action == sqlite3.SQLITE_PRAGMA and (arg1 or "").lower() not in _SQLITE_READ_PRAGMAS:
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+    def _build_database(self, schema: str, sample_rows: int) -> sqlite3.Connection:
+        conn = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        for statement in schema_to_sqlite_ddl(schema):
+            conn.execute(statement)
+
+        if sample_rows > 0:
+            rng = random.Random(0)
+            tables = parse_schema(schema)
+            sizes: Dict[str, int] = {}
+            conn.execute("BEGIN")
+            for table in _load_order(tables):
+                columns = table["columns"]
+                if not columns:
+                    continue
+                placeholders = ", ".join("?" for _ in columns)
+                names = ", ".join(_quote(c["name"]) for c in columns)
+                rows = [
+                    [_synthetic_value(c, row, rng, sizes) for c in columns]
+                    for row in range(1, sample_rows + 1)
+                ]
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO {_quote(table['name'])} ({names}) VALUES ({placeholders})", rows
+                )
+                sizes[table["name"].lower()] = sample_rows
+            conn.execute("COMMIT")
+            conn.execute("ANALYZE")
+        return conn
+
+    def _database(self, schema: str, sample_rows: int):
+        key = (self.schema_version(schema), sample_rows)
+        with self._lock:
+            entry = self._databases.get(key)
+            if entry:
+                self._databases.move_to_end(key)
+                return entry
+        conn = self._build_database(schema, sample_rows)
+        with self._lock:
+            entry = self._databases.setdefault(key, (conn, threading.Lock()))
+            while len(self._databases) > self.max_databases:
+                self._databases.popitem(last=False)
+            return entry
+
+    def dry_run(
+        self,
+        sql: str,
+        schema: str,
+        sample_rows: int = 0,
+        row_limit: int = 100,
+        time_limit_ms: int = 1000,
+    ) -> Dict:
+        """
+        Execute `sql` against the schema's sandbox database and roll back.
+        Returns whether it ran, any error, the rows it produced (up to
+        `row_limit`, BLOBs as hex strings), the query plan and the measured
+        runtime.
+        """
+        result = {
+            "executed": False,
+            "error": None,
+            "schema_version": self.schema_version(schema),
+            "sample_rows": sample_rows,
+            "columns": [],
+            "rows": [],
+            "row_count": 0,
+            "truncated": False,
+            "runtime_ms": None,
+            "query_plan": [],
+        }
+        sql = (sql or "").strip().rstrip(";").strip()
+        if not sql:
+            result["error"] = "No SQL to run"
+            return result
+
+        try:
+            conn, lock = self._database(schema, sample_rows)
+        except sqlite3.Error as e:
+            result["error"] = f"Could not build sandbox schema: {e}"
+            return result
+
+        with lock:
+            deadline = time.perf_counter() + time_limit_ms / 1000.0
+            conn.set_progress_handler(lambda: 1 if time.perf_counter() > deadline else 0, 1000)
+            # The sandbox's own BEGIN and ROLLBACK run without the authorizer;
+            # the caller's SQL runs with it
+            conn.execute("BEGIN")
+            conn.set_authorizer(self._authorize)
+            try:
+                try:
+                    result["query_plan"] = [
+                        {"id": row[0], "parent": row[1], "detail": row[3]}
+                        for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+                    ]
+                except sqlite3.Error:
+                    result["query_plan"] = []
+
+                start = time.perf_counter()
+                try:
+                    cursor = conn.execute(sql)
+                    rows = cursor.fetchmany(row_limit + 1) if cursor.description else []
+                    result["runtime_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                    result["executed"] = True
+                    if cursor.description:
+                        result["columns"] = [d[0] for d in cursor.description]
+                    result["truncated"] = len(rows) > row_limit
+                    result["rows"] = [[_json_value(v) for v in r] for r in rows[:row_limit]]
+                    result["row_count"] = len(result["rows"]) if cursor.description else max(cursor.rowcount, 0)
+                except sqlite3.OperationalError as e:
+                    if str(e) == "interrupted":
+                        result["error"] = f"Time limit of {time_limit_ms} ms exceeded"
+                        result["runtime_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                    else:
+                        result["error"] = str(e)
+                except (sqlite3.Error, ValueError) as e:
+                    result["error"] = str(e)
+            finally:
+                conn.set_authorizer(None)
+                conn.set_progress_handler(None, 0)
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+        return result
+
+
+def dry_run_options(value) -> Optional[Dict]:
+    """
+    Normalize a request's `dry_run` field: `true` for defaults, or an object
+    with `sample_rows`, `row_limit` and `time_limit_ms`. Returns None when
+    no dry run was requested.
+    """
+    if not value:
+        return None
+    options = value if isinstance(value, dict) else {}
+
+    def bounded(key, default, low, high):
+        try:
+            return max(low, min(int(options.get(key, default)), high))
+        except (TypeError, ValueError):
+            return default
+
+    return {
+        "sample_rows": bounded("sample_rows", 0, 0, 10000),
+        "row_limit": bounded("row_limit", 100, 1, 10000),
+        "time_limit_ms": bounded("time_limit_ms", 1000, 1, 30000),
+    }
@@ -0,0 +1,226 @@
+"""
+Static validation of generated SQL against the schema it was generated for.
+
+Checks that every table, alias and column the SQL references resolves
+against the parsed schema, so bad identifiers are caught before the query
+is returned rather than when it fails in production.
+"""
+import re
+from typing import Dict, List, Optional, Set
+
+from schema_parser import parse_schema
+from sql_analysis import output_columns, parse_sql
+
+
+_SQL_START = re.compile(r"^\s*(select|with|insert|update|delete|create|alter|drop)\b", re.IGNORECASE)
+_ALIAS_CLAUSES = ("order_by", "group_by", "having", "qualify")
+
+
+def basic_sql_errors(sql: str, schema: Optional[str] = None) -> List[str]:
+    """Cheap structural checks on generated SQL; returns a list of problems."""
+    if not sql or not sql.strip():
+        return ["Empty SQL"]
+    errors = []
+    if not _SQL_START.match(sql):
+        errors.append("Output does not start with a SQL statement")
+    stripped = re.sub(r"'(?:[^']|'')*'", "''", sql)
+    if stripped.count("(") != stripped.count(")"):
+        errors.append("Unbalanced parentheses")
+    if stripped.count("'") % 2:
+        errors.append("Unterminated string literal")
+    return errors
+
+
+def schema_catalog(schema: Optional[str]) -> Dict[str, Set[str]]:
+    """Lower-cased table name -> set of lower-cased column names."""
+    catalog: Dict[str, Set[str]] = {}
+    for name, table in parse_schema(schema or "").items():
+        columns = catalog.setdefault(name.lower(), set())
+        columns.update(c["name"].lower() for c in table["columns"])
+    return catalog
+
+
+class _ScopeChecker:
+    """Resolves the identifiers of a parsed query, scope by scope."""
+
+    def __init__(self, catalog: Dict[str, Set[str]]):
+        self.catalog = catalog
+        self.errors: List[str] = []
+        self.unknown_tables: List[str] = []
+        self.unknown_columns: List[str] = []
+        self.tables: List[str] = []
+
+    def _error(self, message: str):
+        if message not in self.errors:
+            self.errors.append(message)
+
+    def check(self, query: Dict, outer_scopes: List[Dict], ctes: Dict):
+        ctes = dict(ctes)
+        for cte in query.get("ctes", []):
+            columns = cte["columns"] or output_columns(cte["query"])
+            columns = {c.lower() for c in columns} if columns is not None else None
+            if cte.get("recursive"):
+                # the recursive term reads the CTE itself
+                ctes[cte["name"].lower()] = columns
+            self.check(cte["query"], outer_scopes, ctes)
+            ctes[cte["name"].lower()] = columns
+
+        # scope: visible name -> (source id, column set or None when unknown)
+        scope: Dict[str, tuple] = {}
+        checked = set()
+        using_columns = {c.lower() for join in query.get("joins", []) for c in join["using"]}
+        sources = query.get("sources", []) + [j["source"] for j in query.get("joins", [])]
+
+        for source_id, source in enumerate(sources):
+            alias = source.get("alias")
+            if source.get("subquery"):
+                checked.add(id(source["subquery"]))
+                # LATERAL subqueries see the FROM items before them
+                visible = [scope] + outer_scopes if source.get("lateral") else outer_scopes
+                self.check(source["subquery"], visible, ctes)
+                columns = source.get("column_aliases") or output_columns(source["subquery"])
+                if alias:
+                    scope[alias.lower()] = (source_id, {c.lower() for c in columns} if columns is not None else None)
+                continue
+            if source.get("function") or not source.get("name"):
+                if alias:
+                    scope[alias.lower()] = (source_id, None)
+                continue
+
+            name = source["name"].lower()
+            if name in ctes:
+                columns = ctes[name]
+            elif name in self.catalog:
+                columns = self.catalog[name]
+                if source["name"] not in self.tables:
+                    self.tables.append(source["name"])
+            else:
+                self._error(f"Table '{source['name']}' does not exist in the schema")
+                self.unknown_tables.append(source["name"])
+                columns = None
+            scope[name] = (source_id, columns)
+            if alias:
+                scope[alias.lower()] = (source_id, columns)
+
+        select_aliases = {item["alias"].lower() for item in query.get("select", []) if item["alias"]}
+        chain = [scope] + outer_scopes
+        for ref in query.get("column_refs", []):
+            self._check_ref(ref, chain, select_aliases, using_columns)
+
+        for subquery in query.get("subqueries", []):
+            if id(subquery) not in checked:
+                self.check(subquery, chain, ctes)
+        for operation in query.get("set_operations", []):
+            self.check(operation["query"], outer_scopes, ctes)
+
+    def _check_ref(self, ref: Dict, chain: List[Dict], select_aliases: Set[str], using_columns: Set[str]):
+        column = ref["column"].lower()
+        if column == "*":
+            if ref["table"] and not any(ref["table"].lower() in scope for scope in chain):
+                self._error(f"Unknown table or alias '{ref['table']}'")
+            return
+
+        if ref["table"]:
+            qualifier = ref["table"].lower()
+            for scope in chain:
+                if qualifier in scope:
+                    columns = scope[qualifier][1]
+                    if columns is not None and column not in columns:
+                        self._error(f"Column '{ref['table']}.{ref['column']}' does not exist")
+                        self.unknown_columns.append(f"{ref['table']}.{ref['column']}")
+                    return
+            self._error(f"Unknown table or alias '{ref['table']}' (in '{ref['table']}.{ref['column']}')")
+            return
+
+        if ref["clause"] in _ALIAS_CLAUSES and column in select_aliases:
+            return
+        for level, scope in enumerate(chain):
+            if any(columns is None for _, columns in scope.values()):
+                return
+            owners = {source_id for source_id, columns in scope.values() if column in columns}
+            if len(owners) > 1 and not (level == 0 and column in using_columns):
+                self._error(f"Column '{ref['column']}' is ambiguous; qualify it with a table alias")
+                return
+            if owners:
+                return
+        self._error(f"Column '{ref['column']}' does not exist in any referenced table")
+        self.unknown_columns.append(ref["column"])
+
+
+def validate_sql(sql: str, schema: Optional[str]) -> Dict:
+    """
+    Validate SQL against a schema. Returns whether it is valid, the list of
+    errors, and the unknown tables/columns and schema tables it references.
+    Identifier checks are skipped when the schema has no parseable tables.
+    """
+    errors = basic_sql_errors(sql)
+    result = {
+        "valid": not errors,
+        "errors": errors,
+        "identifiers_checked": False,
+        "tables": [],
+        "unknown_tables": [],
+        "unknown_columns": [],
+    }
+    catalog = schema_catalog(schema)
+    if errors or not catalog:
+        return result
+
+    checker = _ScopeChecker(catalog)
+    checker.check(parse_sql(sql, bracket_identifiers=False), [], {})
+    result.update({
+        "valid": not checker.errors,
+        "errors": checker.errors,
+        "identifiers_checked": True,
+        "tables": checker.tables,
+        "unknown_tables": checker.unknown_tables,
+        "unknown_columns": checker.unknown_columns,
+    })
+    return result
+
+
+def validation_errors(sql: str, schema: Optional[str] = None) -> List[str]:
+    """Validator hook for TextToSQLConverter: the list of problems, empty if valid."""
+    return validate_sql(sql, schema)["errors"]
+
+
+_REGRESSION_SCHEMA = """
+CREATE TABLE customers (customer_id INT PRIMARY KEY, name VARCHAR(100), email VARCHAR(100));
+CREATE TABLE orders (order_id INT PRIMARY KEY, customer_id INT, order_date DATE, total DECIMAL(10,2));
+"""
+
+# (SQL, expected error fragment or None when it must validate)
+_REGRESSIONS = [
+    ("SELECT order_date::date FROM orders", None),
+    ("SELECT ROUND(AVG(total)::numeric, 2) FROM orders", None),
+    ("SELECT total::int, total::float, order_date::timestamp, order_id::text FROM orders", None),
+    ("SELECT total::numeric(10,2), name::varchar[] FROM orders JOIN customers USING (customer_id)", None),
+    ("SELECT order_date::timestamp with time zone FROM orders", None),
+    ("SELECT CAST(order_date AS date) FROM orders", None),
+    ("SELECT order_date::date, missing FROM orders", "Column 'missing' does not exist"),
+    ("WITH RECURSIVE r(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM r WHERE n < 10) SELECT n FROM r", None),
+    ("WITH RECURSIVE r AS (SELECT 1 AS n UNION ALL SELECT n + 1 FROM r WHERE n < 10) SELECT n FROM r", None),
+    ("SELECT c.name, o.total FROM customers c CROSS JOIN LATERAL "
+     "(SELECT total FROM orders o WHERE o.customer_id = c.customer_id ORDER BY total DESC LIMIT 1) o", None),
+    ("SELECT c.name FROM customers c, LATERAL (SELECT total FROM orders WHERE customer_id = x.id) o",
+     "Unknown table or alias 'x'"),
+    ("SELECT * FROM orders WHERE order_id = ANY(ARRAY[1,2])", None),
+    ("SELECT n FROM unnest(ARRAY[1,2]) AS n", None),
+]
+
+
+def main():
+    """Check the validator against known queries; exits non-zero on a mismatch."""
+    failures = 0
+    for sql, expected in _REGRESSIONS:
+        errors = validation_errors(sql, _REGRESSION_SCHEMA)
+        ok = any(expected in e for e in errors) if expected else not errors
+        if not ok:
+            failures += 1
+            print(f"FAIL: {sql}\n  got {errors}\n  expected {expected or 'no errors'}")
+    print(f"{len(_REGRESSIONS) - failures}/{len(_REGRESSIONS)} validations as expected")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
 import os
-from typing import Optional, Dict
-from google import genai
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from circuit_breaker import CircuitBreaker, CircuitOpenError, call_model
+from genai_client import shared_client
+from metrics import record_tokens, stage
+from model_router import ModelRouter
+from sql_dialects import CANONICAL_DIALECT, DIALECT_NAMES
+from sql_validator import validation_errors
 
 
 class TextToSQLConverter:
@@ -8,9 +14,23 @@ class TextToSQLConverter:
     Text → SQL converter using the NEW Google GenAI SDK
     """
 
-    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash"):
-        self.client = genai.Client(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "gemini-2.5-flash",
+        breaker: Optional[CircuitBreaker] = None,
+        router: Optional[ModelRouter] = None,
+        validator: Optional[Callable[[str, Optional[str]], List[str]]] = validation_errors,
+        client=None,
+    ):
+        self.client = client or shared_client(api_key)
         self.model_name = model_name
+        self.breaker = breaker
+        self.router = router
+        self.validator = validator
+
+    # Generated once in this dialect; other dialects are transpiled locally
+    dialect_instruction = f"Use {DIALECT_NAMES[CANONICAL_DIALECT]} syntax."
 
     @staticmethod
     def _clean_sql(text: str) -> str:
@@ -29,7 +49,8 @@ class TextToSQLConverter:
     ) -> str:
         prompt = (
             "You are an expert SQL query generator.\n"
-            "Generate a syntactically correct SQL query.\n\n"
+            "Generate a syntactically correct SQL query.\n"
+            f"{self.dialect_instruction}\n\n"
         )
 
         if schema:
@@ -53,24 +74,227 @@ class TextToSQLConverter:
 
         return prompt
 
-    def convert_to_sql(
+    def _parse_with_explanation(self, text: str) -> Tuple[str, str]:
+        """Split a `SQL Query: ... / Explanation: ...` response."""
+        sql_query = ""
+        explanation = ""
+
+        for line in text.splitlines():
+            if line.startswith("SQL Query:"):
+                sql_query = line.replace("SQL Query:", "").strip()
+            elif line.startswith("Explanation:"):
+                explanation = line.replace("Explanation:", "").strip()
+
+        return self._clean_sql(sql_query), explanation
+
+    @staticmethod
+    def _token_usage(response) -> Tuple[int, int]:
+        """Input and output token counts from the response usage metadata."""
+        usage = getattr(response, "usage_metadata", None)
+        return (
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+        )
+
+    def _build_repair_prompt(
+        self,
+        nl_query: str,
+        schema: Optional[str],
+        sql_query: str,
+        errors: List[str],
+        with_explanation: bool = False,
+    ) -> str:
+        prompt = (
+            "You are an expert SQL query generator.\n"
+            "The SQL query below was generated for the question, but it does not "
+            "match the database schema.\n\n"
+        )
+
+        if schema:
+            prompt += f"Database Schema:\n{schema}\n\n"
+
+        prompt += f"Natural Language Query:\n{nl_query}\n\n"
+        prompt += f"Generated SQL:\n{sql_query}\n\n"
+        prompt += "Problems found:\n" + "\n".join(f"- {e}" for e in errors) + "\n\n"
+        prompt += "Fix the query using only tables and columns that exist in the schema.\n"
+        prompt += f"{self.dialect_instruction}\n"
+
+        if with_explanation:
+            prompt += (
+                "Return the response in EXACTLY this format:\n"
+                "SQL Query: <query>\n"
+                "Explanation: <brief explanation>\n"
+            )
+        else:
+            prompt += (
+                "Rules:\n"
+                "- Return ONLY the corrected SQL query\n"
+                "- No explanation\n"
+                "- No markdown or code blocks\n"
+            )
+
+        return prompt
+
+    def convert(
         self,
         natural_language_query: str,
         database_schema: Optional[str] = None,
-    ) -> str:
-        """Convert natural language to SQL (SQL only)."""
-        try:
+        with_explanation: bool = False,
+        cascade: Optional[bool] = None,
+        repair: bool = True,
+    ) -> Dict:
+        """
+        Convert natural language to SQL, returning the SQL along with the
+        model that produced it and its validation results.
+
+        With a router configured, the request goes to the model tier its
+        complexity calls for. SQL that fails validation gets one targeted
+        repair call with the errors on each tier; if it still fails and
+        cascading is on, the request is retried on the next tier up. A tier
+        whose model call raises is recorded and skipped, and when every
+        routed tier raises the default `model_name` is tried before giving up.
+        """
+        with stage("prompt_build"):
             prompt = self._build_prompt(
-                natural_language_query, database_schema
+                natural_language_query, database_schema, with_explanation
             )
 
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt,
+        if self.router:
+            decision = self.router.classify(
+                natural_language_query, database_schema, prompt
             )
+            plan = self.router.plan(decision["route"], cascade)
+        else:
+            decision = None
+            plan = [(None, self.model_name)]
+
+        totals = {"input_tokens": 0, "output_tokens": 0, "latency_ms": 0.0}
+        repaired = None
+
+        def generate(route, model, contents, escalated=False, is_repair=False):
+            start = time.perf_counter()
+            with stage("generation"):
+                response = call_model(
+                    self.breaker,
+                    self.client.models.generate_content,
+                    model=model,
+                    contents=contents,
+                )
+            latency = time.perf_counter() - start
+
+            if with_explanation:
+                sql, explanation = self._parse_with_explanation(response.text or "")
+            else:
+                sql, explanation = self._clean_sql(response.text or ""), None
+            with stage("validation"):
+                errors = self.validator(sql, database_schema) if self.validator else []
+            input_tokens, output_tokens = self._token_usage(response)
+            record_tokens(model, input_tokens, output_tokens)
+            totals["input_tokens"] += input_tokens
+            totals["output_tokens"] += output_tokens
+            totals["latency_ms"] += latency * 1000
+
+            if self.router:
+                self.router.record(
+                    route, model, latency, input_tokens, output_tokens,
+                    escalated=escalated, failed=bool(errors), repair=is_repair,
+                )
+            return sql, explanation, errors
+
+        def failed_call(route, model, error, escalated=False, is_repair=False):
+            failures.append({"route": route, "model": model, "repair": is_repair, "error": str(error)})
+            if self.router:
+                self.router.record(
+                    route, model, 0.0, escalated=escalated, repair=is_repair, error=True
+                )
+
+        # The default model is a last resort for when every routed tier raised
+        candidates = list(plan)
+        if all(model != self.model_name for _, model in plan):
+            candidates.append(("default" if decision else None, self.model_name))
+
+        failures: List[Dict] = []
+        outcome = None
+        last_error = None
+        for attempt, (route, model) in enumerate(candidates):
+            if attempt >= len(plan) and outcome:
+                break
+            try:
+                sql_query, explanation, errors = generate(
+                    route, model, prompt, escalated=attempt > 0
+                )
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                last_error = e
+                failed_call(route, model, e, escalated=attempt > 0)
+                continue
+            if errors and repair:
+                original = {"original_sql": sql_query, "original_errors": errors}
+                with stage("prompt_build"):
+                    repair_prompt = self._build_repair_prompt(
+                        natural_language_query, database_schema, sql_query, errors, with_explanation
+                    )
+                try:
+                    sql_query, explanation, errors = generate(
+                        route, model, repair_prompt, is_repair=True
+                    )
+                    if repaired is None:
+                        repaired = original
+                except CircuitOpenError:
+                    raise
+                except Exception as e:
+                    failed_call(route, model, e, is_repair=True)
+            if outcome is None or not errors or outcome[2]:
+                outcome = (sql_query, explanation, errors, route, model, attempt)
+            if not errors:
+                break
+
+        if outcome is None:
+            raise last_error
+        sql_query, explanation, errors, route, model, attempt = outcome
+
+        result = {
+            "sql_query": sql_query,
+            "model": model,
+            "escalations": attempt,
+            "validation": {
+                "valid": not errors,
+                "errors": errors,
+                "repaired": repaired is not None,
+            },
+            "usage": {
+                "input_tokens": totals["input_tokens"],
+                "output_tokens": totals["output_tokens"],
+                "latency_ms": round(totals["latency_ms"], 1),
+            },
+        }
+        if repaired:
+            result["validation"].update(repaired)
+        if failures:
+            result["model_failures"] = failures
+        if with_explanation:
+            result["explanation"] = explanation
+        if decision:
+            result["routing"] = {
+                "route": decision["route"],
+                "final_route": route,
+                "score": decision["score"],
+                "signals": decision["signals"],
+            }
+        return result
 
-            return self._clean_sql(response.text)
+    def convert_to_sql(
+        self,
+        natural_language_query: str,
+        database_schema: Optional[str] = None,
+    ) -> str:
+        """Convert natural language to SQL (SQL only)."""
+        try:
+            return self.convert(natural_language_query, database_schema)["sql_query"]
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             return f"Error generating SQL: {e}"
 
@@ -81,29 +305,16 @@ class TextToSQLConverter:
     ) -> Dict[str, str]:
         """Convert natural language to SQL with explanation."""
         try:
-            prompt = self._build_prompt(
+            result = self.convert(
                 natural_language_query, database_schema, with_explanation=True
             )
-
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt,
-            )
-
-            sql_query = ""
-            explanation = ""
-
-            for line in response.text.splitlines():
-                if line.startswith("SQL Query:"):
-                    sql_query = line.replace("SQL Query:", "").strip()
-                elif line.startswith("Explanation:"):
-                    explanation = line.replace("Explanation:", "").strip()
-
             return {
-                "sql_query": self._clean_sql(sql_query),
-                "explanation": explanation,
+                "sql_query": result["sql_query"],
+                "explanation": result["explanation"],
             }
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             return {
                 "sql_query": "",
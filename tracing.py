@@ -0,0 +1,155 @@
+"""
+Per-request traces: nested, timed spans of the stages a request went through.
+
+`metrics.stage` opens a span whenever a trace is active on the thread, so
+every timed stage shows up in traces. Work handed to other threads joins
+the request's trace with `attach`. Finished traces are kept in a ring
+buffer and export as JSON, either as a span list or in the Chrome trace
+event format (chrome://tracing, Perfetto).
+"""
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+_current = threading.local()
+_thread_ids = itertools.count(1)
+
+
+def _thread_id() -> int:
+    if not hasattr(_current, "thread_id"):
+        _current.thread_id = next(_thread_ids)
+    return _current.thread_id
+
+
+class Trace:
+    """The spans of one request, in the order they finished."""
+
+    def __init__(self, name: str, attributes: Optional[Dict] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float, depth: int, attributes: Optional[Dict] = None):
+        span = {
+            "name": name,
+            "start_ms": round(1000 * (start - self._origin), 3),
+            "duration_ms": round(1000 * (end - start), 3),
+            "depth": depth,
+            "thread": _thread_id(),
+        }
+        if attributes:
+            span["attributes"] = attributes
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self, **attributes):
+        self.duration = time.perf_counter() - self._origin
+        self.attributes.update(attributes)
+
+    def summary(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(1000 * self.duration, 3) if self.duration is not None else None,
+            **self.attributes,
+        }
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: (s["start_ms"], s["depth"]))
+        return {**self.summary(), "spans": spans}
+
+    def to_chrome(self) -> Dict:
+        """The trace in the Chrome trace event format."""
+        events = [{
+            "name": self.name, "ph": "X", "pid": 1, "tid": 0, "ts": 0,
+            "dur": round(1000 * 1000 * (self.duration or 0), 1), "args": self.attributes,
+        }]
+        for span in self.to_dict()["spans"]:
+            events.append({
+                "name": span["name"], "ph": "X", "pid": 1, "tid": span["thread"],
+                "ts": round(1000 * span["start_ms"], 1), "dur": round(1000 * span["duration_ms"], 1),
+                "args": span.get("attributes", {}),
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"trace_id": self.trace_id}}
+
+
+class TraceBuffer:
+    """The most recent `max_traces` finished traces."""
+
+    def __init__(self, max_traces: int = 100):
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces.append(trace)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            return next((t for t in self._traces if t.trace_id == trace_id), None)
+
+    def recent(self, limit: int = 50, min_duration_ms: float = 0.0) -> List[Dict]:
+        """Summaries of the latest traces, newest first."""
+        with self._lock:
+            traces = list(self._traces)
+        found = [t.summary() for t in reversed(traces) if 1000 * (t.duration or 0) >= min_duration_ms]
+        return found[:limit]
+
+
+def begin(name: str, **attributes) -> Trace:
+    """Start a trace on this thread."""
+    trace = Trace(name, attributes)
+    _current.trace, _current.depth = trace, 0
+    return trace
+
+
+def end() -> Optional[Trace]:
+    """Finish and detach this thread's trace."""
+    trace = getattr(_current, "trace", None)
+    _current.trace = None
+    if trace is not None:
+        trace.finish()
+    return trace
+
+
+def current() -> Optional[Trace]:
+    return getattr(_current, "trace", None)
+
+
+@contextmanager
+def attach(trace: Optional[Trace], depth: int = 1):
+    """Record this thread's spans into `trace`, e.g. in a worker thread of the request."""
+    previous = getattr(_current, "trace", None), getattr(_current, "depth", 0)
+    _current.trace, _current.depth = trace, depth
+    try:
+        yield
+    finally:
+        _current.trace, _current.depth = previous
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time the enclosed block as a span of the active trace, if any."""
+    trace = getattr(_current, "trace", None)
+    if trace is None:
+        yield
+        return
+    depth = _current.depth
+    _current.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current.depth = depth
+        trace.add(name, start, time.perf_counter(), depth, attributes)
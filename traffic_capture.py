@@ -0,0 +1,88 @@
+"""
+Capture of the requests the service receives, for replaying as a load test.
+
+Each request is appended to a JSONL file with its endpoint, payload,
+status and duration; `traffic_replay.py` re-issues them with the original
+timing. API keys in request bodies are not recorded.
+"""
+import json
+import random
+import threading
+import time
+from typing import Optional
+
+from flask import g, request
+
+# Body fields never written to the capture file
+REDACTED_FIELDS = ("api_key",)
+
+
+class TrafficCapture:
+    """
+    Records requests to `path`, a `sample_rate` share of them. Streamed
+    responses are timed to their first byte.
+    """
+
+    def __init__(self, path: str, sample_rate: float = 1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.captured = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def init_app(self, app) -> "TrafficCapture":
+        app.before_request(self._before)
+        app.after_request(self._after)
+        return self
+
+    def _before(self):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            g.capture_started = (time.time(), time.perf_counter())
+
+    def _after(self, response):
+        started = g.pop("capture_started", None)
+        if started is None:
+            return response
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            body = {k: v for k, v in body.items() if k not in REDACTED_FIELDS}
+        headers = {k: request.headers[k] for k in ("X-Namespace",) if k in request.headers}
+        record = {
+            "ts": round(started[0], 6),
+            "method": request.method,
+            "endpoint": request.url_rule.rule if request.url_rule else None,
+            "path": request.path,
+            "args": request.args.to_dict(flat=False) or None,
+            "headers": headers or None,
+            "body": body,
+            "status": response.status_code,
+            "duration_ms": round(1000 * (time.perf_counter() - started[1]), 3),
+        }
+        self.write(record)
+        return response
+
+    def write(self, record: dict):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.captured += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path: str, endpoint: Optional[str] = None):
+    """Captured requests of `path`, oldest first, optionally of one endpoint."""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short while capturing
+            if endpoint is None or record.get("endpoint") == endpoint:
+                records.append(record)
+    records.sort(key=lambda r: r["ts"])
+    return records
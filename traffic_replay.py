@@ -0,0 +1,158 @@
+"""
+Replays captured traffic (see traffic_capture.py) against the service.
+
+    python traffic_replay.py capture.jsonl --url http://localhost:5000
+    python traffic_replay.py capture.jsonl --fake --speed 4 --json replay.json
+
+Requests are re-issued at their captured offsets divided by `--speed`
+(`--speed 0` sends them as fast as `--workers` allow), against a running
+service or, with `--fake`, app.py served locally on the fake Gemini
+backend of benchmark.py. Reports throughput, error rate and latency
+percentiles per endpoint next to the captured latencies, and how far
+behind schedule requests were sent.
+"""
+import argparse
+import json
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from benchmark import FakeGemini, percentile, serve_app
+from traffic_capture import read_capture
+
+
+def _issue(base_url: str, record: Dict, timeout: float):
+    url = base_url + urllib.parse.quote(record["path"])
+    if record.get("args"):
+        url += "?" + urllib.parse.urlencode(record["args"], doseq=True)
+    data = json.dumps(record["body"]).encode() if record.get("body") is not None else None
+    headers = {"Content-Type": "application/json", **(record.get("headers") or {})}
+    request = urllib.request.Request(url, data=data, method=record["method"], headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+
+def _summary(outcomes: List[Dict], elapsed: float) -> Dict:
+    latencies = [o["latency"] for o in outcomes]
+    lags = [o["lag"] for o in outcomes]
+    captured = [o["captured_ms"] for o in outcomes if o["captured_ms"] is not None]
+    errors = sum(1 for o in outcomes if not 200 <= o["status"] < 400)
+    return {
+        "requests": len(outcomes),
+        "throughput_rps": round(len(outcomes) / elapsed, 2) if elapsed else None,
+        "error_rate": round(errors / len(outcomes), 4),
+        "status_changed": sum(1 for o in outcomes if o["captured_status"] not in (None, o["status"])),
+        "p50_ms": round(1000 * percentile(latencies, 50), 2),
+        "p90_ms": round(1000 * percentile(latencies, 90), 2),
+        "p99_ms": round(1000 * percentile(latencies, 99), 2),
+        "max_ms": round(1000 * max(latencies), 2),
+        "captured_p50_ms": round(percentile(captured, 50), 2) if captured else None,
+        "captured_p99_ms": round(percentile(captured, 99), 2) if captured else None,
+        "lag_p99_ms": round(1000 * percentile(lags, 99), 2),
+    }
+
+
+def replay(records: List[Dict], base_url: str, speed: float = 1.0, workers: int = 32,
+           timeout: float = 60.0) -> Dict:
+    """
+    Re-issue `records` on their captured schedule scaled by `speed`.
+    Returns a summary overall and per endpoint.
+    """
+    if not records:
+        return {"overall": None, "endpoints": {}}
+    origin = records[0]["ts"]
+    outcomes: List[Dict] = []
+    lock = threading.Lock()
+
+    def send(record, due):
+        lag = max(0.0, time.perf_counter() - due)
+        start = time.perf_counter()
+        status = _issue(base_url, record, timeout)
+        outcome = {
+            "endpoint": f"{record['method']} {record.get('endpoint') or record['path']}",
+            "status": status,
+            "latency": time.perf_counter() - start,
+            "lag": lag,
+            "captured_ms": record.get("duration_ms"),
+            "captured_status": record.get("status"),
+        }
+        with lock:
+            outcomes.append(outcome)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for record in records:
+            due = start + ((record["ts"] - origin) / speed if speed else 0.0)
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(send, record, due)
+    elapsed = time.perf_counter() - start
+
+    by_endpoint: Dict[str, List[Dict]] = {}
+    for outcome in outcomes:
+        by_endpoint.setdefault(outcome["endpoint"], []).append(outcome)
+    return {
+        "overall": {**_summary(outcomes, elapsed), "elapsed_seconds": round(elapsed, 2)},
+        "endpoints": {name: _summary(found, elapsed) for name, found in sorted(by_endpoint.items())},
+    }
+
+
+def print_report(report: Dict):
+    print(f"{'endpoint':<32} {'reqs':>6} {'req/s':>8} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'captured p50':>12} {'lag p99':>8}")
+    rows = list(report["endpoints"].items()) + [("overall", report["overall"])]
+    for name, row in rows:
+        captured = row["captured_p50_ms"]
+        print(f"{name:<32} {row['requests']:>6} {row['throughput_rps']:>8} {row['error_rate']:>7.1%} "
+              f"{row['p50_ms']:>8} {row['p99_ms']:>8} {captured if captured is not None else '-':>12} "
+              f"{row['lag_p99_ms']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic against the service.")
+    parser.add_argument("capture", help="JSONL file written by CAPTURE_PATH")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running service")
+    target.add_argument("--fake", action="store_true", help="Serve app.py locally on the fake Gemini backend")
+    parser.add_argument("--speed", type=float, default=1.0, help="Rate multiplier; 0 = as fast as possible")
+    parser.add_argument("--workers", type=int, default=32, help="Requests in flight at most")
+    parser.add_argument("--endpoint", help="Only replay this endpoint rule, e.g. /convert")
+    parser.add_argument("--generate-latency-ms", type=float, default=0.0, help="Fake model latency")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Fake embedding latency")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    records = read_capture(args.capture, args.endpoint)
+    print(f"Replaying {len(records)} requests at {args.speed or 'max'}x")
+    if args.fake:
+        with tempfile.TemporaryDirectory() as directory:
+            backend = FakeGemini(args.generate_latency_ms / 1000, args.embed_latency_ms / 1000)
+            server, base_url = serve_app(backend, directory)
+            try:
+                report = replay(records, base_url, args.speed, args.workers)
+            finally:
+                server.shutdown()
+    else:
+        report = replay(records, args.url.rstrip("/"), args.speed, args.workers)
+
+    if report["overall"]:
+        print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Usage accounting and budgets per caller.
+
+Callers are identified by the API key they send (stored only as a short
+hash) and accounted per endpoint: requests, errors, model tokens, estimated
+cost and latency, plus daily totals that budgets are checked against. The
+ledger is saved to a JSON file every few seconds.
+
+Budgets (USAGE_BUDGETS) set daily limits in tokens and/or
+estimated USD for every caller ("default") or per caller ("keys", by API
+key or its `key:` hash). Past a soft limit a caller is throttled to
+`throttle_rpm` model requests per minute; past a hard limit model requests
+are rejected until the day (UTC) ends. A batch is checked again before
+each of its questions, with the tokens of the questions already answered
+charged, so one batch overshoots a hard limit by at most the questions
+in flight.
+
+The API key is not authenticated: it only tells callers apart. Anyone
+can send a new key and start from an empty budget, so budgets limit
+honest clients' spend and are not access control; put the service behind
+an authenticating proxy that sets `X-API-Key` where that matters. So
+that new keys cannot grow the ledger without limit, at most `max_callers`
+callers are tracked: past that, unknown callers share one `overflow`
+record and budget. Callers with no activity in HISTORY_DAYS are dropped.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from model_router import MODEL_PRICING
+
+ANONYMOUS = "anonymous"
+# Shared record of the callers beyond max_callers
+OVERFLOW = "overflow"
+# Days of daily totals kept per caller
+HISTORY_DAYS = 31
+BUDGET_FIELDS = ("soft_tokens", "hard_tokens", "soft_cost_usd", "hard_cost_usd", "throttle_rpm")
+
+
+def caller_id(api_key: Optional[str]) -> str:
+    """The ledger's name for a caller: a hash of its API key, never the key itself."""
+    if not api_key:
+        return ANONYMOUS
+    return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def token_cost(tokens: Dict[str, list]) -> float:
+    """Estimated USD of {model: [input, output]} token counts."""
+    cost = 0.0
+    for model, (input_tokens, output_tokens) in tokens.items():
+        input_price, output_price = MODEL_PRICING.get(model, (0.0, 0.0))
+        cost += (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+    return cost
+
+
+def _today() -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime())
+
+
+def _seconds_to_midnight() -> float:
+    now = time.time()
+    return 86400 - now % 86400
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, message: str, retry_after: float, state: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.state = state
+
+
+class UsageLedger:
+    def __init__(self, storage_path: str = "usage.json", budgets: Optional[Dict] = None,
+                 flush_seconds: float = 5.0, max_callers: int = 1000):
+        self.storage_path = storage_path
+        self.flush_seconds = flush_seconds
+        self.max_callers = max_callers
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._callers: Dict[str, Dict] = {}
+        # caller -> start times of recent throttled-window requests
+        self._recent: Dict[str, list] = {}
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.set_budgets(budgets or {})
+        self.load()
+
+    def set_budgets(self, budgets: Dict):
+        """Budgets as {"default": {...}, "keys": {api key or caller id: {...}}}."""
+        self.default_budget = {k: v for k, v in (budgets.get("default") or {}).items() if k in BUDGET_FIELDS}
+        self.key_budgets = {
+            (key if key.startswith("key:") or key == ANONYMOUS else caller_id(key)):
+                {k: v for k, v in limits.items() if k in BUDGET_FIELDS}
+            for key, limits in (budgets.get("keys") or {}).items()
+        }
+
+    @classmethod
+    def from_env(cls) -> "UsageLedger":
+        """USAGE_PATH for the ledger file; USAGE_BUDGETS as inline JSON or a path to a JSON file."""
+        budgets = {}
+        spec = os.getenv("USAGE_BUDGETS", "").strip()
+        if spec.startswith("{"):
+            budgets = json.loads(spec)
+        elif spec:
+            with open(spec, "r", encoding="utf-8") as f:
+                budgets = json.load(f)
+        return cls(os.getenv("USAGE_PATH", "usage.json"), budgets,
+                   max_callers=int(os.getenv("USAGE_MAX_CALLERS", "1000")))
+
+    def budget_for(self, caller: str) -> Dict:
+        return {**self.default_budget, **self.key_budgets.get(caller, {})}
+
+    def load(self):
+        if not os.path.exists(self.storage_path):
+            return
+        try:
+            with open(self.storage_path, "r", encoding="utf-8") as f:
+                self._callers = json.load(f).get("callers", {})
+        except (ValueError, OSError) as e:
+            print(f"Could not read usage ledger {self.storage_path}: {e}")
+        with self._lock:
+            self._prune()
+
+    def save(self):
+        """Write the ledger atomically; saves run one at a time, so an older state never replaces a newer one."""
+        with self._save_lock:
+            with self._lock:
+                self._prune()
+                data = json.dumps({"callers": self._callers, "saved_at": time.time()})
+                self._dirty = False
+                self._saved_at = time.monotonic()
+            directory = os.path.dirname(os.path.abspath(self.storage_path))
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.storage_path) + ".", suffix=".tmp",
+                                            dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.storage_path)
+            except BaseException:
+                # Still unsaved: the next record retries
+                self._dirty = True
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def _caller(self, caller: str) -> Dict:
+        return self._callers.setdefault(caller, {"endpoints": {}, "days": {}})
+
+    def _resolve(self, caller: str) -> str:
+        """The record `caller` is accounted under: its own, or OVERFLOW once max_callers are tracked."""
+        if caller in self._callers or caller == ANONYMOUS or caller in self.key_budgets:
+            return caller
+        def full():
+            return len(self._callers) - (OVERFLOW in self._callers) >= self.max_callers
+        if full():
+            self._prune()
+        return OVERFLOW if full() else caller
+
+    def _prune(self):
+        """Drop callers with no activity in the last HISTORY_DAYS days."""
+        cutoff = time.strftime("%Y-%m-%d", time.gmtime(time.time() - HISTORY_DAYS * 86400))
+        idle = [name for name, record in self._callers.items()
+                if not record.get("days") or max(record["days"]) < cutoff]
+        for name in idle:
+            del self._callers[name]
+            self._recent.pop(name, None)
+        if idle:
+            self._dirty = True
+
+    def _day(self, record: Dict) -> Dict:
+        today = _today()
+        days = record["days"]
+        if today not in days:
+            days[today] = {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+            for old in sorted(days)[:-HISTORY_DAYS]:
+                del days[old]
+        return days[today]
+
+    def check(self, caller: str, endpoint: str) -> Dict:
+        """
+        Admit a model request from `caller`, or raise BudgetExceeded. Returns
+        the caller's budget state: "ok", or "soft" while throttled.
+        """
+        with self._lock:
+            caller = self._resolve(caller)
+            budget = self.budget_for(caller)
+            if not budget:
+                return {"state": "ok"}
+            record = self._caller(caller)
+            day = self._day(record)
+            self._check_hard(record, endpoint, budget, day)
+            if not self._over(budget, day, "soft"):
+                return {"state": "ok"}
+            # Past the soft limit: at most throttle_rpm requests per minute
+            now = time.monotonic()
+            recent = [t for t in self._recent.get(caller, []) if now - t < 60]
+            if len(recent) >= budget.get("throttle_rpm", 10):
+                self._recent[caller] = recent
+                self._count(record, endpoint, "throttled")
+                raise BudgetExceeded("Usage budget nearly exhausted; request rate limited",
+                                     60 - (now - recent[0]), "soft")
+            recent.append(now)
+            self._recent[caller] = recent
+            return {"state": "soft"}
+
+    def check_spend(self, caller: str, endpoint: str):
+        """Raise BudgetExceeded if `caller` is past a hard budget, e.g. before each question of a batch."""
+        with self._lock:
+            caller = self._resolve(caller)
+            budget = self.budget_for(caller)
+            if not budget:
+                return
+            record = self._caller(caller)
+            self._check_hard(record, endpoint, budget, self._day(record))
+
+    @staticmethod
+    def _over(budget: Dict, day: Dict, kind: str) -> bool:
+        tokens = day["input_tokens"] + day["output_tokens"]
+        return (
+            (budget.get(f"{kind}_tokens") is not None and tokens >= budget[f"{kind}_tokens"])
+            or (budget.get(f"{kind}_cost_usd") is not None and day["cost_usd"] >= budget[f"{kind}_cost_usd"])
+        )
+
+    def _check_hard(self, record: Dict, endpoint: str, budget: Dict, day: Dict):
+        if self._over(budget, day, "hard"):
+            self._count(record, endpoint, "rejected")
+            raise BudgetExceeded("Daily usage budget exhausted", _seconds_to_midnight(), "hard")
+
+    def _endpoint(self, record: Dict, endpoint: str) -> Dict:
+        return record["endpoints"].setdefault(endpoint, {
+            "requests": 0, "errors": 0, "throttled": 0, "rejected": 0,
+            "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0,
+            "latency_ms_total": 0.0, "latency_ms_max": 0.0,
+        })
+
+    def _count(self, record: Dict, endpoint: str, field: str):
+        self._endpoint(record, endpoint)[field] += 1
+        self._dirty = True
+
+    def record(self, caller: str, endpoint: str, status: int, latency: float,
+               tokens: Optional[Dict[str, list]] = None):
+        """Account one finished request and the model tokens it used."""
+        with self._lock:
+            record = self._caller(self._resolve(caller))
+            stats = self._endpoint(record, endpoint)
+            stats["requests"] += 1
+            stats["errors"] += status >= 500
+            stats["latency_ms_total"] += 1000 * latency
+            stats["latency_ms_max"] = max(stats["latency_ms_max"], 1000 * latency)
+            self._day(record)["requests"] += 1
+            self._add_tokens(record, stats, tokens)
+        self._maybe_save()
+
+    def add_tokens(self, caller: str, endpoint: str, tokens: Dict[str, list]):
+        """Account tokens spent after the request was recorded, e.g. by a streamed response."""
+        with self._lock:
+            record = self._caller(self._resolve(caller))
+            self._add_tokens(record, self._endpoint(record, endpoint), tokens)
+        self._maybe_save()
+
+    def _add_tokens(self, record: Dict, stats: Dict, tokens: Optional[Dict[str, list]]):
+        if not tokens:
+            return
+        input_tokens = sum(t[0] for t in tokens.values())
+        output_tokens = sum(t[1] for t in tokens.values())
+        cost = token_cost(tokens)
+        day = self._day(record)
+        for target in (stats, day):
+            target["input_tokens"] += input_tokens
+            target["output_tokens"] += output_tokens
+            target["cost_usd"] = round(target["cost_usd"] + cost, 8)
+        self._dirty = True
+
+    def _maybe_save(self):
+        if self._dirty and time.monotonic() - self._saved_at >= self.flush_seconds:
+            try:
+                self.save()
+            except OSError as e:
+                print(f"Could not save usage ledger: {e}")
+
+    def report(self, caller: Optional[str] = None) -> Dict:
+        """Usage and budget state of one caller, or of all callers."""
+        with self._lock:
+            callers = [caller] if caller else sorted(self._callers)
+            report = {}
+            for name in callers:
+                tracked_as = self._resolve(name)
+                record = self._callers.get(tracked_as, {"endpoints": {}, "days": {}})
+                endpoints = {}
+                for endpoint, stats in record["endpoints"].items():
+                    endpoints[endpoint] = {
+                        **{k: v for k, v in stats.items() if k != "latency_ms_total"},
+                        "latency_ms_avg": round(stats["latency_ms_total"] / stats["requests"], 1)
+                        if stats["requests"] else 0.0,
+                        "latency_ms_max": round(stats["latency_ms_max"], 1),
+                    }
+                today = record["days"].get(_today(), {"requests": 0, "input_tokens": 0,
+                                                      "output_tokens": 0, "cost_usd": 0.0})
+                report[name] = {
+                    "endpoints": endpoints,
+                    "today": today,
+                    "days": record["days"],
+                    "budget": self.budget_for(tracked_as) or None,
+                }
+                if tracked_as != name:
+                    report[name]["tracked_as"] = tracked_as
+            return report
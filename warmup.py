@@ -0,0 +1,76 @@
+"""
+Background warm-up of a worker.
+
+Loading (and on first run seeding) the knowledge base and creating the
+model client used to happen while app.py was imported, so a new worker
+could not accept a request until they were done. They now run as steps on
+a daemon thread after startup; `/readyz` reports ready once the required
+steps have finished. A failed optional step is recorded but does not keep
+the worker out of rotation.
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class WarmUp:
+    """Named steps run in order on a daemon thread."""
+
+    def __init__(self):
+        self.steps: List[Dict] = []
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, name: str, fn: Callable[[], object], required: bool = True) -> "WarmUp":
+        self.steps.append({"name": name, "fn": fn, "required": required, "state": "pending",
+                           "duration_ms": None, "error": None})
+        return self
+
+    def start(self) -> "WarmUp":
+        self._thread = threading.Thread(target=self.run, name="warm-up", daemon=True)
+        self._thread.start()
+        return self
+
+    def run(self):
+        self.state, self.started_at = "running", time.time()
+        for step in self.steps:
+            step["state"] = "running"
+            start = time.perf_counter()
+            try:
+                step["fn"]()
+                step["state"] = "done"
+            except Exception as e:
+                step["state"], step["error"] = "failed", str(e)
+                print(f"Warm-up step {step['name']} failed: {e}")
+                if step["required"]:
+                    self.state, self.error = "failed", f"{step['name']}: {e}"
+                    break
+            finally:
+                step["duration_ms"] = round(1000 * (time.perf_counter() - start), 1)
+        else:
+            self.state = "ready"
+        self.finished_at = time.time()
+        self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until warm-up has finished; True if the worker is ready."""
+        self._done.wait(timeout)
+        return self.ready
+
+    def status(self) -> Dict:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "error": self.error,
+            "steps": [{k: v for k, v in step.items() if k != "fn"} for step in self.steps],
+            "duration_ms": round(1000 * (self.finished_at - self.started_at), 1)
+            if self.finished_at and self.started_at else None,
+        }